@@ -177,7 +177,10 @@ _instance_method_pickle_support()
 from topo.base.simulation import Simulation
 
 # Set the default value of Simulation.time_type to gmpy.mpq. If gmpy
-# is unavailable, use the slower fixedpoint.FixedPoint.
+# is unavailable, use the slower fixedpoint.FixedPoint. (Models whose
+# times are all multiples of some fixed tick can instead use the
+# integer-based topo.base.ticktime.TickTime; see
+# topo.misc.ticktime.use_tick_time().)
 
 def fixedpoint_time_type(x, precision=4):
     "A fixedpoint time type of given precision"
@@ -18,7 +18,7 @@ from featuremapper import features
 from featuremapper.command import * # pyflakes:ignore (API import)
 
 import topo
-from topo.base.cf import CFSheet, Projection
+from topo.base.cf import CFSheet, Projection, CFIter
 from topo.base.sheet import Sheet
 from topo.base.arrayutil import centroid
 from topo.misc.attrdict import AttrDict
@@ -184,20 +184,19 @@ class measure_cog(ParameterizedFunction):
 
         sheet = proj.dest
         rows, cols = sheet.activity.shape
-        xcog = np.zeros((rows, cols), np.float64)
-        ycog = np.zeros((rows, cols), np.float64)
-
-        for r in xrange(rows):
-            for c in xrange(cols):
-                cf = proj.cfs[r, c]
-                r1, r2, c1, c2 = cf.input_sheet_slice
-                row_centroid, col_centroid = centroid(cf.weights)
-                xcentroid, ycentroid = proj.src.matrix2sheet(
-                    r1 + row_centroid + 0.5,
-                    c1 + col_centroid + 0.5)
-
-                xcog[r][c] = xcentroid
-                ycog[r][c] = ycentroid
+
+        # Centroids of the weights, relative to the top left of each CF
+        row_centroids = np.zeros(rows*cols, np.float64)
+        col_centroids = np.zeros(rows*cols, np.float64)
+        for i, cf in enumerate(proj.flatcfs):
+            row_centroids[i], col_centroids[i] = centroid(cf.weights)
+
+        # (converted to sheet coordinates for all the CFs at once)
+        slices = CFIter(proj).slices
+        xcog, ycog = proj.src.matrix2sheet(slices[:,0] + row_centroids + 0.5,
+                                           slices[:,2] + col_centroids + 0.5)
+        xcog = np.asarray(xcog, np.float64).reshape(rows, cols)
+        ycog = np.asarray(ycog, np.float64).reshape(rows, cols)
 
         metadata = AttrDict(precedence=sheet.precedence,
                             row_precedence=sheet.row_precedence,
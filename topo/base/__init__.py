@@ -15,7 +15,7 @@ available in the Python path.
 # For backwards compatibility; these files used to be in base/
 from imagen import boundingregion,sheetcoords,patterngenerator # pyflakes:ignore (API import)
 
-__all__ = ['arrayutil','boundingregion','cf','functionfamily','patterngenerator','projection','sheet','sheetcoords','sheetview','simulation']
+__all__ = ['arrayutil','boundingregion','cf','functionfamily','partition','patterngenerator','profiling','projection','schedule','sheet','sheetcoords','sheetview','simulation','ticktime']
 
 
 
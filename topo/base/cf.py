@@ -17,9 +17,11 @@ the underlying ConnectionFields in any projection of type
 CFProjection.
 """
 
+import os
 from copy import copy
 
 import numpy as np
+from numpy.lib.stride_tricks import as_strided
 
 import param
 from holoviews import GridSpace, Dimension, HoloMap, Layout
@@ -190,7 +192,8 @@ class ConnectionField(object):
     def __init__(self,input_sheet,x=0.0,y=0.0,template=BoundingBox(radius=0.1),
                  weights_generator=patterngenerator.Constant(),
                  mask=patterngenerator.Constant(),
-                 output_fns=None,min_matrix_radius=1, label=None):
+                 output_fns=None,min_matrix_radius=1, label=None,
+                 weight_dtype=weight_type):
         """
         Create weights at the specified (x,y) location on the
         specified input_sheet.
@@ -217,6 +220,8 @@ class ConnectionField(object):
         1, surrounded by elements with the value 0.  If the CF extends
         over the edge of the input sheet then the weights will
         actually be half-moon (or similar) rather than circular.
+
+        The weights are stored as weight_dtype (float32 by default).
         """
         #print "Create CF",input_sheet.name,x,y,"template=",template,"wg=",weights_generator,"m=",mask,"ofs=",output_fns,"min r=",min_matrix_radius
 
@@ -254,10 +259,10 @@ class ConnectionField(object):
         # CBNOTE: this would be clearer (but not perfect, and probably slower)
         # m = mask_template[self.weights_slice()]
         self.mask = weights_slice.submatrix(mask)  # view of original mask
-        self.mask = np.array(self.mask,copy=1) # CEBALERT: why is this necessary?
-
-        # (without it, optimized learning function creates artifacts in CFs at
-        # left and right edges of sheet, at some densities)
+        # (shared with the other CFs, so must not be modified; note
+        # that the view is not contiguous for CFs cropped at the left
+        # or right edges of the sheet)
+        self.mask.flags.writeable = False
 
         # CBENHANCEMENT: might want to do something about a size
         # that's specified (right now the size is assumed to be that
@@ -288,7 +293,7 @@ class ConnectionField(object):
         # the PG subclasses that override array creation in various
         # ways (producing or using inconsistent types) turned out to
         # be too painful.)
-        self.weights = w.astype(weight_type)
+        self.weights = w.astype(weight_dtype)
 
         # CEBHACKALERT: the system of masking through multiplication
         # by 0 works for now, while the output_fns are all
@@ -338,6 +343,390 @@ class ConnectionField(object):
 
 
 
+class PackedWeights(object):
+    """
+    Contiguous storage for the weights of a list of ConnectionFields.
+
+    The weights of all the CFs are stored one after the other (each
+    in C order) in the single flat array weights, with int32 tables
+    giving the position of each CF's values (offsets, of length n+1,
+    so that CF i occupies offsets[i]:offsets[i+1]), the shape of its
+    weights matrix (shapes, n x 2) and its input_sheet_slice (slices,
+    n x 4).  The norm_total cache of each CF is held in norm_total and
+    has_norm_total.  The weights array has the same type as the CFs'
+    weights (which must all be the same).
+
+    The CFs' masks are usually views of a mask template shared by
+    many CFs, so the flat, read-only weight_type array masks holds
+    each distinct template (or, for a mask that is not such a view, a
+    copy of the mask) only once.  The mask of CF i starts at
+    mask_offsets[i] in masks, and its rows are mask_rowstrides[i]
+    values apart (which is more than its width if it is cropped at
+    the left or right edge of the sheet).
+
+    Each CF's weights, mask, _norm_total and _has_norm_total are
+    replaced by views into this storage, so code that works on the
+    individual CFs continues to work unchanged, as long as it modifies
+    the weights in place (e.g. cf.weights *= x, not cf.weights =
+    cf.weights*x) -- a CF whose arrays have been replaced is no longer
+    part of the packed storage (see is_packed()).  Optimized functions
+    can instead process all the CFs in one pass over the flat arrays.
+
+    A None entry in the list (a null CF) occupies no space.
+
+    The slices table is collected from the CFs unless one is supplied
+    (e.g. CFProjection.input_sheet_slices), in which case it is used
+    as it is.
+
+    If a filename is given, the weights array is instead an np.memmap
+    of that file, opened with the given mode: 'w+' writes the CFs'
+    current weights to the file (replacing any existing file), while
+    'r+' and 'r' (read-only) use the weights already in the file,
+    which must have the right size, and the CFs' weights may then be
+    None (e.g. when unpickling).  Because the CFs are laid out one
+    after the other, functions that process the CFs in order read
+    and write the file sequentially.
+
+    Alternatively, the flat weights array itself may be given, if the
+    CFs' weights are already views of it in this layout (as when
+    CFProjection creates the weights directly in its weights_file).
+    """
+
+    __slots__ = ['weights','masks','mask_offsets','mask_rowstrides',
+                 'offsets','shapes','slices','norm_total','has_norm_total',
+                 '_views']
+
+    def __init__(self,flatcfs,filename=None,mode='w+',dtype=None,slices=None,
+                 weights=None):
+        n = len(flatcfs)
+        self.shapes = np.zeros((n,2),dtype=np.int32)
+        self.slices = _input_sheet_slice_table(flatcfs) if slices is None else slices
+        cf_dtype = None
+        for i,cf in enumerate(flatcfs):
+            if cf is not None:
+                if cf.weights is None:
+                    if filename is None or mode=='w+':
+                        raise ValueError("Cannot pack ConnectionField %d: it has no weights."%i)
+                elif cf.mask.shape != cf.weights.shape:
+                    raise ValueError("Cannot pack ConnectionField %d: mask shape %s differs from weights shape %s."%(i,cf.mask.shape,cf.weights.shape))
+                elif cf_dtype is None:
+                    cf_dtype = cf.weights.dtype
+                elif cf.weights.dtype != cf_dtype:
+                    raise ValueError("Cannot pack ConnectionField %d: weights type %s differs from %s."%(i,cf.weights.dtype,cf_dtype))
+                self.shapes[i] = cf.mask.shape
+        if dtype is None:
+            dtype = weight_type if cf_dtype is None else cf_dtype
+
+        sizes = self.shapes[:,0].astype(np.int64)*self.shapes[:,1]
+        offsets = np.zeros(n+1,dtype=np.int64)
+        np.cumsum(sizes,out=offsets[1:])
+        if offsets[-1] > np.iinfo(np.int32).max:
+            raise ValueError("Too many weights (%d) to pack with int32 offsets."%offsets[-1])
+        self.offsets = offsets.astype(np.int32)
+
+        if weights is not None:
+            if weights.shape != (offsets[-1],):
+                raise ValueError("Cannot pack the ConnectionFields into %s weights: %d are needed."
+                                 %(weights.shape,offsets[-1]))
+            self.weights = weights
+        elif filename is None:
+            self.weights = np.empty(offsets[-1],dtype=dtype)
+        else:
+            self.weights = _open_weights_file(filename,mode,dtype,offsets[-1])
+        copy_weights = weights is None and (filename is None or mode=='w+')
+        self._pack_masks(flatcfs)
+        self.norm_total = np.zeros(n,dtype=np.float64)
+        self.has_norm_total = np.zeros(n,dtype=np.int32)
+        # (weights,mask) views given to each CF, for is_packed()
+        self._views = [None]*n
+
+        for i,cf in enumerate(flatcfs):
+            if cf is None:
+                continue
+            start,end = self.offsets[i],self.offsets[i+1]
+            shape = tuple(self.shapes[i])
+            if copy_weights:
+                self.weights[start:end] = cf.weights.ravel()
+            self.norm_total[i] = cf._norm_total[0]
+            self.has_norm_total[i] = cf._has_norm_total[0]
+            cf.weights = self.weights[start:end].reshape(shape)
+            cf.mask = _strided_view(self.masks,self.mask_offsets[i],shape,
+                                    self.mask_rowstrides[i])
+            cf._norm_total = self.norm_total[i:i+1]
+            cf._has_norm_total = self.has_norm_total[i:i+1]
+            self._views[i] = (cf.weights,cf.mask)
+
+        if filename is not None and mode=='w+':
+            self.weights.flush()
+
+
+    def _pack_masks(self,flatcfs):
+        # Set masks, mask_offsets and mask_rowstrides, storing each
+        # array that the CFs' masks are views of once.
+        n = len(flatcfs)
+        mask_offsets = np.zeros(n,dtype=np.int64)
+        self.mask_rowstrides = np.zeros(n,dtype=np.int32)
+        blocks,block_starts = [],{}
+        size = 0
+        for i,cf in enumerate(flatcfs):
+            if cf is None:
+                continue
+            mask = cf.mask
+            base = _base_array(mask)
+            position = _strided_position(mask,base)
+            if position is None:
+                base = np.ascontiguousarray(mask,dtype=weight_type)
+                position = 0,mask.shape[1]
+            if id(base) not in block_starts:
+                block_starts[id(base)] = size
+                blocks.append(base)
+                size += base.size
+            mask_offsets[i] = block_starts[id(base)]+position[0]
+            self.mask_rowstrides[i] = position[1]
+        if size > np.iinfo(np.int32).max:
+            raise ValueError("Too many mask values (%d) to pack with int32 offsets."%size)
+        self.mask_offsets = mask_offsets.astype(np.int32)
+
+        self.masks = np.empty(size,dtype=weight_type)
+        for base in blocks:
+            start = block_starts[id(base)]
+            self.masks[start:start+base.size] = base.ravel()
+        self.masks.flags.writeable = False
+
+
+    def __len__(self):
+        return len(self.shapes)
+
+
+    def is_packed(self,flatcfs):
+        """
+        Return True if the weights and masks of all the given CFs
+        (which must be the list that was packed) are still views into
+        this storage.
+        """
+        # Usually each CF still has the views it was given when
+        # packed, which is quick to check
+        if all(cf is None or (cf.weights is views[0] and cf.mask is views[1])
+               for cf,views in zip(flatcfs,self._views)):
+            return True
+        for i,cf in enumerate(flatcfs):
+            if cf is None:
+                continue
+            if not (cf.weights is not None and
+                    _shares_data(cf.weights,self.weights,self.offsets[i]) and
+                    _strided_position(cf.mask,self.masks) ==
+                    (self.mask_offsets[i],self.mask_rowstrides[i])):
+                return False
+        return True
+
+
+    def nbytes(self):
+        """Total size of the arrays, in bytes."""
+        return sum(getattr(self,name).nbytes for name in self.__slots__
+                   if name!='_views')
+
+
+def _open_weights_file(filename,mode,dtype,size):
+    # Return an np.memmap of size values of type dtype in filename.
+    # A new file is written under a temporary name and then renamed,
+    # so that a file still mapped by existing weights (e.g. when
+    # repacking after change_bounds) is not truncated under them.
+    dtype = np.dtype(dtype)
+    if mode=='w+':
+        tmpname = filename+'.tmp'
+        weights = np.memmap(tmpname,dtype=dtype,mode='w+',shape=(size,))
+        os.rename(tmpname,filename)
+    else:
+        nbytes = os.path.getsize(filename)
+        if nbytes != size*dtype.itemsize:
+            raise ValueError("Weights file %s has %d bytes, but %d %s weights (%d bytes) are needed."
+                             %(filename,nbytes,size,dtype.name,size*dtype.itemsize))
+        weights = np.memmap(filename,dtype=dtype,mode=mode,shape=(size,))
+    return weights
+
+
+def _base_array(array):
+    # The array that array is a view of (array itself if it owns its
+    # data), following the bases of e.g. as_strided() views too
+    base = array.base
+    while base is not None:
+        if isinstance(base,np.ndarray):
+            array = base
+        base = getattr(base,'base',None)
+    return array
+
+
+def _strided_position(view,buffer_):
+    # (offset,rowstride) of the 2D weight_type view within the
+    # C-contiguous buffer_ (in values), if each of its rows is
+    # contiguous, and otherwise None
+    itemsize = buffer_.itemsize
+    if not (view.ndim==2 and view.dtype==weight_type and
+            buffer_.dtype==weight_type and buffer_.flags.c_contiguous and
+            (view.shape[1]<=1 or view.strides[1]==itemsize)):
+        return None
+    rows,cols = view.shape
+    rowstride = view.strides[0]//itemsize if rows>1 else cols
+    offset,remainder = divmod(view.__array_interface__['data'][0] -
+                              buffer_.__array_interface__['data'][0],itemsize)
+    if (remainder or rowstride<cols or view.strides[0]%itemsize or offset<0 or
+        offset+(rows-1)*rowstride+cols > buffer_.size):
+        return None
+    return offset,rowstride
+
+
+def _strided_view(buffer_,offset,shape,rowstride):
+    # 2D view of the given shape into the flat buffer_, starting at
+    # offset, with rows rowstride values apart
+    view = as_strided(buffer_[offset:],shape=shape,
+                      strides=(rowstride*buffer_.itemsize,buffer_.itemsize))
+    if not buffer_.flags.writeable:
+        view.flags.writeable = False
+    return view
+
+
+def _shares_data(view,buffer_,start):
+    # Whether view is the contiguous region of buffer_ that begins at start
+    return (view.flags.c_contiguous and
+            view.__array_interface__['data'][0] ==
+            buffer_.__array_interface__['data'][0]+start*buffer_.itemsize)
+
+
+class CFMatrix(object):
+    """
+    Copy of the weights of a list of ConnectionFields as a single
+    (number of CFs) x (size of the largest CF) matrix, for computing
+    the dot products of all the CFs with their inputs at once.
+
+    Row i of weights holds the weights of CF i (in C order), padded
+    with zeros up to the size of the largest CF, and the same row of
+    input_index holds the index in the flattened input sheet of the
+    input to each of those weights; the padding points to an extra
+    zero input at index input_size.  A None entry in the list (a null
+    CF) has a row of zeros.
+
+    Because the weights are copied, update() must be called whenever
+    the CFs' weights change.
+    """
+
+    __slots__ = ['weights','input_index','input_size']
+
+    # Rows processed together by dot(), limiting the size of the
+    # temporary arrays
+    block_rows = 256
+
+    def __init__(self,flatcfs,input_shape):
+        irows,icols = input_shape
+        self.input_size = irows*icols
+        cfs = [cf for cf in flatcfs if cf is not None]
+        width = max([cf.weights.size for cf in cfs] or [0])
+        dtype = cfs[0].weights.dtype if cfs else weight_type
+
+        self.weights = np.zeros((len(flatcfs),width),dtype=dtype)
+        self.input_index = np.empty((len(flatcfs),width),dtype=np.int32)
+        self.input_index.fill(self.input_size)
+        for i,cf in enumerate(flatcfs):
+            if cf is not None:
+                r1,r2,c1,c2 = cf.input_sheet_slice
+                index = (np.arange(r1,r2)[:,np.newaxis]*icols+np.arange(c1,c2)).ravel()
+                self.input_index[i,:index.size] = index
+        self.update(flatcfs)
+
+
+    def update(self,flatcfs,indices=None):
+        """
+        Copy the weights of the CFs at the given indices (or of all
+        the CFs, if indices is None) into the matrix.  flatcfs must
+        be the list from which the matrix was created.
+        """
+        if indices is None:
+            indices = xrange(len(flatcfs))
+        weights = self.weights
+        for i in indices:
+            cf = flatcfs[i]
+            if cf is not None:
+                weights[i,:cf.weights.size] = cf.weights.ravel()
+
+
+    def dot(self,input_activity,indices):
+        """
+        Return an array of the dot products of each of the CFs at the
+        given indices with its input in input_activity, accumulated in
+        float64.
+        """
+        X = np.append(input_activity.ravel(),0.0)
+        result = np.empty(len(indices),dtype=np.float64)
+        for start in xrange(0,len(indices),self.block_rows):
+            rows = indices[start:start+self.block_rows]
+            result[start:start+len(rows)] = np.einsum('ij,ij->i',self.weights[rows],
+                                                      X[self.input_index[rows]])
+        return result
+
+
+    def nbytes(self):
+        """Total size of the arrays, in bytes."""
+        return self.weights.nbytes+self.input_index.nbytes
+
+
+
+class CFOutstarIndex(object):
+    """
+    Transpose ("outstar") index of the PackedWeights of a list of
+    ConnectionFields: for each unit of the input sheet, the weights
+    that connect it to the CFs, for computing responses by scattering
+    the contributions of only the nonzero inputs.
+
+    The entries for the input at index j in the flattened input sheet
+    are starts[j]:starts[j+1]; for each entry, cf_index holds the
+    index of the CF and weight_index the position of the weight in
+    the packed weights array.  The entries of each input are in order
+    of CF, and each CF's entries appear (across the inputs) in the
+    same C order as its weights, so a CF's weighted inputs are summed
+    in the same order as when computing its dot product directly.
+
+    The index depends only on the layout of the packed weights, not
+    on their values, so it remains valid as the weights are learned,
+    but it must be rebuilt if the CFs are repacked.  It takes 8
+    bytes per weight (plus 4 per input unit).
+    """
+
+    __slots__ = ['starts','cf_index','weight_index']
+
+    def __init__(self,packed,input_shape):
+        irows,icols = input_shape
+        sizes = np.diff(packed.offsets).astype(np.int64)
+        n_weights = int(packed.offsets[-1])
+
+        # CF and position within the CF of each packed weight
+        cf = np.repeat(np.arange(len(packed),dtype=np.int32),sizes)
+        position = np.arange(n_weights,dtype=np.int64)-packed.offsets[cf]
+        cols = packed.shapes[cf,1]
+        slices = packed.slices[cf]
+        input_index = (slices[:,0]+position//cols)*icols + slices[:,2]+position%cols
+
+        # (a stable sort keeps the entries of each input in CF order)
+        order = np.argsort(input_index,kind='mergesort')
+        self.cf_index = cf[order]
+        self.weight_index = order.astype(np.int32)
+        self.starts = np.zeros(irows*icols+1,dtype=np.int32)
+        np.cumsum(np.bincount(input_index,minlength=irows*icols),out=self.starts[1:])
+
+
+    def fan_out(self,input_indices):
+        """
+        Return the total number of weights from the inputs at the given
+        indices (in the flattened input sheet), i.e. the work needed to
+        scatter their contributions.
+        """
+        return int((self.starts[input_indices+1]-self.starts[input_indices]).sum())
+
+
+    def nbytes(self):
+        """Total size of the arrays, in bytes."""
+        return sum(getattr(self,name).nbytes for name in self.__slots__)
+
+
+
 class CFPResponseFn(param.Parameterized):
     """
     Map an input activity matrix into an output matrix using the CFs
@@ -378,7 +767,9 @@ class CFPRF_Plugin(CFPResponseFn):
 
     def __call__(self, iterator, input_activity, activity, strength):
         single_cf_fn = self.single_cf_fn
-        for cf,i in iterator():
+        flatcfs = iterator.flatcfs
+        for i in iterator.indices():
+            cf = flatcfs[i]
             X = cf.input_sheet_slice.submatrix(input_activity)
             activity.flat[i] = single_cf_fn(X,cf.weights)
         activity *= strength
@@ -398,6 +789,11 @@ class CFPLearningFn(param.Parameterized):
     """
     __abstract = True
 
+    # True if the function never changes the weights of units whose
+    # output activity is zero (allowing e.g. a CFMatrix to be updated
+    # for the active units only)
+    learns_active_units_only = False
+
 
     def constant_sum_connection_rate(self,n_units,learning_rate):
         """
@@ -421,6 +817,8 @@ class CFPLF_Identity(CFPLearningFn):
     """CFLearningFunction performing no learning."""
     single_cf_fn = param.ClassSelector(LearningFn,default=IdentityLF(),constant=True)
 
+    learns_active_units_only = True
+
     def __call__(self, iterator, input_activity, output_activity, learning_rate, **params):
         pass
 
@@ -434,10 +832,13 @@ class CFPLF_Plugin(CFPLearningFn):
         single_connection_learning_rate = self.constant_sum_connection_rate(iterator.proj_n_units,learning_rate)
         # avoid evaluating these references each time in the loop
         single_cf_fn = self.single_cf_fn
+        flatcfs = iterator.flatcfs
 
-        for cf,i in iterator():
+        indices = iterator.indices()
+        for i,unit_activity in zip(indices,output_activity.flat[indices]):
+            cf = flatcfs[i]
             single_cf_fn(cf.get_input_matrix(input_activity),
-                         output_activity.flat[i], cf.weights,
+                         unit_activity, cf.weights,
                          single_connection_learning_rate)
             cf.weights *= cf.mask
 
@@ -467,8 +868,10 @@ class CFPOF_Plugin(CFPOutputFn):
     def __call__(self, iterator, **params):
         if type(self.single_cf_fn) is not IdentityTF:
             single_cf_fn = self.single_cf_fn
+            flatcfs = iterator.flatcfs
 
-            for cf,i in iterator():
+            for i in iterator.indices():
+                cf = flatcfs[i]
                 single_cf_fn(cf.weights)
                 del cf.norm_total
 
@@ -591,8 +994,66 @@ class CFProjection(Projection):
        initialization stream. If not None, equivalent to appending the
        chosen integer to the hash_format.""")
 
+    packed_weights = param.Boolean(default=True,constant=True,doc="""
+        Whether to store the weights (and masks) of all the CFs in a
+        single contiguous PackedWeights buffer, with each CF's weights
+        being a view into it.  Packed weights use memory more
+        efficiently and allow the optimized response, learning, and
+        output functions to process all CFs in one pass, but weights
+        must then be modified in place rather than replaced.""")
+
+    weight_dtype = param.ObjectSelector(default=weight_type,
+        objects=[np.float64,weight_type,np.float16],constant=True,doc="""
+        Type used to store the weights of the CFs: float16 halves the
+        memory needed by the default float32 weights, while float64
+        avoids any rounding of the weights.  All the CF functions,
+        optimized or not, support each of these types, doing their
+        arithmetic (e.g. accumulating responses and weight sums) in
+        float64 and rounding only the weights they store.""")
+
+    weights_file = param.String(default=None,allow_None=True,constant=True,doc="""
+        If not None, the name of a file in which to store the packed
+        weights (see packed_weights, which must be True), as an
+        np.memmap rather than in memory, for networks whose weights
+        do not fit into RAM (each projection needs its own file).
+        Unless cf_type or _create_cf() is customized, the initial
+        weights are generated straight into the file.
+        The file is then the only copy of the weights: saved
+        snapshots refer to it rather than containing the weights, so
+        it must be kept (and copied, to preserve the weights at the
+        time of the snapshot) along with them.""")
+
+    weights_file_mode = param.ObjectSelector(default='w+',objects=['w+','r+','r'],
+        constant=True,doc="""
+        How to open the weights_file: 'w+' creates it (replacing any
+        existing file) from the initial weights; 'r+' uses the
+        weights already in the file, e.g. from a previous simulation
+        of the same network, and 'r' does the same but read-only, for
+        sessions that only analyze a trained network (the projection
+        then does not learn).  Loading a snapshot always uses the
+        weights in the file, i.e. 'w+' is treated as 'r+'.""")
+
     precedence = param.Number(default=0.8)
 
+    # activate() only writes to activity and input_buffer
+    concurrent_activate = True
+
+    # PackedWeights holding the CFs' weights, if packed_weights is True
+    _packed = None
+
+    # CFMatrix copy of the CFs' weights, if one has been requested
+    _cf_matrix = None
+
+    # CFOutstarIndex of the packed weights, if one has been requested
+    _outstar_index = None
+
+    # Sizes of the CFs, once computed (see _cf_sizes())
+    _sizes = None
+
+    # int32 (number of CFs) x 4 table of the CFs' input_sheet_slices,
+    # whose rows the CFs' input_sheet_slice Slices are views of
+    input_sheet_slices = None
+
 
     def __init__(self,initialize_cfs=True,**params):
         """
@@ -612,6 +1073,9 @@ class CFProjection(Projection):
         """
         super(CFProjection,self).__init__(**params)
 
+        if self.weights_file is not None and not self.packed_weights:
+            raise ValueError("%s: weights_file requires packed_weights to be True."%self.name)
+
         self.weights_generator.set_dynamic_time_fn(None,sublistattr='generators')
         # get the actual bounds_template by adjusting a copy of the
         # nominal_bounds_template to ensure an odd slice, and to be
@@ -631,7 +1095,9 @@ class CFProjection(Projection):
         if initialize_cfs:
             self._create_cfs()
 
-        if self.apply_output_fns_init:
+        # (weights read from a weights_file are used unchanged)
+        if self.apply_output_fns_init and (self.weights_file is None or
+                                           self.weights_file_mode=='w+'):
             self.apply_learn_output_fns(active_units_mask=False)
 
         ### JCALERT! We might want to change the default value of the
@@ -667,9 +1133,201 @@ class CFProjection(Projection):
 
     # CB: should be _initialize_cfs() since we already have 'initialize_cfs' flag?
     def _create_cfs(self):
-        vectorized_create_cf = simple_vectorize(self._create_cf)
-        self.cfs = vectorized_create_cf(*self._generate_coords())
-        self.flatcfs = list(self.cfs.flat)
+        X,Y = self._generate_coords()
+        weights = None
+        if self._can_batch_create_cfs():
+            # (also sets input_sheet_slices, and creates the weights
+            # directly in any weights_file)
+            self.cfs,weights = self._batch_create_cfs(X,Y)
+            self.flatcfs = list(self.cfs.flat)
+        else:
+            vectorized_create_cf = simple_vectorize(self._create_cf)
+            self.cfs = vectorized_create_cf(X,Y)
+            self.flatcfs = list(self.cfs.flat)
+            self._index_input_sheet_slices()
+        self._cf_matrix = None
+        self._clear_cf_sizes()
+        if self.packed_weights:
+            self._pack_weights(weights=weights)
+
+
+    def _index_input_sheet_slices(self):
+        """
+        Collect the CFs' input_sheet_slices into a new
+        input_sheet_slices table, replacing each CF's Slice with a view
+        of its row.
+
+        Must be called whenever the CFs' Slices have been replaced
+        (e.g. by change_bounds()), as the optimized functions read the
+        table rather than the CFs.
+        """
+        self.input_sheet_slices = _input_sheet_slice_table(self.flatcfs)
+        for cf,row in zip(self.flatcfs,self.input_sheet_slices):
+            if cf is not None:
+                cf.input_sheet_slice = row.view(Slice)
+
+
+    def _pack_weights(self,weights_file_mode=None,weights=None):
+        """
+        (Re)build the PackedWeights storage from the current CFs,
+        e.g. after their weights matrices have been replaced.
+
+        If there is a weights_file, it is opened with the given mode
+        (by default weights_file_mode), unless the weights array
+        already opened from it (of which the CFs' weights are views)
+        is given.
+        """
+        if weights is not None:
+            self._packed = PackedWeights(self.flatcfs,slices=self.input_sheet_slices,
+                                         weights=weights)
+        elif self.weights_file is None:
+            self._packed = PackedWeights(self.flatcfs,slices=self.input_sheet_slices)
+        else:
+            self._packed = PackedWeights(self.flatcfs,self.weights_file,
+                                         weights_file_mode or self.weights_file_mode,
+                                         self.weight_dtype,self.input_sheet_slices)
+        # (the masks are now views of the packed masks)
+        self._clear_cf_sizes()
+        self._outstar_index = None
+
+
+    def _weights_writeable(self):
+        # False if the weights were opened read-only from a weights_file
+        return self._packed is None or self._packed.weights.flags.writeable
+
+
+    def __getstate__(self):
+        # The CFs' weights are pickled separately (as copies), so
+        # packing is redone on unpickling rather than saving the
+        # buffer too.
+        state = super(CFProjection,self).__getstate__()
+        state.pop('_packed',None)
+        # (recreated when next needed)
+        state.pop('_cf_matrix',None)
+        state.pop('_outstar_index',None)
+        state.pop('_sizes',None)
+        if self.weights_file is not None and 'flatcfs' in state:
+            # The weights are in the file, so are left out of copies
+            # of the CFs that are pickled instead.
+            if self._packed.weights.flags.writeable:
+                self._packed.weights.flush()
+            flatcfs = [copy(cf) for cf in self.flatcfs]
+            for cf in flatcfs:
+                if cf is not None:
+                    cf.weights = None
+            cfs = np.empty(self.cfs.shape,dtype=object)
+            cfs.flat[:] = flatcfs
+            state['flatcfs'],state['cfs'] = flatcfs,cfs
+        return state
+
+
+    def get_cf_matrix(self):
+        """
+        Return a CFMatrix copy of the CFs' weights, creating it if
+        necessary.
+
+        Once created, the matrix is kept up to date by learn() and
+        apply_learn_output_fns(); if the weights are changed in some
+        other way, update_cf_matrix() must be called.
+        """
+        if self._cf_matrix is None:
+            self._cf_matrix = CFMatrix(self.flatcfs,self.src.activity.shape)
+        return self._cf_matrix
+
+
+    def get_packed_weights(self):
+        """
+        Return the PackedWeights holding the CFs' weights, or None if
+        the weights are not packed.
+
+        If the weights or mask of any CF have been replaced since
+        packing (rather than modified in place), the optimized
+        functions would not see the new values, so the weights are
+        first repacked -- or, if they were opened read-only from a
+        weights_file, None is returned, so that the CFs are processed
+        individually.
+        """
+        packed = self._packed
+        if packed is not None and not packed.is_packed(self.flatcfs):
+            if not self._weights_writeable():
+                return None
+            self.verbose("Repacking weights, as some CFs' weights have been replaced.")
+            # (a weights_file is rewritten with the current weights)
+            self._pack_weights('w+')
+            packed = self._packed
+        return packed
+
+
+    def get_outstar_index(self):
+        """
+        Return a CFOutstarIndex of the packed weights, creating it if
+        necessary, or None if the weights are not packed.
+
+        The index is discarded whenever the weights are repacked
+        (e.g. by change_bounds()).
+        """
+        packed = self.get_packed_weights()
+        if packed is None:
+            return None
+        if self._outstar_index is None:
+            self._outstar_index = CFOutstarIndex(packed,self.src.activity.shape)
+        return self._outstar_index
+
+
+    def update_cf_matrix(self,active_units_only=False):
+        """
+        Copy the CFs' current weights into the CFMatrix, if there is
+        one: only those of the active units (as for learning), if
+        active_units_only is True.
+        """
+        if self._cf_matrix is not None:
+            indices = CFIter(self,active_units_mask=True).indices() \
+                      if active_units_only else None
+            self._cf_matrix.update(self.flatcfs,indices)
+
+
+    def __setstate__(self,state):
+        super(CFProjection,self).__setstate__(state)
+        if hasattr(self,'flatcfs'):
+            # (the pickled CFs have separate copies of their Slices
+            # and masks)
+            self._index_input_sheet_slices()
+            self._share_masks()
+        # (also packs projections saved before packed_weights existed)
+        if self.packed_weights and hasattr(self,'flatcfs'):
+            # (the weights are in the weights_file, if any)
+            self._pack_weights('r' if self.weights_file_mode=='r' else 'r+')
+
+
+    def _share_masks(self):
+        """
+        Replace each CF's mask with the equal view of the
+        mask_template, if there is one.
+
+        Pickling stores a separate copy of each CF's mask, so this
+        restores the sharing of the template after unpickling.  A CF
+        cropped at an edge of the sheet uses one side of the template,
+        so the regions of the template at each combination of sides
+        are tried in turn.
+        """
+        template = getattr(self,'mask_template',None)
+        if not self.same_cf_shape_for_all_cfs or template is None:
+            return
+        template = np.asarray(template,dtype=weight_type)
+        template.flags.writeable = False
+        self.mask_template = template
+        rows,cols = template.shape
+        for cf in self.flatcfs:
+            if cf is None or cf.mask is None or cf.mask.ndim != 2:
+                continue
+            h,w = cf.mask.shape
+            if h>rows or w>cols:
+                continue
+            for view in [template[r:r+h,c:c+w] for r in set([0,rows-h])
+                                                for c in set([0,cols-w])]:
+                if np.array_equal(view,cf.mask):
+                    cf.mask = view
+                    break
 
 
     def _create_cf(self,x,y):
@@ -695,12 +1353,15 @@ class CFProjection(Projection):
                                              self.mask_threshold,
                                              name=name)
 
+            # (only passed if needed, to support cf_types without it)
+            dtype_params = {} if self.weight_dtype is weight_type else \
+                           dict(weight_dtype=self.weight_dtype)
             CF = self.cf_type(self.src, x=x, y=y,
                               template=self._slice_template,
                               weights_generator=self.weights_generator,
                               mask=mask_template,
                               min_matrix_radius=self.min_matrix_radius,
-                              label = label)
+                              label = label, **dtype_params)
         except NullCFError:
             if self.allow_null_cfs:
                 CF = None
@@ -710,6 +1371,135 @@ class CFProjection(Projection):
         return CF
 
 
+    def _can_batch_create_cfs(self):
+        """
+        Whether _batch_create_cfs() creates the same CFs as calling
+        _create_cf() for each one, i.e. whether plain ConnectionFields
+        are created and _create_cf() has not been overridden.
+        """
+        return (self.cf_type is ConnectionField and
+                type(self)._create_cf.__func__ is CFProjection._create_cf.__func__)
+
+
+    def _batch_create_cfs(self,X,Y):
+        """
+        Create the ConnectionFields at the given src sheet coordinates,
+        returning them in an object array of the same shape as X.
+
+        Produces exactly the same CFs (including the random streams
+        used for their weights) as calling _create_cf() for each
+        location in turn, but computes the input_sheet_slices of all
+        the CFs at once using array arithmetic, and creates the CFs
+        without the per-CF template copying and Slice manipulation of
+        ConnectionField.__init__().
+
+        If the weights are to be packed into a weights_file, the file
+        is opened first and also returned, with the CFs' weights
+        being views of it in the layout of PackedWeights: in 'w+' mode
+        each CF's weights are generated directly into the file, so
+        that all of them never have to be held in memory, and
+        otherwise the weights already in the file are used without
+        generating any.  Otherwise None is returned instead.
+        """
+        input_slices,weights_slices = _cf_slices(self.src,self._slice_template,X,Y)
+        # (the CFs' Slices are views of its rows; see
+        # _index_input_sheet_slices())
+        self.input_sheet_slices = input_slices
+
+        weights,offsets = None,None
+        if self.packed_weights and self.weights_file is not None:
+            # (null CFs occupy no space)
+            null = np.logical_or(input_slices[:,1]-input_slices[:,0]<1,
+                                 input_slices[:,3]-input_slices[:,2]<1)
+            sizes = np.where(null,0,(weights_slices[:,1]-weights_slices[:,0]).astype(np.int64)*
+                                     (weights_slices[:,3]-weights_slices[:,2]))
+            offsets = np.zeros(len(sizes)+1,dtype=np.int64)
+            np.cumsum(sizes,out=offsets[1:])
+            weights = _open_weights_file(self.weights_file,self.weights_file_mode,
+                                         self.weight_dtype,offsets[-1])
+
+        label = self.hash_format.format(name=self.name,
+                                        src=self.src.name,
+                                        dest=self.dest.name)
+        label = label + ('-%d' % self.seed if self.seed is not None else '')
+
+        controlled_weights = (param.Dynamic.time_dependent
+                              and isinstance(param.Dynamic.time_fn, param.Time)
+                              and self.cf_type.independent_weight_generation)
+
+        cfs = np.empty(X.shape,dtype=object)
+        # (Python floats, as passed to _create_cf() by simple_vectorize)
+        coords = zip(X.ravel().tolist(),Y.ravel().tolist())
+
+        if controlled_weights:
+            # Enter the time context once for all the CFs, rather
+            # than once per CF as in ConnectionField.__init__()
+            with param.Dynamic.time_fn as t:
+                t(0)                        # Initialize weights at time zero.
+                self._batch_fill_cfs(cfs.ravel(),coords,input_slices,
+                                     weights_slices,label,True,weights,offsets)
+        else:
+            self._batch_fill_cfs(cfs.ravel(),coords,input_slices,
+                                 weights_slices,label,False,weights,offsets)
+        if weights is not None and self.weights_file_mode=='w+':
+            weights.flush()
+        return cfs,weights
+
+
+    def _batch_fill_cfs(self,flatcfs,coords,input_slices,weights_slices,
+                        label,controlled_weights,weights=None,offsets=None):
+        """
+        Create the CF at each of the coords (in order, so that any
+        random streams are consumed as by _create_cf()), storing it in
+        flatcfs.
+
+        If a flat weights array is given, each CF's weights are the
+        view of it from offsets[i] to offsets[i+1], and are generated
+        only if it was opened in 'w+' mode.
+        """
+        src = self.src
+        cf_type = self.cf_type
+        for i,(x,y) in enumerate(coords):
+            name = "%s_CF (%.5f, %.5f)" % (label,x,y)
+            if self.same_cf_shape_for_all_cfs:
+                mask_template = self.mask_template
+            else:
+                mask_template = _create_mask(self.cf_shape,
+                                             self.bounds_template,
+                                             src,self.autosize_mask,
+                                             self.mask_threshold,
+                                             name=name)
+
+            r1,r2,c1,c2 = input_slices[i]
+            if r2-r1<1 or c2-c1<1:
+                if self.allow_null_cfs:
+                    input_slices[i] = 0
+                    continue
+                raise NullCFError(x,y,src,r2-r1,c2-c1)
+
+            cf = cf_type.__new__(cf_type)
+            cf._has_norm_total = np.array([0],dtype=np.int32)
+            cf._norm_total = np.array([0.0],dtype=np.float64)
+            cf.input_sheet_slice = input_slices[i].view(Slice)
+            wr1,wr2,wc1,wc2 = weights_slices[i]
+            cf.mask = mask_template[wr1:wr2,wc1:wc2]
+            cf.mask.flags.writeable = False
+
+            pattern_params = dict(x=x,y=y,bounds=cf.get_bounds(src),
+                                  xdensity=src.xdensity,
+                                  ydensity=src.ydensity,
+                                  mask=cf.mask)
+            if controlled_weights:
+                pattern_params['name'] = name
+            if weights is None:
+                cf.weights = self.weights_generator(**pattern_params).astype(self.weight_dtype)
+            else:
+                cf.weights = weights[offsets[i]:offsets[i+1]].reshape(cf.mask.shape)
+                if self.weights_file_mode=='w+':
+                    cf.weights[...] = self.weights_generator(**pattern_params)
+            flatcfs[i] = cf
+
+
     def _calc_n_units(self):
         """Return the number of unmasked units in a typical ConnectionField."""
 
@@ -824,8 +1614,9 @@ class CFProjection(Projection):
         """
         # Learning is performed if the input_buffer has already been set,
         # i.e. there is an input to the Projection.
-        if self.input_buffer is not None:
+        if self.input_buffer is not None and self._weights_writeable():
             self.learning_fn(CFIter(self),self.input_buffer,self.dest.activity,self.learning_rate)
+            self.update_cf_matrix(self.learning_fn.learns_active_units_only)
 
 
     # CEBALERT: called 'learn' output fns here, but called 'weights' output fns
@@ -836,8 +1627,12 @@ class CFProjection(Projection):
 
         If active_units_mask is True, inactive units will be skipped.
         """
+        if not self._weights_writeable():
+            return
         for of in self.weights_output_fns:
             of(CFIter(self,active_units_mask=active_units_mask))
+        if self.weights_output_fns:
+            self.update_cf_matrix(active_units_mask)
 
 
     # CEBALERT: see gc alert in simulation.__new__
@@ -852,21 +1647,65 @@ class CFProjection(Projection):
                 cf.weights_slice=None
 
 
+    def _cf_sizes(self):
+        """
+        Return the bytes taken by the weights of each CF and the number
+        of connections (non-masked values) of each CF, as int64 arrays,
+        and the bytes taken by the masks (most of which are views of a
+        few shared arrays).
+
+        These only change when the CFs are replaced or change shape, so
+        they are computed once and kept until _clear_cf_sizes() is
+        called.  A CF without a mask has -1 connections, because its
+        count (the nonzero weights) changes during learning.
+        """
+        if self._sizes is None:
+            flatcfs = self.flatcfs
+            weight_bytes = np.zeros(len(flatcfs),dtype=np.int64)
+            conns = np.zeros(len(flatcfs),dtype=np.int64)
+            masks = {}
+            for i,cf in enumerate(flatcfs):
+                if cf is None:
+                    continue
+                weight_bytes[i] = cf.weights.nbytes
+                if cf.mask is None:
+                    conns[i] = -1
+                else:
+                    conns[i] = np.count_nonzero(cf.mask)
+                    base = _base_array(cf.mask)
+                    masks[id(base)] = base
+            mask_bytes = sum([m.nbytes for m in masks.values()])
+            self._sizes = weight_bytes,conns,mask_bytes
+        return self._sizes
+
+
+    def _clear_cf_sizes(self):
+        """
+        Discard the sizes cached by _cf_sizes(); must be called
+        whenever the CFs are replaced or change shape.
+        """
+        self._sizes = None
+
+
     def n_bytes(self):
         # Could also count the input_sheet_slice
-        rows,cols=self.cfs.shape
-        return super(CFProjection,self).n_bytes() + \
-               sum([cf.weights.nbytes +
-                    cf.mask.nbytes
-                    for cf,i in CFIter(self,ignore_sheet_mask=True)()])
+        cf_matrix_bytes = self._cf_matrix.nbytes() if self._cf_matrix is not None else 0
+        outstar_bytes = self._outstar_index.nbytes() if self._outstar_index is not None else 0
+        weight_bytes,conns,mask_bytes = self._cf_sizes()
+        # (a null CF takes no bytes)
+        return super(CFProjection,self).n_bytes() + cf_matrix_bytes + outstar_bytes + \
+               int(weight_bytes.sum()) + mask_bytes
 
 
     def n_conns(self):
         # Counts non-masked values, if mask is available; otherwise counts
         # weights as connections if nonzero
-        rows,cols=self.cfs.shape
-        return np.sum([len((cf.mask if cf.mask is not None else cf.weights).ravel().nonzero()[0])
-                    for cf,i in CFIter(self)()])
+        weight_bytes,conns,mask_bytes = self._cf_sizes()
+        indices = CFIter(self).indices()
+        counts = conns[indices]
+        return int(counts[counts>=0].sum()) + \
+               sum([np.count_nonzero(self.flatcfs[i].weights)
+                    for i in indices[counts<0]])
 
 
 # CEB: have not yet decided proper location for this method
@@ -903,7 +1742,62 @@ def _create_mask(shape,bounds_template,sheet,
     mask = np.where(mask>=threshold,mask,0.0)
 
     # CB: unnecessary copy (same as for weights)
-    return mask.astype(weight_type)
+    mask = mask.astype(weight_type)
+    # (the CFs' masks are views of it)
+    mask.flags.writeable = False
+    return mask
+
+
+def _cf_slices(input_sheet,template,X,Y):
+    """
+    Compute the slices of the CFs centered at the given arrays of
+    sheet coordinates on the input_sheet, all at once.
+
+    Returns two int32 arrays of shape (X.size,4): the (r1,r2,c1,c2)
+    input_sheet_slice of each CF, and the slice of the template's
+    weights/mask matrix that each CF uses (which differs from the
+    whole matrix only for CFs cropped at an edge of the sheet).
+    These are the same as ConnectionField.__init__() computes using
+    Slice.positionedcrop(), Slice.crop_to_sheet(), and
+    Slice.positionlesscrop(), one CF at a time.  A CF whose
+    input_sheet_slice has a zero-sized dimension would be a null CF.
+    """
+    cf_row,cf_col = input_sheet.sheet2matrixidx(X.ravel(),Y.ravel())
+    maxrow,maxcol = input_sheet.shape
+    t_r1,t_r2,t_c1,t_c2 = [int(i) for i in template]
+
+    # positionedcrop: offset the template to each CF's location
+    bounds_x,bounds_y = template.compute_bounds(input_sheet).centroid()
+    b_row,b_col = input_sheet.sheet2matrixidx(bounds_x,bounds_y)
+    row_offset = cf_row-b_row
+    col_offset = cf_col-b_col
+
+    # crop_to_sheet
+    input_slices = np.empty((cf_row.size,4),dtype=np.int32)
+    input_slices[:,0] = np.maximum(0,t_r1+row_offset)
+    input_slices[:,1] = np.minimum(maxrow,t_r2+row_offset)
+    input_slices[:,2] = np.maximum(0,t_c1+col_offset)
+    input_slices[:,3] = np.minimum(maxcol,t_c2+col_offset)
+
+    # positionlesscrop (see Slice.findinputslice())
+    n_rows,n_cols = t_r2-t_r1,t_c2-t_c1
+    weights_slices = np.empty((cf_row.size,4),dtype=np.int32)
+    weights_slices[:,0] = -np.minimum(0,cf_row-n_rows//2)
+    weights_slices[:,1] = -np.maximum(-n_rows,cf_row-maxrow-n_rows//2)
+    weights_slices[:,2] = -np.minimum(0,cf_col-n_cols//2)
+    weights_slices[:,3] = -np.maximum(-n_cols,cf_col-maxcol-n_cols//2)
+
+    return input_slices,weights_slices
+
+
+def _input_sheet_slice_table(flatcfs):
+    # int32 (len(flatcfs) x 4) table of the CFs' input_sheet_slices
+    # (zeros for a null CF)
+    slices = np.zeros((len(flatcfs),4),dtype=np.int32)
+    for i,cf in enumerate(flatcfs):
+        if cf is not None:
+            slices[i] = cf.input_sheet_slice
+    return slices
 
 
 
@@ -923,16 +1817,35 @@ class CFIter(object):
     # ignore_inactive_units).
     def __init__(self,cfprojection,active_units_mask=False,ignore_sheet_mask=False):
 
+        self.proj = cfprojection
         self.flatcfs = cfprojection.flatcfs
+        # PackedWeights of the CFs, or None if they are stored separately
+        # (see CFProjection.get_packed_weights())
+        get_packed_weights = getattr(cfprojection,'get_packed_weights',None)
+        self.packed = None if get_packed_weights is None else get_packed_weights()
         self.activity = cfprojection.dest.activity
         self.mask = cfprojection.dest.mask
         self.cf_type = cfprojection.cf_type
+        # (the C-optimized functions handle only weight_type)
+        self.weight_dtype = np.dtype(getattr(cfprojection,'weight_dtype',weight_type))
         self.proj_n_units = cfprojection.n_units
         self.allow_skip_non_responding_units = cfprojection.dest.allow_skip_non_responding_units
 
         self.active_units_mask = active_units_mask
         self.ignore_sheet_mask = ignore_sheet_mask
 
+    @property
+    def slices(self):
+        """
+        The int32 (number of CFs) x 4 table of the CFs'
+        input_sheet_slices (see CFProjection.input_sheet_slices),
+        collected from the CFs if the projection does not have one.
+        """
+        slices = getattr(self.proj,'input_sheet_slices',None)
+        if slices is None:
+            slices = _input_sheet_slice_table(self.flatcfs)
+        return slices
+
     def __nomask(self):
         # return an array indicating all units should be processed
 
@@ -954,6 +1867,23 @@ class CFIter(object):
         else:
             return self.__nomask()
 
+    def active_unit_indices(self):
+        """
+        Return an int32 array of the flat indices (in increasing
+        order) of the units whose activity is nonzero and that are not
+        excluded by the sheet mask (unless ignore_sheet_mask is True).
+
+        For a ProjectionSheet, this is the sheet's
+        active_unit_indices(), which during learning is computed once
+        and shared by all its projections.
+        """
+        if self.ignore_sheet_mask:
+            return np.flatnonzero(self.activity).astype(np.int32)
+        elif hasattr(self.proj.dest,'active_unit_indices'):
+            return self.proj.dest.active_unit_indices()
+        else:
+            return np.flatnonzero(np.logical_and(self.activity,self.get_sheet_mask())).astype(np.int32)
+
     # CEBALERT: rename?
     def get_overall_mask(self):
         """
@@ -980,12 +1910,35 @@ class CFIter(object):
         return np.logical_and(sheet_mask,active_units_mask)
 
 
+    def indices(self):
+        """
+        Return an int32 array of the flat indices (in increasing
+        order) of all the CFs to be processed, i.e. those that are not
+        null and that are selected by get_overall_mask().
+
+        The masks are evaluated once for the whole sheet (and, when
+        skipping inactive units, during learning just once for all
+        the projections; see active_unit_indices()), so functions
+        that use the indices directly (e.g. to select the activities
+        of all the units at once with activity.flat[indices], or C
+        code looping over just these units) avoid any per-unit tests.
+        The array must not be modified.
+        """
+        if self.active_units_mask and self.allow_skip_non_responding_units:
+            indices = self.active_unit_indices()
+        else:
+            indices = np.flatnonzero(self.get_overall_mask()).astype(np.int32)
+        flatcfs = self.flatcfs
+        # (null CFs are rare, so only look at each CF if there are any)
+        if None in flatcfs:
+            indices = indices[[flatcfs[i] is not None for i in indices]]
+        return indices
+
+
     def __call__(self):
-        mask = self.get_overall_mask()
-        for i,cf in enumerate(self.flatcfs):
-            if cf is not None:
-                if mask.flat[i]:
-                    yield cf,i
+        flatcfs = self.flatcfs
+        for i in self.indices().tolist():
+            yield flatcfs[i],i
 
 
 # PRALERT: CFIter Alias for backwards compatability with user code
@@ -1070,6 +2023,10 @@ class ResizableCFProjection(CFProjection):
         Currently only allows reducing the size, but should be
         extended to allow increasing as well.
         """
+        if not self._weights_writeable():
+            self.warning('Unable to change_bounds; the weights are read-only.')
+            return
+
         slice_template = Slice(copy(nominal_bounds_template),
                                self.src,force_odd=True,
                                min_matrix_radius=self.min_matrix_radius)
@@ -1109,6 +2066,14 @@ class ResizableCFProjection(CFProjection):
                                        output_fns=output_fns,
                                        min_matrix_radius=self.min_matrix_radius)
 
+        # (the CFs now have new, smaller weights matrices, which
+        # replace those in any weights_file)
+        self._index_input_sheet_slices()
+        self._cf_matrix = None
+        self._clear_cf_sizes()
+        if self.packed_weights:
+            self._pack_weights('w+')
+
 
     def change_density(self, new_wt_density):
         """
@@ -1152,8 +2117,7 @@ class ResizableCFProjection(CFProjection):
             # is also slower).
 
             cf.mask = weights_slice.submatrix(mask)
-            cf.mask = np.array(cf.mask,copy=1) # CB: why's this necessary?
-                                                # (see ALERT in __init__)
+            cf.mask.flags.writeable = False
             cf.weights *= cf.mask
             for of in output_fns:
                 of(cf.weights)
@@ -64,6 +64,9 @@ class GeneratorSheet(Sheet):
         if push_existing:
             self.push_input_generator()
 
+        # the input_generator's state is saved by state_push()
+        self.complete_state_push()
+
         # CEBALERT: replaces any bounds specified for the
         # PatternGenerator with this sheet's own bounds. When
         # PatternGenerators can draw patterns into supplied
@@ -0,0 +1,497 @@
+"""
+Partitioned execution of a Simulation across several processes.
+
+A Partition runs chosen ProjectionSheets in worker processes, each
+holding its own copy of the model, while the main process keeps the
+event clock: events are delivered and scheduled exactly as usual, but
+when a partitioned Sheet is to process its input, the input is handed
+to the worker(s) assigned to that Sheet, and the events the Sheet
+sends there are scheduled in the main process in the same order.  A
+large CFSheet can also be split into bands of rows, each computed by a
+different worker; see Simulation.partition().
+
+The communication between the main process and the workers goes
+through an ActivityTransport.  SharedMemoryTransport, the default,
+starts the workers on the local machine using multiprocessing and
+exchanges activity arrays through POSIX shared memory; other
+transports (e.g. one based on MPI) can be supplied instead.
+"""
+
+import os
+import mmap
+import glob
+import threading
+import traceback
+import itertools
+from multiprocessing import Process, Pipe
+
+import numpy as np
+
+import param
+
+from topo.base.simulation import EPConnectionEvent
+from topo.base import simulation, projection
+from topo.base.projection import ProjectionSheet, SheetMask
+
+
+
+class ActivityTransport(param.Parameterized):
+    """
+    Abstract means of starting worker processes for a Partition and
+    exchanging messages and arrays with them.
+
+    Messages are small picklable objects; arrays are passed
+    separately, as a dictionary of named numpy arrays accompanying a
+    message, so that a transport can move them without pickling.  An
+    array received by either side is only guaranteed to remain valid
+    until the next message is sent to the same worker.  Each worker
+    must run with its own copy of the main process's model (e.g. by
+    forking, or by running the same script).
+    """
+    __abstract = True
+
+    def start(self,n_workers,worker):
+        """
+        Start n_workers worker processes; worker number rank calls
+        worker(self,rank), and exits when it returns.
+        """
+        raise NotImplementedError
+
+    def send(self,rank,message,arrays={}):
+        """Send a message and arrays from the main process to worker rank."""
+        raise NotImplementedError
+
+    def receive(self,rank):
+        """In the main process, return the next (message,arrays) from worker rank."""
+        raise NotImplementedError
+
+    def worker_send(self,message,arrays={}):
+        """Send a message and arrays from this worker to the main process."""
+        raise NotImplementedError
+
+    def worker_receive(self):
+        """In a worker, return the next (message,arrays) from the main process."""
+        raise NotImplementedError
+
+    def stop(self):
+        """Wait for the workers to exit, and release any resources."""
+        raise NotImplementedError
+
+
+
+class SharedMemoryTransport(ActivityTransport):
+    """
+    Workers forked on the local machine with multiprocessing; arrays
+    are copied into POSIX shared memory segments (files in the
+    directory below) that both sides map, and only their names,
+    shapes and types are sent through a pipe.
+
+    Each distinct array name, shape and type in each direction has
+    its own segment, created the first time it is used and reused
+    thereafter, so that activity arrays exchanged at every time step
+    are simply copied into place.
+    """
+
+    directory = param.String(default='/dev/shm',doc="""
+        Directory in which to create the shared memory segments; on
+        Linux, files in /dev/shm are POSIX shared memory.  The
+        segments are removed when the transport stops.""")
+
+    _instances = itertools.count()
+
+    def __init__(self,**params):
+        super(SharedMemoryTransport,self).__init__(**params)
+        self._processes = []
+        self._pipes = []
+        self._segments = {}
+        self._rank = None
+
+
+    def start(self,n_workers,worker):
+        directory = self.directory if os.path.isdir(self.directory) else '/tmp'
+        self._prefix = os.path.join(directory,'topographica-%d-%d-'%(
+            os.getpid(),next(SharedMemoryTransport._instances)))
+        for rank in range(n_workers):
+            conn,worker_conn = Pipe()
+            p = Process(target=self._run_worker,args=(rank,worker,worker_conn))
+            p.daemon = True
+            p.start()
+            worker_conn.close()
+            self._processes.append(p)
+            self._pipes.append(conn)
+
+
+    def _run_worker(self,rank,worker,conn):
+        self._rank = rank
+        self._pipes = [conn]
+        worker(self,rank)
+
+
+    def _segment(self,name,shape,dtype):
+        # The shared array of the given shape and type, created or
+        # mapped on first use
+        segment = self._segments.get(name)
+        if segment is None:
+            size = int(np.prod(shape))
+            nbytes = max(1,size*dtype.itemsize)
+            fd = os.open(name,os.O_RDWR|os.O_CREAT,0600)
+            try:
+                if os.fstat(fd).st_size < nbytes:
+                    os.ftruncate(fd,nbytes)
+                buf = mmap.mmap(fd,nbytes)
+            finally:
+                os.close(fd)
+            segment = self._segments[name] = np.frombuffer(buf,dtype=dtype,count=size).reshape(shape)
+        return segment
+
+
+    def _send(self,conn,direction,message,arrays):
+        descriptions = []
+        for key,array in arrays.items():
+            array = np.asarray(array)
+            name = '%s%s-%s-%s-%s'%(self._prefix,direction,key,
+                                    'x'.join(map(str,array.shape)),array.dtype.str[1:])
+            self._segment(name,array.shape,array.dtype)[...] = array
+            descriptions.append((key,name,array.shape,array.dtype.str))
+        conn.send((message,descriptions))
+
+
+    def _receive(self,conn):
+        message,descriptions = conn.recv()
+        arrays = dict((key,self._segment(name,shape,np.dtype(dtype)))
+                      for key,name,shape,dtype in descriptions)
+        return message,arrays
+
+
+    def send(self,rank,message,arrays={}):
+        self._send(self._pipes[rank],'m%d'%rank,message,arrays)
+
+    def receive(self,rank):
+        return self._receive(self._pipes[rank])
+
+    def worker_send(self,message,arrays={}):
+        self._send(self._pipes[0],'w%d'%self._rank,message,arrays)
+
+    def worker_receive(self):
+        return self._receive(self._pipes[0])
+
+
+    def stop(self):
+        for conn in self._pipes:
+            conn.close()
+        for p in self._processes:
+            p.join(5)
+            if p.is_alive():
+                p.terminate()
+        self._processes,self._pipes = [],[]
+        self._segments = {}
+        for name in glob.glob(self._prefix+'*'):
+            os.remove(name)
+
+
+
+def _bands(n_rows,n_bands):
+    # Split rows 0..n_rows-1 into n_bands contiguous bands, as
+    # (start,stop) pairs
+    return [(band[0],band[-1]+1) for band in np.array_split(np.arange(n_rows),n_bands)]
+
+
+
+class _RowBandMask(SheetMask):
+    """
+    The given SheetMask restricted to rows [start,stop), so that a
+    worker computes the activity and learning of only its own band
+    of a partitioned Sheet.
+    """
+
+    def __init__(self,sheet,mask,rows,**params):
+        super(_RowBandMask,self).__init__(None,**params)
+        self._mask = mask
+        self._rows = rows
+        self.sheet = sheet
+
+    def _restrict(self):
+        start,stop = self._rows
+        data = np.array(self._mask.data)
+        data[:start] = 0
+        data[stop:] = 0
+        self._data = data
+
+    def reset(self):
+        self._mask.reset()
+        self._restrict()
+
+    def calculate(self):
+        self._mask.calculate()
+        self._restrict()
+
+    def update(self):
+        self._mask.update()
+        self._restrict()
+
+
+
+class _PartitionedSheet(object):
+    """
+    Stands in for the methods of a partitioned Sheet in the main
+    process, forwarding its input to the workers computing it and
+    scheduling the events they send.
+    """
+
+    _methods = ['input_event','process_current_time','state_push','state_pop']
+
+    def __init__(self,partition,sheet,ranks):
+        self.partition = partition
+        self.sheet = sheet
+        self.ranks = ranks
+        self.bands = _bands(sheet.activity.shape[0],len(ranks))
+        self.inputs = []
+        for name in self._methods:
+            setattr(sheet,name,getattr(self,name))
+
+    def restore(self):
+        for name in self._methods:
+            del self.sheet.__dict__[name]
+
+
+    def input_event(self,conn,data):
+        self.inputs.append((conn.name,data))
+
+
+    def process_current_time(self):
+        sheet = self.sheet
+        sim = sheet.simulation
+        inputs,self.inputs = self.inputs,[]
+        arrays = {}
+        described = []
+        for i,(name,data) in enumerate(inputs):
+            if isinstance(data,np.ndarray):
+                arrays[i] = data
+                described.append((name,i,None))
+            else:
+                described.append((name,None,data))
+
+        replies = self.partition._call(self.ranks,('process',sheet.name,sim.time(),described),arrays)
+
+        events = replies[0][0][1]
+        for message,band_arrays in replies[1:]:
+            if message[1]!=events:
+                raise RuntimeError("The bands of partitioned Sheet %s sent different events."%sheet.name)
+
+        sheet.activity[...] = self._combine([a['activity'] for m,a in replies])
+        data = {}
+        conns = dict((conn.name,conn) for conn in sheet.out_connections)
+        for name,time,key,value in events:
+            if key is not None:
+                if key not in data:
+                    data[key] = self._combine([a[key] for m,a in replies])
+                value = data[key]
+            sim.enqueue_event(EPConnectionEvent(time,conns[name],value,deep_copy=False))
+
+
+    def _combine(self,arrays):
+        # Copy each band's rows of its array into a single array
+        combined = np.array(arrays[0])
+        for (start,stop),array in zip(self.bands[1:],arrays[1:]):
+            combined[start:stop] = array[start:stop]
+        return combined
+
+
+    def state_push(self,**args):
+        type(self.sheet).state_push(self.sheet,**args)
+        self.partition._call(self.ranks,('state_push',self.sheet.name))
+
+    def state_pop(self,**args):
+        type(self.sheet).state_pop(self.sheet,**args)
+        self.partition._call(self.ranks,('state_pop',self.sheet.name))
+
+
+    def gather(self):
+        sheet = self.sheet
+        replies = self.partition._call(self.ranks,('gather',sheet.name))
+        for (start,stop),(message,arrays) in zip(self.bands,replies):
+            activity,projection_activities,weights = message[1:]
+            sheet.activity[start:stop] = activity[start:stop]
+            for conn in sheet.in_connections:
+                if conn.name in projection_activities:
+                    conn.activity[start:stop] = projection_activities[conn.name][start:stop]
+                for i,w in weights.get(conn.name,[]):
+                    conn.flatcfs[i].weights[...] = w
+
+
+
+class Partition(object):
+    """
+    The worker processes computing the partitioned Sheets of a
+    Simulation, and the main process's side of their communication.
+
+    Created by Simulation.partition().
+    """
+
+    def __init__(self,sim,assignment,transport=None):
+        if sim.eps_to_start:
+            sim.run(0.0)
+
+        self.sim = sim
+        self.assignment = {}
+        for name,ranks in assignment.items():
+            ranks = [ranks] if isinstance(ranks,int) else list(ranks)
+            sheet = sim[name]
+            if not isinstance(sheet,ProjectionSheet):
+                raise ValueError("Only ProjectionSheets can be partitioned; %s is a %s."
+                                 %(name,type(sheet).__name__))
+            if len(ranks)>sheet.activity.shape[0]:
+                raise ValueError("%s has fewer rows than the number of workers assigned to it."%name)
+            self.assignment[name] = ranks
+        self.n_workers = max(max(ranks) for ranks in self.assignment.values())+1
+
+        self.transport = SharedMemoryTransport() if transport is None else transport
+        self._locks = [threading.Lock() for rank in range(self.n_workers)]
+        self.transport.start(self.n_workers,self._serve)
+
+        self.sheets = [_PartitionedSheet(self,sim[name],ranks)
+                       for name,ranks in sorted(self.assignment.items())]
+
+        # The workers only compute in parallel if the Simulation
+        # processes the Sheets concurrently
+        self._process_threads = sim.process_threads
+        if not sim.process_threads:
+            sim.process_threads = self.n_workers
+
+
+    def _call(self,ranks,message,arrays={}):
+        # Send the message to each of the given workers, and return
+        # their replies.  A worker may be used by several threads of
+        # the main process, so the workers are locked (in a fixed
+        # order, to avoid deadlock) until they have replied.
+        locks = [self._locks[rank] for rank in sorted(set(ranks))]
+        for lock in locks:
+            lock.acquire()
+        try:
+            for rank in ranks:
+                self.transport.send(rank,message,arrays)
+            replies = [self.transport.receive(rank) for rank in ranks]
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+        for rank,(reply,arrays) in zip(ranks,replies):
+            if reply[0]=='error':
+                raise RuntimeError("Error in partition worker %d:\n%s"%(rank,reply[1]))
+        return replies
+
+
+    def gather(self):
+        """
+        Copy the activity and the connection field weights of the
+        partitioned Sheets (and their incoming projections) from the
+        workers into the main process's model, e.g. before plotting
+        or saving the weights.
+        """
+        for partitioned in self.sheets:
+            partitioned.gather()
+
+
+    def stop(self):
+        """Gather the state of the partitioned Sheets, then stop the workers."""
+        try:
+            self.gather()
+            for rank in range(self.n_workers):
+                self._call([rank],('stop',))
+        finally:
+            self.transport.stop()
+            for partitioned in self.sheets:
+                partitioned.restore()
+            self.sim.process_threads = self._process_threads
+
+
+    ### Worker side
+
+    def _serve(self,transport,rank):
+        # Main loop of a worker: compute the Sheets assigned to this
+        # worker (in its own copy of the model) when asked.
+        sim = self.sim
+        # thread pools belong to the main process
+        simulation._thread_pools.clear()
+        projection._activation_pools.clear()
+
+        self._sheets = {}
+        for name,ranks in self.assignment.items():
+            if rank in ranks:
+                sheet = self._sheets[name] = sim[name]
+                if len(ranks)>1:
+                    rows = _bands(sheet.activity.shape[0],len(ranks))[ranks.index(rank)]
+                    sheet.mask = _RowBandMask(sheet,sheet.mask,rows)
+
+        # Events sent by the Sheets are returned to the main process
+        self._sent = []
+        sim._enqueue_hook = self._sent.append
+
+        while True:
+            try:
+                message,arrays = transport.worker_receive()
+            except EOFError:
+                return
+            command = message[0]
+            try:
+                reply = getattr(self,'_'+command)(arrays,*message[1:])
+            except Exception:
+                transport.worker_send(('error',traceback.format_exc()))
+                continue
+            transport.worker_send(*reply)
+            if command=='stop':
+                return
+
+
+    def _process(self,arrays,name,time,inputs):
+        sheet = self._sheets[name]
+        self.sim.time(time)
+        conns = dict((conn.name,conn) for conn in sheet.in_connections)
+        for conn_name,key,value in inputs:
+            data = value if key is None else np.array(arrays[key])
+            sheet.input_event(conns[conn_name],data)
+
+        del self._sent[:]
+        sheet.process_current_time()
+
+        events = []
+        keys = {}
+        out = {'activity':sheet.activity}
+        for e in self._sent:
+            if e.__class__ is not EPConnectionEvent:
+                raise NotImplementedError("Partitioned Sheets can only send EPConnectionEvents, not %s."%e)
+            if isinstance(e.data,np.ndarray):
+                key = keys.setdefault(id(e.data),len(keys))
+                out[key] = e.data
+                events.append((e.conn.name,e.time,key,None))
+            else:
+                events.append((e.conn.name,e.time,None,e.data))
+        del self._sent[:]
+        return ('ok',events),out
+
+
+    def _state_push(self,arrays,name):
+        self._sheets[name].state_push()
+        return ('ok',),{}
+
+    def _state_pop(self,arrays,name):
+        self._sheets[name].state_pop()
+        return ('ok',),{}
+
+
+    def _gather(self,arrays,name):
+        sheet = self._sheets[name]
+        rows,cols = sheet.activity.shape
+        start,stop = sheet.mask._rows if isinstance(sheet.mask,_RowBandMask) else (0,rows)
+        projection_activities = {}
+        weights = {}
+        for conn in sheet.in_connections:
+            if hasattr(conn,'activity'):
+                projection_activities[conn.name] = conn.activity
+            if hasattr(conn,'flatcfs'):
+                weights[conn.name] = [(i,cf.weights) for i,cf in enumerate(conn.flatcfs)
+                                      if cf is not None and start*cols<=i<stop*cols]
+        return ('ok',sheet.activity,projection_activities,weights),{}
+
+
+    def _stop(self,arrays):
+        return ('ok',),{}
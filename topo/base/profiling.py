@@ -0,0 +1,224 @@
+"""
+Per-component timing of a running Simulation.
+
+A ComponentProfiler keeps the cumulative wall-clock time and the
+number of calls of each part of a model that does a significant
+amount of work: each EventProcessor's input_event() and
+process_current_time(), each Projection's activate(), learn() and
+apply_learn_output_fns(), each output function of a Sheet or
+Projection, and the delivery of each type of Event.  Unlike
+topo.misc.util.profile, which runs a whole command under cProfile,
+only these calls are timed, so profiling can be left on while a
+model runs normally.
+
+Usually used through Simulation.start_profiling(),
+Simulation.stop_profiling() and Simulation.perf_report().
+"""
+
+import csv
+import json
+import threading
+import timeit
+from StringIO import StringIO
+from collections import OrderedDict
+
+
+# Columns of a report, in order
+_fields = ['component','name','operation','calls','seconds','mean_us','percent_of_run']
+
+
+
+class _TimedFn(object):
+    """
+    Stands in for an output function in its list while it is being
+    profiled, timing each call; other attributes are those of the
+    output function itself.
+    """
+    __slots__ = ['_fn','_stat','_profiler']
+
+    def __init__(self,fn,stat,profiler):
+        object.__setattr__(self,'_fn',fn)
+        object.__setattr__(self,'_stat',stat)
+        object.__setattr__(self,'_profiler',profiler)
+
+    def __call__(self,*args,**kw):
+        start = self._profiler.timer()
+        try:
+            return self._fn(*args,**kw)
+        finally:
+            self._profiler.add(self._stat,start)
+
+    def __getattr__(self,name):
+        return getattr(self._fn,name)
+
+    def __setattr__(self,name,value):
+        setattr(self._fn,name,value)
+
+    def __repr__(self):
+        return repr(self._fn)
+
+
+
+class ComponentProfiler(object):
+    """
+    Cumulative call counts and wall-clock times for the components of
+    a Simulation.
+
+    The methods to be timed are replaced, on each object, by a timed
+    version (and output functions by a timed stand-in) when start()
+    is called, and restored by stop(), so that a Simulation that is
+    not being profiled runs exactly as usual.  Components added to
+    the Simulation after start() are not timed.
+
+    Times are inclusive: e.g. the time of a Sheet's
+    process_current_time() includes that of its Projections'
+    activate() and of its output functions.  Calls can come from
+    several threads at once (see Simulation.process_threads and
+    ProjectionSheet.activation_threads), in which case the times of
+    concurrent calls all count in full.
+    """
+
+    # Methods timed on each object
+    ep_methods = ['input_event','process_current_time']
+    projection_methods = ['activate','learn','apply_learn_output_fns']
+
+    def __init__(self,sim):
+        self.sim = sim
+        self.timer = timeit.default_timer
+        # (component,name,operation) -> [calls,seconds]
+        self.stats = OrderedDict()
+        self._lock = threading.Lock()
+        self._patched = []
+        self._wrapped = []
+        self.active = False
+
+
+    def _stat(self,component,name,operation):
+        return self.stats.setdefault((component,name,operation),[0,0.0])
+
+
+    def add(self,stat,start):
+        """Count one call, which started at the given timer() value, in stat."""
+        elapsed = self.timer()-start
+        with self._lock:
+            stat[0] += 1
+            stat[1] += elapsed
+
+
+    def _patch(self,obj,method,component,name):
+        # Replace obj.method with a timed version
+        fn = getattr(obj,method)
+        stat = self._stat(component,name,method)
+        timer,add = self.timer,self.add
+        def timed(*args,**kw):
+            start = timer()
+            try:
+                return fn(*args,**kw)
+            finally:
+                add(stat,start)
+        self._patched.append((obj,method,obj.__dict__.get(method),timed))
+        setattr(obj,method,timed)
+
+
+    def _wrap_output_fns(self,obj,name):
+        fns = getattr(obj,'output_fns',None)
+        if not fns:
+            return
+        for i,fn in enumerate(fns):
+            if isinstance(fn,_TimedFn):
+                continue
+            stat = self._stat('OutputFn',"%s.output_fns[%d]"%(name,i),type(fn).__name__)
+            fns[i] = _TimedFn(fn,stat,self)
+            self._wrapped.append((fns,fns[i]))
+
+
+    def start(self):
+        """Start timing the Simulation's current components."""
+        if self.active:
+            return
+        sim = self.sim
+        self._patch(sim,'run','Simulation',sim.name)
+        for ep_name,ep in sorted(sim.objects().items()):
+            for method in self.ep_methods:
+                self._patch(ep,method,'EventProcessor',ep_name)
+            self._wrap_output_fns(ep,ep_name)
+            for conn in ep.in_connections:
+                conn_name = "%s.%s"%(ep_name,conn.name)
+                for method in self.projection_methods:
+                    if hasattr(conn,method):
+                        self._patch(conn,method,'Projection',conn_name)
+                self._wrap_output_fns(conn,conn_name)
+        self.active = True
+
+
+    def stop(self):
+        """Stop timing, restoring the original methods and output functions."""
+        for obj,method,original,timed in reversed(self._patched):
+            # (unless something else has replaced it since)
+            if obj.__dict__.get(method) is timed:
+                if original is None:
+                    del obj.__dict__[method]
+                else:
+                    setattr(obj,method,original)
+        for fns,timed in self._wrapped:
+            for i,fn in enumerate(fns):
+                if fn is timed:
+                    fns[i] = timed._fn
+        self._patched,self._wrapped = [],[]
+        self.active = False
+
+
+    def deliver(self,event):
+        """Deliver the event to the Simulation, timing it by Event type."""
+        stat = self._stat('Event',type(event).__name__,'deliver')
+        start = self.timer()
+        try:
+            event(self.sim)
+        finally:
+            self.add(stat,start)
+
+
+    def rows(self):
+        """
+        Return the statistics as a list of dictionaries (one per timed
+        operation, with the keys listed in _fields), most
+        time-consuming first.
+
+        percent_of_run is the percentage of the time spent in
+        Simulation.run(), or None if run() has not been called.
+        """
+        run_time = sum(seconds for (component,name,operation),(calls,seconds)
+                       in self.stats.items() if component=='Simulation')
+        rows = []
+        for (component,name,operation),(calls,seconds) in self.stats.items():
+            if not calls:
+                continue
+            rows.append(dict(component=component,name=name,operation=operation,
+                             calls=calls,seconds=seconds,mean_us=1e6*seconds/calls,
+                             percent_of_run=100.0*seconds/run_time if run_time else None))
+        rows.sort(key=lambda row: -row['seconds'])
+        return rows
+
+
+    def report(self,format='text'):
+        """Return the statistics as a string in the given format: 'text', 'csv' or 'json'."""
+        rows = self.rows()
+        if format=='json':
+            return json.dumps(rows,indent=1)
+        elif format=='csv':
+            out = StringIO()
+            writer = csv.DictWriter(out,_fields,lineterminator='\n')
+            writer.writeheader()
+            writer.writerows(rows)
+            return out.getvalue()
+        elif format=='text':
+            lines = ["%-15s %-32s %-24s %9s %11s %11s %9s"%(
+                "Component","Name","Operation","Calls","Total (s)","Mean (us)","% of run")]
+            for row in rows:
+                percent = row['percent_of_run']
+                lines.append("%-15s %-32s %-24s %9d %11.4f %11.1f %9s"%(
+                    row['component'],row['name'],row['operation'],row['calls'],
+                    row['seconds'],row['mean_us'],"-" if percent is None else "%.1f"%percent))
+            return "\n".join(lines)
+        else:
+            raise ValueError("Unknown report format '%s'; use 'text', 'csv' or 'json'."%format)
@@ -3,6 +3,7 @@ Projection and related classes.
 """
 
 from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 
 import numpy
 from numpy import array,asarray,ones,sometrue, logical_and, logical_or
@@ -203,6 +204,12 @@ class Projection(EPConnection):
     # (and see other classes where it's defined, e.g. Sheet)
     precedence = param.Number(default=0.5)
 
+    # True if activate() changes nothing but this Projection's own
+    # state (e.g. its activity and input_buffer), so that it can run
+    # in a separate thread at the same time as other Projections'
+    # activate(); see ProjectionSheet.activation_threads.
+    concurrent_activate = False
+
 
     def __init__(self,**params):
         super(Projection,self).__init__(**params)
@@ -390,6 +397,9 @@ class ProjectionSheet(Sheet):
 
     src_ports=['Activity']
 
+    # See Simulation.process_threads
+    concurrent_process_current_time = True
+
     # CEBALERT: why isn't this a parameter of Sheet?
     # Should be a MaskParameter for safety
     #mask = ClassSelectorParameter(SheetMask,default=SheetMask(),instantiate=True,doc="""
@@ -413,10 +423,31 @@ class ProjectionSheet(Sheet):
         depends on the implementation of learning and learning output
         functions.""")
 
+    activation_threads = param.Integer(default=0,bounds=(0,None),doc="""
+        Number of threads to use for activating incoming Projections.
+
+        If zero (the default), each Projection is activated as soon as
+        its input arrives.  Otherwise, the activation of Projections
+        that support it (see Projection.concurrent_activate, e.g. all
+        CFProjections) is postponed until all the input for the
+        current time has arrived, and then these Projections are
+        activated at the same time on a pool of this many threads.
+        The results are identical to activating them one at a time,
+        but there is only a speedup if the Projections' response
+        functions release the GIL (as the C dot-product response
+        functions do); Projections must also not share any mutable
+        state, such as a single output_fn instance.""")
+
+
+    # Flat indices of the active units, computed once at the start of
+    # learn() (see active_unit_indices())
+    _active_units = None
+
 
     def __init__(self, **params):
         super(ProjectionSheet,self).__init__(**params)
         self.new_input = False
+        self._pending_activations = []
         self.mask.sheet = self
         self.old_a = self.activity.copy()*0.0
         self.views['RFs'] = Layout()
@@ -444,6 +475,26 @@ class ProjectionSheet(Sheet):
         self.new_input = True
 
 
+    def _activate_pending(self):
+        """
+        Activate all the Projections whose activation was postponed by
+        present_input() (see activation_threads), waiting until they
+        have all finished.
+
+        Must be called before anything that uses the Projections'
+        activity or input_buffer, such as activate() and learn().
+        """
+        pending = self.__dict__.get('_pending_activations')
+        if not pending:
+            return
+        self._pending_activations = []
+        if len(pending)==1:
+            conn,input_activity = pending[0]
+            conn.activate(input_activity)
+        else:
+            _activation_pool(self.activation_threads).map(_activate,pending,chunksize=1)
+
+
     def _port_match(self,key,portlist):
         """
         Returns True if the given key matches any port on the given list.
@@ -505,6 +556,7 @@ class ProjectionSheet(Sheet):
         calculate activity in that subclass.
         """
 
+        self._activate_pending()
         self.activity *= 0.0
         tmp_dict={}
 
@@ -553,12 +605,38 @@ class ProjectionSheet(Sheet):
         Called from self.process_current_time() _after_ activity has
         been propagated.
         """
-        for proj in self.in_connections:
-            if not isinstance(proj,Projection):
-                self.debug("Skipping non-Projection "+proj.name)
-            else:
-                proj.learn()
-                proj.apply_learn_output_fns()
+        self._activate_pending()
+        self._active_units = self.active_unit_indices()
+        try:
+            for proj in self.in_connections:
+                if not isinstance(proj,Projection):
+                    self.debug("Skipping non-Projection "+proj.name)
+                else:
+                    proj.learn()
+                    proj.apply_learn_output_fns()
+        finally:
+            self._active_units = None
+
+
+    def active_unit_indices(self):
+        """
+        Return a read-only int32 array of the flat indices (in
+        increasing order) of the units that are active (i.e. have
+        nonzero activity) and are not excluded by the sheet mask.
+
+        These are the only units whose weights change when learning
+        functions and weights output functions skip inactive units
+        (see allow_skip_non_responding_units), so the optimized ones
+        process just these units rather than testing every unit.  The
+        activity does not change during learn(), so the array is
+        computed once at its start and then shared by all the
+        Projections and their functions.
+        """
+        if self._active_units is not None:
+            return self._active_units
+        indices = numpy.flatnonzero(logical_and(self.activity,self.mask.data)).astype(numpy.int32)
+        indices.flags.writeable = False
+        return indices
 
 
     def present_input(self,input_activity,conn):
@@ -567,9 +645,17 @@ class ProjectionSheet(Sheet):
         equal to the specified port, asking each one to compute its activity.
 
         The sheet's own activity is not calculated until activate()
-        is called.
+        is called.  If activation_threads is nonzero, the Projection
+        may not compute its activity until activate() is called,
+        either.
         """
-        conn.activate(input_activity)
+        if self.activation_threads and conn.concurrent_activate:
+            self.__dict__.setdefault('_pending_activations',[]).append((conn,input_activity))
+        else:
+            # Keep the Projections' activations in the order their
+            # input arrived
+            self._activate_pending()
+            conn.activate(input_activity)
 
 
     def projections(self,name=None):
@@ -642,6 +728,7 @@ class ProjectionSheet(Sheet):
         """
         Subclasses Sheet state_push to also push projection activities.
         """
+        self._activate_pending()
         super(ProjectionSheet, self).state_push()
         for p in self.projections().values(): p.state_push()
 
@@ -650,6 +737,7 @@ class ProjectionSheet(Sheet):
         """
         Subclasses Sheet state_pop to also pop projection activities.
         """
+        self._activate_pending()
         super(ProjectionSheet, self).state_pop()
         for p in self.projections().values(): p.state_pop()
 
@@ -684,6 +772,22 @@ class ProjectionSheet(Sheet):
                     if isinstance(p,Projection)])
 
 
+# Thread pools used by ProjectionSheet.activation_threads, shared by
+# all sheets using the same number of threads.
+_activation_pools = {}
+
+def _activation_pool(n_threads):
+    pool = _activation_pools.get(n_threads)
+    if pool is None:
+        pool = _activation_pools[n_threads] = ThreadPool(n_threads)
+    return pool
+
+def _activate(pending):
+    conn,input_activity = pending
+    conn.activate(input_activity)
+
+
+
 # CEBALERT: untested
 class NeighborhoodMask(SheetMask):
     """
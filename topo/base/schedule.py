@@ -0,0 +1,570 @@
+"""
+Static schedules for simulations whose events repeat periodically.
+
+In most models the connections and their delays are fixed, and the
+simulation is driven by PeriodicEventSequences (e.g. the input
+presentations of GeneratorSheets), so that every period of simulation
+time consists of exactly the same sequence of event deliveries and
+process_current_time() calls.  A CompiledSchedule records one such
+period as the Simulation's event engine processes it, and thereafter
+replays the recording as a flat plan: the data sent on each connection
+waits in a first-in first-out queue for that connection until its
+planned delivery, and the recorded function calls and
+process_current_time() calls are made in the recorded order.  The
+events are still created by send_output(), but are no longer copied,
+queued or sorted on the Simulation's event queue.
+
+The replay is checked against the plan as it goes, and the schedule
+hands back to the event engine (putting all its pending events back
+on the event queue) whenever the simulation departs from it: when an
+event not in the plan is due, when data is sent on an unexpected
+connection or expected data is not sent, or when the connections,
+their delays, the EventProcessors or the periodic event sequences
+change.  Replay resumes at the start of a later period if the pending
+events match the plan again.
+
+See Simulation.compile_schedule().
+"""
+
+import heapq
+from collections import deque
+from copy import copy
+
+from topo.base.simulation import EPConnectionEvent, FunctionEvent, \
+     EventSequence, PeriodicEventSequence, _time_key
+
+
+# Kinds of step in a plan.  Each step is a tuple (kind,arg,sends),
+# where sends lists the connections on which the step is expected to
+# send data, in order.
+_TIME = 0      # arg: time from the start of the period; advance to it
+_DELIVER = 1   # arg: connection whose oldest data is delivered
+_CALL = 2      # arg: FunctionEvent whose function is called
+_SEQUENCE = 3  # arg: number of events enqueued by an EventSequence
+_PROCESS = 4   # arg: EventProcessors whose process_current_time() is called
+
+# Number of periods recorded before giving up on a model whose events
+# do not repeat (e.g. because it is still starting up)
+_MAX_ATTEMPTS = 5
+
+
+def _event_key(event):
+    # Key identifying the copies of an event (or the periodic
+    # sequence) playing the same role in every period, or None if the
+    # event cannot be part of a plan.  Subclasses might behave
+    # differently, so only these exact classes are supported.
+    cls = event.__class__
+    if cls is PeriodicEventSequence:
+        return (cls,id(event.sequence),event.period)
+    elif cls is EventSequence:
+        return (cls,id(event.sequence))
+    elif cls is FunctionEvent:
+        return (cls,event.fn,event.args,event.kw)
+    return None
+
+
+def _same(a,b):
+    # Compare event keys, falling back to identity for values (such
+    # as arrays) that cannot be compared with ==
+    if a is b:
+        return True
+    if type(a) is not type(b):
+        return False
+    if isinstance(a,tuple):
+        return len(a)==len(b) and all(_same(x,y) for x,y in zip(a,b))
+    if isinstance(a,dict):
+        return sorted(a)==sorted(b) and all(_same(a[k],b[k]) for k in a)
+    try:
+        return bool(a==b)
+    except Exception:
+        return False
+
+
+def _common_period(periods):
+    # Smallest multiple of the first period that is a whole multiple
+    # of all the others, or None if there is no small one
+    period = periods[0]
+    for p in periods[1:]:
+        for k in range(1,1001):
+            r = (k*period)/p
+            if r == int(r):
+                period = k*period
+                break
+        else:
+            return None
+    return period
+
+
+class _PendingEvent(object):
+    """
+    A non-connection event that is pending during part of the
+    recorded period: enqueued during step 'enqueued' (-1 if it was
+    already pending at the start of the period), and delivered by
+    step 'delivered' (the number of steps if it is still pending at
+    the end).  time and counter are relative to the start of the
+    period.
+    """
+    __slots__ = ['enqueued','delivered','time','counter','key','event']
+
+    def __init__(self,enqueued,time,counter,event):
+        self.enqueued = enqueued
+        self.delivered = None
+        self.time = time
+        self.counter = counter
+        self.key = _event_key(event)
+        self.event = event
+
+
+
+class CompiledSchedule(object):
+    """
+    Records one period of a Simulation's events, then replays the
+    recording for as long as the simulation follows it.
+
+    Created by Simulation.compile_schedule(); the Simulation's run()
+    calls run() instead of running the event engine itself, and
+    calls materialize() whenever the event queue is to be inspected
+    or changed.
+    """
+    # Not a Parameterized, for the same (performance) reason as Event.
+
+    def __init__(self,sim,period=None):
+        self.sim = sim
+        self.period = period
+        self.plan = None
+        self.failed = False
+        self.active = False
+        self._recording = False
+        self._attempts = 0
+        self._misses = 0
+
+
+    def run(self,stop_key):
+        """Run the simulation until stop_key, replaying wherever possible."""
+        sim = self.sim
+        did_event = False
+        try:
+            if self.active and not self._current():
+                self.materialize()
+            while True:
+                if self.active:
+                    if self._replay(stop_key):
+                        return
+                    did_event = self._did_event
+                if self._recording:
+                    sim._enqueue_hook = self._record_enqueue
+                observer = None if self.failed else self
+                if not sim._run_events(stop_key,did_event,observer):
+                    return
+                did_event = False
+        finally:
+            sim._enqueue_hook = None
+            if self.failed and sim._schedule is self:
+                sim._schedule = None
+
+
+    def _current(self):
+        # Whether replay can continue from where it stopped: the model
+        # is unchanged, and the time has not been moved past the next
+        # step.
+        if self._signature() != self.signature:
+            self.plan = None
+            return False
+        kind,arg,sends = self.plan[self._index]
+        return _time_key(self.sim.time()) <= _time_key(self._base+arg)
+
+
+    def _signature(self):
+        # Everything the plan depends on, other than the pending events
+        sim = self.sim
+        eps = sim._event_processors.values()
+        return (frozenset((c,c.src,c.dest,c.delay) for c in sim.connections()),
+                frozenset(eps),
+                frozenset(ep for ep in eps if ep.always_process_current_time),
+                tuple(tuple((id(e),e.time,tuple(map(id,e.__dict__.values())))
+                            for e in sequence) for sequence in self._sequences))
+
+
+    ### Recording (called by Simulation._run_events())
+
+    def boundary(self,time):
+        """
+        Called before the simulation moves on to the given time (the
+        time of the next event); returns True if the schedule takes
+        over from the event engine.
+        """
+        if self.failed:
+            return False
+        if self._recording:
+            if _time_key(time) < self._end_key:
+                self._steps.append([_TIME,time-self._t0,[]])
+                return False
+            return self._finish_recording(time)
+        elif self.plan is None:
+            self._start_recording(time)
+            return False
+        else:
+            # Replay can resume at the start of any period
+            r = (time-self._t0)/self._period
+            if r == int(r):
+                return self._enter(time)
+            return False
+
+
+    def delivering(self,event):
+        """Called before the event engine delivers the given event."""
+        if not self._recording:
+            return
+        steps = self._steps
+        if event.__class__ is EPConnectionEvent:
+            if self._conns.pop(id(event),None) is None:
+                return self._abort()
+            steps.append([_DELIVER,event.conn,[]])
+        else:
+            record = self._events.pop(id(event),None)
+            if record is None or record.key is None:
+                return self._abort()
+            record.delivered = len(steps)
+            if event.__class__ is FunctionEvent:
+                steps.append([_CALL,event,[]])
+            else:
+                steps.append([_SEQUENCE,None,[]])
+
+
+    def processing(self,eps):
+        """Called before process_current_time() is called on the given EventProcessors."""
+        if self._recording:
+            self._steps.append([_PROCESS,eps,[]])
+
+
+    def stale(self):
+        """Called when the event engine discards a stale event."""
+        if self._recording:
+            self._abort()
+
+
+    def _start_recording(self,time):
+        sim = self.sim
+        queue = sorted(sim._event_queue)
+        periodic = [e for (k,n,e) in queue if e.__class__ is PeriodicEventSequence]
+        period = self.period
+        if period is None and periodic:
+            period = _common_period(list(set(e.period for e in periodic)))
+        if not period:
+            return self._fail("no period was specified, and the PeriodicEventSequences "
+                              "on the event queue do not have a common period")
+
+        self._period = period
+        self._t0 = time
+        self._end_key = _time_key(time+period)
+        self._counter0 = sim._event_counter
+        self._sequences = [e.sequence for e in periodic]
+        self.signature = self._signature()
+
+        # Pending connection events, as (time,counter,conn) by id
+        self._conns = {}
+        # Pending other events, as _PendingEvents by id
+        self._events = {}
+        self._conns_at_start = []
+        self._records = []
+        for key,n,e in queue:
+            if e.__class__ is EPConnectionEvent:
+                entry = self._conns[id(e)] = (e.time-time,n-self._counter0,e.conn)
+                self._conns_at_start.append(entry)
+            else:
+                record = self._events[id(e)] = _PendingEvent(-1,e.time-time,n-self._counter0,e)
+                self._records.append(record)
+
+        self._steps = [[_TIME,time-time,[]]]
+        self._recording = True
+        sim._enqueue_hook = self._record_enqueue
+
+
+    def _record_enqueue(self,event):
+        sim = self.sim
+        step = self._steps[-1]
+        n = sim._event_counter-self._counter0
+        if event.__class__ is EPConnectionEvent:
+            self._conns[id(event)] = (event.time-self._t0,n,event.conn)
+            step[2].append(event.conn)
+        else:
+            record = self._events[id(event)] = _PendingEvent(len(self._steps)-1,event.time-self._t0,n,event)
+            self._records.append(record)
+            step[2].append(record)
+        sim._push_event(event)
+
+
+    def _abort(self):
+        # Stop recording; a new recording starts at the next boundary
+        self._recording = False
+        self._steps = self._conns = self._events = self._records = None
+        self.sim._enqueue_hook = None
+
+
+    def _fail(self,reason):
+        self._abort()
+        self.failed = True
+        self.sim.warning("Not using a compiled schedule (%s); using the event engine instead."%reason)
+        return False
+
+
+    def _finish_recording(self,time):
+        sim = self.sim
+        steps,records = self._steps,self._records
+        self._recording = False
+        sim._enqueue_hook = None
+        P = self._period
+        n_steps = len(steps)
+
+        # Only EventSequences can be replayed without calling them
+        # (by counting the events they enqueue)
+        for kind,arg,sent in steps:
+            if kind!=_SEQUENCE and any(isinstance(x,_PendingEvent) for x in sent):
+                return self._fail("events other than connection events are "
+                                  "scheduled by a function or an EventProcessor")
+
+        # Events pending throughout the period (e.g. a command
+        # scheduled for later) are not part of the plan
+        records = [r for r in records if not (r.enqueued<0 and r.delivered is None)]
+        for r in records:
+            if r.delivered is None:
+                r.delivered = n_steps
+
+        # The events pending at the end must be those pending at the
+        # start, shifted by one period.
+        N = sim._event_counter-self._counter0
+        start = [(rel,off,conn,None) for rel,off,conn in self._conns_at_start]
+        start+= [(r.time,r.counter,None,r) for r in records if r.enqueued<0]
+        end = [(rel-P,off-N,conn,None) for rel,off,conn in self._conns.values()]
+        end+= [(r.time-P,r.counter-N,None,r) for r in records if r.delivered==n_steps]
+        order = lambda entry: (_time_key(entry[0]),entry[1])
+        start.sort(key=order)
+        end.sort(key=order)
+        periodic = _time_key(time)==self._end_key and len(start)==len(end) and \
+            all(order(a)==order(b) and a[2] is b[2] and
+                (a[3] is None)==(b[3] is None) and (a[3] is None or _same(a[3].key,b[3].key))
+                for a,b in zip(start,end))
+
+        if not periodic or self._signature()!=self.signature:
+            self._attempts += 1
+            if self._attempts >= _MAX_ATTEMPTS:
+                return self._fail("the events do not repeat with period %s"%P)
+            self._start_recording(time)
+            return False
+
+        self.plan = [(kind,len(sent),()) if kind==_SEQUENCE else (kind,arg,tuple(sent))
+                     for kind,arg,sent in steps]
+        self._records = records
+        self._start = start
+        self._plan_conns = set(conn for conn in sim.connections())
+        self._steps = self._conns = self._events = self._conns_at_start = None
+        self._attempts = 0
+        return self._enter(time)
+
+
+    ### Replay
+
+    def _enter(self,time):
+        # Start replaying the plan at the start of a period (the given
+        # time), if the pending events are those expected; otherwise
+        # leave the event engine to carry on.
+        sim = self.sim
+        if self._signature()!=self.signature:
+            # The model has changed, so the plan is of no use
+            self.plan = None
+            self._misses = 0
+            self._start_recording(time)
+            return False
+
+        time_key = _time_key(time)
+        expected = self._start
+        matched,foreign = [],[]
+        j = 0
+        for entry in sorted(sim._event_queue):
+            if j < len(expected):
+                rel,off,conn,record = expected[j]
+                e = entry[2]
+                if entry[0]==_time_key(time+rel) and (
+                    e.conn is conn if e.__class__ is EPConnectionEvent else
+                    (record is not None and _same(_event_key(e),record.key))):
+                    matched.append((entry,record))
+                    j += 1
+                    continue
+            foreign.append(entry)
+
+        if j < len(expected):
+            self._misses += 1
+            if self._misses >= 2:
+                # e.g. the model has been changed in a way the
+                # signature does not reveal
+                self.plan = None
+                self._misses = 0
+                self._start_recording(time)
+            return False
+        if foreign and min(foreign)[0] <= time_key:
+            # an event not in the plan is due now
+            return False
+
+        self._fifos = dict((conn,deque()) for conn in self._plan_conns)
+        self._periodic = {}
+        self._entry_events = {}
+        for entry,record in matched:
+            e = entry[2]
+            if record is None:
+                self._fifos[e.conn].append(entry)
+            else:
+                self._entry_events[record] = entry
+                if record.key[0] is PeriodicEventSequence:
+                    self._periodic[record.key[1]] = e
+
+        heapq.heapify(foreign)
+        sim._event_queue = foreign
+        self._base = time
+        self._counter = sim._event_counter
+        self._index = 0
+        self._did_event = False
+        self._diverged = False
+        self._misses = 0
+        self.active = True
+        return True
+
+
+    def _replay(self,stop_key):
+        # Follow the plan until the next time would be after stop_key
+        # (returning True), or until the simulation departs from the
+        # plan (returning False, with the pending events back on the
+        # event queue).
+        sim = self.sim
+        plan = self.plan
+        n_steps = len(plan)
+        fifos = self._fifos
+        i = self._index
+        now_key = _time_key(sim.time())
+        sim._enqueue_hook = self._replay_enqueue
+        try:
+            while True:
+                if i == n_steps:
+                    if self._signature()!=self.signature:
+                        self._index = i
+                        self.materialize()
+                        self.plan = None
+                        return False
+                    i = 0
+                    self._base += self._period
+                    self._counter = sim._event_counter
+                    self._entry_events = {}
+
+                kind,arg,sends = plan[i]
+                if kind is _TIME:
+                    target = self._base+arg
+                    key = _time_key(target)
+                    if stop_key is not None and key > stop_key:
+                        self._index = i
+                        return True
+                    queue = sim._event_queue
+                    if queue and queue[0][0] <= key:
+                        # an event not in the plan is due
+                        self._index = i
+                        self.materialize()
+                        return False
+                    if key > now_key:
+                        sim.sleep(target-sim.time())
+                        now_key = _time_key(sim.time())
+                    i += 1
+                    continue
+
+                self._sends = sends
+                self._sent = 0
+                if kind is _DELIVER:
+                    fifo = fifos[arg]
+                    if not fifo or fifo[0][0]!=now_key:
+                        self._index = i
+                        self.materialize()
+                        return False
+                    self._index = i+1
+                    self._did_event = True
+                    event = fifo.popleft()[2]
+                    if sim._profiler is None:
+                        event(sim)
+                    else:
+                        sim._profiler.deliver(event)
+                elif kind is _CALL:
+                    self._index = i+1
+                    self._did_event = True
+                    if sim._profiler is None:
+                        arg(sim)
+                    else:
+                        sim._profiler.deliver(arg)
+                elif kind is _SEQUENCE:
+                    self._index = i+1
+                    self._did_event = True
+                    sim._event_counter += arg
+                else:
+                    self._index = i+1
+                    self._did_event = False
+                    sim._eps_with_input = set()
+                    if sim._deferred_pushes:
+                        sim._complete_state_pushes(arg)
+                    if sim.process_threads and len(arg)>1:
+                        sim._process_current_time_concurrently(arg)
+                    else:
+                        for ep in arg:
+                            ep.process_current_time()
+
+                if not self.active:
+                    # materialized during the step
+                    return False
+                if self._diverged or self._sent!=len(sends):
+                    self.materialize()
+                    return False
+                now_key = _time_key(sim.time())
+                i += 1
+        finally:
+            sim._enqueue_hook = None
+
+
+    def _replay_enqueue(self,event):
+        sim = self.sim
+        n = self._sent
+        sends = self._sends
+        if self.active and n < len(sends) and event.__class__ is EPConnectionEvent \
+               and event.conn is sends[n]:
+            self._sent = n+1
+            self._fifos[event.conn].append((_time_key(event.time),sim._event_counter,event))
+            sim._event_counter += 1
+        else:
+            self._diverged = True
+            sim._push_event(event)
+
+
+    def materialize(self):
+        """
+        Put all the pending events back on the Simulation's event
+        queue, exactly as the event engine would have left them, and
+        stop replaying (or recording) until the start of a later
+        period.
+        """
+        if self._recording:
+            self._abort()
+        if not self.active:
+            return
+        self.active = False
+        sim = self.sim
+        i,base,counter = self._index,self._base,self._counter
+        queue = sim._event_queue
+        for fifo in self._fifos.values():
+            queue.extend(fifo)
+        for record in self._records:
+            if record.enqueued < i <= record.delivered:
+                if record in self._entry_events:
+                    # still pending from before replay started
+                    queue.append(self._entry_events[record])
+                    continue
+                if record.key[0] is PeriodicEventSequence:
+                    e = self._periodic[record.key[1]]
+                else:
+                    e = copy(record.event)
+                e.time = base+record.time
+                queue.append((_time_key(e.time),counter+record.counter,e))
+        heapq.heapify(queue)
+        self._fifos = self._periodic = self._entry_events = None
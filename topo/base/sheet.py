@@ -17,7 +17,9 @@ scale it up to run at higher densities (or down for lower densities)
 simply by changing e.g. Sheet.nominal_density.
 """
 
-from numpy import zeros,array,arange,meshgrid
+import sys
+
+from numpy import zeros,array,arange,meshgrid,ndarray,copyto
 from numpy import float64
 
 import param
@@ -26,7 +28,7 @@ from holoviews import Image, Layout
 from holoviews.core import BoundingBox, BoundingRegionParameter, SheetCoordinateSystem
 from holoviews.interface.collector import AttrDict
 
-from simulation import EventProcessor
+from simulation import EventProcessor,EPConnectionEvent
 from functionfamily import TransferFn
 
 activity_type = float64
@@ -103,6 +105,19 @@ class Sheet(EventProcessor,SheetCoordinateSystem):  # pylint: disable-msg=W0223
        could be used to indicate a left, LGN Sheet with ON-surround
        receptive fields.""")
 
+    zero_copy_output = param.Boolean(default=False,doc="""
+       Whether to send array output without copying it for each
+       outgoing connection.
+
+       If True, each array sent by send_output() is copied once into
+       a read-only snapshot buffer, and every connection receives a
+       view of that same snapshot.  Snapshot buffers are taken from a
+       small pool owned by this Sheet, and a buffer is reused only
+       once no event or receiver holds a reference to it any longer,
+       so in steady state no new arrays are allocated.  A receiver
+       that tries to write into the data it was sent will raise a
+       ValueError, because the data is shared with other receivers.""")
+
 
     def _get_density(self):
         return self.xdensity
@@ -134,6 +149,9 @@ class Sheet(EventProcessor,SheetCoordinateSystem):  # pylint: disable-msg=W0223
         # setup the activity matrix
         self.activity = zeros(self.shape,activity_type)
 
+        # Pool of read-only snapshot buffers for zero_copy_output
+        self._output_buffers = []
+
         # For non-plastic inputs
         self.__saved_activity = []
         self._plasticity_setting_stack = []
@@ -193,6 +211,55 @@ class Sheet(EventProcessor,SheetCoordinateSystem):  # pylint: disable-msg=W0223
         return self.row_col_sheetcoords()[1]
 
 
+    def _output_snapshot(self,data):
+        """
+        Return a read-only copy of the array data, stored in a buffer
+        from this Sheet's pool of output buffers.
+
+        A pooled buffer is free for reuse when nothing outside the
+        pool refers to it (any view of a buffer refers to the buffer
+        itself); if no buffer of the right shape and type is free, a
+        new one is added to the pool.
+        """
+        # (for Sheets created before zero_copy_output was added)
+        pool = self.__dict__.setdefault('_output_buffers',[])
+
+        for buf in pool:
+            # referenced only by the pool, buf, and getrefcount's argument
+            if sys.getrefcount(buf)==3 and buf.shape==data.shape and buf.dtype==data.dtype:
+                buf.flags.writeable = True
+                break
+        else:
+            buf = ndarray(data.shape,data.dtype)
+            pool.append(buf)
+
+        copyto(buf,data)
+        buf.flags.writeable = False
+        return buf
+
+
+    def send_output(self,src_port=None,data=None):
+        """
+        Send some data out to all connections on the given src_port.
+
+        If zero_copy_output is True and data is an array, all the
+        connections share a single read-only snapshot of the data
+        (see zero_copy_output); otherwise the data is copied as
+        described for EventProcessor.send_output().
+        """
+        if not (self.zero_copy_output and isinstance(data,ndarray)):
+            super(Sheet,self).send_output(src_port=src_port,data=data)
+            return
+
+        snapshot = self._output_snapshot(data)
+        time = self.simulation.time()
+        for conn in self.out_connections:
+            if self._port_match(conn.src_port,[src_port]):
+                e = EPConnectionEvent(self.simulation.convert_to_time_type(conn.delay)+time,
+                                      conn,snapshot.view(),deep_copy=False)
+                self.simulation.enqueue_event(e)
+
+
     # CEBALERT: haven't really thought about what to put in this. The
     # way it is now, subclasses could make a super.activate() call to
     # avoid repeating some stuff.
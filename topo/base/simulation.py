@@ -17,9 +17,10 @@ computation, and each can contain any arbitrary Python data.  A
 simulation begins by giving each EventProcessor an opportunity to send
 any initial events.  It then proceeds by processing and delivering
 events to EventProcessors in time order.  After all events for the
-current time are processed, the simulation gives each EventProcessor a
-chance to do any final computation, after which simulation time skips
-to the time of the earliest event remaining in the queue.
+current time are processed, the simulation gives each EventProcessor
+that received input at that time a chance to do any final
+computation, after which simulation time skips to the time of the
+earliest event remaining in the queue.
 
 
 PORTS
@@ -53,11 +54,27 @@ special dest_port.
 import param
 
 from copy import copy, deepcopy
+from collections import OrderedDict
 import time
-import bisect
+import heapq
+import threading
+from multiprocessing.pool import ThreadPool
 
 from holoviews.interface.collector import AttrDict
 
+from ticktime import TickTime
+
+# Thread pools used by Simulation.process_threads, shared by all
+# Simulations using the same number of threads.
+_thread_pools = {}
+
+def _thread_pool(n_threads):
+    pool = _thread_pools.get(n_threads)
+    if pool is None:
+        pool = _thread_pools[n_threads] = ThreadPool(n_threads)
+    return pool
+
+
 #: Default path to the current simulation, from main
 #: Only to be used by script_repr(), to allow it to generate
 #: a runnable script
@@ -89,6 +106,19 @@ class EventProcessor(param.Parameterized):
 
     src_ports=[None]
 
+    # By default, the simulation calls process_current_time() only on
+    # EventProcessors that have received an EPConnectionEvent at the
+    # current time. Subclasses that need to be called whenever any
+    # event has been delivered (e.g. because their state is changed by
+    # FunctionEvents or CommandEvents) can set this to True.
+    always_process_current_time = False
+
+    # True if process_current_time() may be called in a separate
+    # thread, at the same time as that of other EventProcessors (see
+    # Simulation.process_threads), i.e. if it changes only the state
+    # of this EventProcessor and the events it sends.
+    concurrent_process_current_time = False
+
 
     def __init__(self,**params):
         """
@@ -226,14 +256,34 @@ class EventProcessor(param.Parameterized):
     def process_current_time(self):
         """
         Called by the simulation before advancing the simulation
-        time.  Allows the event processor to do any computation that
-        requires that all events for this time have been delivered.
-        Computations performed in this method should not generate any
-        events with a zero time delay, or else causality could be
-        violated. (By default, does nothing.)
+        time, if input_event() has been called at the current time
+        (or for every time at which an event was delivered, if
+        always_process_current_time is True).  Allows the event
+        processor to do any computation that requires that all events
+        for this time have been delivered.  Computations performed in
+        this method should not generate any events with a zero time
+        delay, or else causality could be violated. (By default, does
+        nothing.)
         """
         pass
 
+    def complete_state_push(self):
+        """
+        Save any state of this EventProcessor that a
+        Simulation.state_push() has postponed saving (see
+        Simulation.copy_on_write_state).
+
+        Called automatically before an event is delivered to this
+        EventProcessor and before its process_current_time() method
+        is called; code that otherwise changes the state of an
+        EventProcessor between a state_push() and the corresponding
+        state_pop() (e.g. by writing to a Sheet's activity directly)
+        must call it first.
+        """
+        sim = self.simulation
+        if sim is not None and sim._deferred_pushes:
+            sim._complete_state_pushes([self])
+
     def script_repr(self,imports=[],prefix="    "):
         """Generate a runnable command for creating this EventProcessor."""
         return _simulation_path+"['"+self.name+"']="+\
@@ -388,10 +438,31 @@ class EPConnection(param.Parameterized):
                ",\n"+prefix+(",\n"+prefix).join(settings) + ")"
 
 
+def _time_key(t):
+    """
+    Return the value by which time t is ordered in the event queue.
+
+    When the simulation time type is TickTime, this is the plain
+    integer number of ticks, so that events can be ordered without
+    the overhead of comparing TickTime objects; times of other types
+    (e.g. an event created with a float time) are converted, so that
+    they are ordered by their values rather than compared with tick
+    counts.  For other time types, times are used as they are.
+    """
+    if param.Dynamic.time_fn.time_type is TickTime:
+        return t.ticks if t.__class__ is TickTime else TickTime(t).ticks
+    return t
+
+
 # CB: event is not a Parameterized because of a (small) performance hit.
 class Event(object):
     """Hierarchy of classes for storing simulation events of various types."""
 
+    # Whether delivering an Event of this class may change the Event
+    # itself (e.g. its time), in which case Simulation.event_push()
+    # must save a copy of it rather than the Event itself.
+    changed_by_delivery = True
+
     def __init__(self,time):
         self.time = time
 
@@ -412,12 +483,7 @@ class Event(object):
         NOTE: identity comparisons should always be done using the
         'is' operator, not '=='.
         """
-        if self.time > ev.time:
-            return 1
-        elif self.time < ev.time:
-            return -1
-        else:
-            return 0
+        return cmp(_time_key(self.time),_time_key(ev.time))
 
 
 class EPConnectionEvent(Event):
@@ -438,6 +504,8 @@ class EPConnectionEvent(Event):
     to avoid the copy.
     """
 
+    changed_by_delivery = False
+
     def __init__(self,time,conn,data=None,deep_copy=True):
         super(EPConnectionEvent,self).__init__(time)
         assert isinstance(conn,EPConnection)
@@ -445,7 +513,11 @@ class EPConnectionEvent(Event):
         self.conn = conn
 
     def __call__(self,sim):
-        self.conn.dest.input_event(self.conn,self.data)
+        dest = self.conn.dest
+        if sim._deferred_pushes:
+            sim._complete_state_pushes([dest])
+        sim._eps_with_input.add(dest)
+        dest.input_event(self.conn,self.data)
 
     def __repr__(self):
         return "EPConnectionEvent(time="+`self.time`+",conn="+`self.conn`+")"
@@ -454,6 +526,8 @@ class EPConnectionEvent(Event):
 class CommandEvent(Event):
     """An Event consisting of a command string to execute."""
 
+    changed_by_delivery = False
+
     def __init__(self,time,command_string):
         """
         Add the event to the simulation.
@@ -491,6 +565,9 @@ class CommandEvent(Event):
 
         param.Parameterized(name='CommandEvent').message("Running command %s",
                                                          self.command_string)
+        # the command may change any EventProcessor
+        if sim._deferred_pushes:
+            sim._complete_state_pushes()
         try:
             exec self.command_string in __main__.__dict__
         except:
@@ -511,7 +588,13 @@ class CommandEvent(Event):
 class FunctionEvent(Event):
     """
     Event that executes a given function function(*args,**kw).
+
+    If the function is a method of an EventProcessor, it is assumed
+    to change only that EventProcessor's state; any other function
+    may change any EventProcessor.
     """
+    changed_by_delivery = False
+
     def __init__(self,time,fn,*args,**kw):
         super(FunctionEvent,self).__init__(time)
         self.fn = fn
@@ -519,6 +602,9 @@ class FunctionEvent(Event):
         self.kw = kw
 
     def __call__(self,sim):
+        if sim._deferred_pushes:
+            ep = getattr(self.fn,'__self__',None)
+            sim._complete_state_pushes([ep] if isinstance(ep,EventProcessor) else None)
         self.fn(*self.args,**self.kw)
 
     def __repr__(self):
@@ -532,6 +618,8 @@ class EventSequence(Event):
     The .time attributes of the events in the sequence are interpreted
     as offsets relative to the start time of the sequence itself.
     """
+    changed_by_delivery = False
+
     def __init__(self,time,sequence):
         super(EventSequence,self).__init__(time)
         self.sequence = sequence
@@ -560,6 +648,8 @@ class PeriodicEventSequence(EventSequence):
     will be scheduled.   If the length of the sequence is longer than
     the period, then the length of the sequence will be used as the period.
     """
+    # (reschedules itself by changing its time)
+    changed_by_delivery = True
     ## JPHACKALERT: This should really be refactored into a
     ## PeriodicEvent class that periodically executes a single event,
     ## then the user can construct a periodic sequence using a
@@ -837,15 +927,16 @@ class OptionalSingleton(object):
 
 
 
-# Simulation stores its events in a linear-time priority queue (i.e., a
-# sorted list.) For efficiency, e.g. for spiking neuron simulations,
-# we'll probably need to replace the linear priority queue with a more
-# efficient one.  Jeff has an O(log N) minheap implementation, but
-# there are likely to be many others to select from.
+# Simulation stores its events in a binary minheap (see the heapq
+# module), so that enqueueing and delivering an event are both
+# O(log N) in the length of the queue.  Each heap entry is a
+# (time,sequence_number,event) tuple; the sequence number increases
+# monotonically as events are enqueued, which keeps 'simultaneous'
+# events FIFO and means the events themselves are never compared.
 #
 class Simulation(param.Parameterized,OptionalSingleton):
     """
-    A simulation class that uses a simple sorted event list (instead of
+    A simulation class that uses a priority queue of events (instead of
     e.g. a sched.scheduler object) to manage events and dispatching.
 
     Simulation is a singleton: there is only one instance of
@@ -891,10 +982,73 @@ class Simulation(param.Parameterized,OptionalSingleton):
         'timestr'.
         """)
 
+    process_threads = param.Integer(default=0,bounds=(0,None),doc="""
+        Number of threads to use for calling the EventProcessors'
+        process_current_time() methods at the end of each time.
+
+        If zero (the default), each EventProcessor is processed in
+        turn.  Otherwise, EventProcessors that support it (see
+        EventProcessor.concurrent_process_current_time, e.g. all
+        ProjectionSheets) are processed at the same time on a pool of
+        this many threads, except that EventProcessors joined by
+        connections with zero delay are always processed one after
+        another in the same thread.  The events they send are
+        enqueued in the same order as without threads, so the results
+        are identical; the EventProcessors must not share any mutable
+        state (such as a global random number generator), and there
+        is only a speedup if their computations release the GIL.""")
+
+    copy_on_write_state = param.Boolean(default=False,doc="""
+        Whether state_push() should postpone asking each
+        EventProcessor to save its state until just before the
+        EventProcessor's state is first changed (i.e. before an event
+        is delivered to it, its process_current_time() method is
+        called, or its complete_state_push() method is called).
+
+        Measurements typically run the simulation for a short time
+        between state_push() and state_pop(), often reaching only some
+        of the EventProcessors; with this option, the state of the
+        others is never copied, and state_pop() has nothing to restore
+        for them.
+
+        Only enable this if all code run between state_push() and
+        state_pop() calls complete_state_push() on an EventProcessor
+        before changing it directly (e.g. by writing to a Sheet's
+        activity, as wipe_out_activity() and
+        GeneratorSheet.set_input_generator() do).  Otherwise the
+        EventProcessor's state is saved only after the change, so
+        state_pop() silently restores the changed state instead of
+        the state at the time of the state_push().""")
+
     eps_to_start = []
 
     name = param.Parameter(constant=False)
 
+    # If not None, a callable that enqueue_event() passes each event
+    # to instead of putting it on the event queue itself; used to
+    # collect the events sent from each thread during a concurrent
+    # call to the EventProcessors' process_current_time() methods,
+    # and by a CompiledSchedule.
+    _enqueue_hook = None
+
+    # CompiledSchedule in use, if any (see compile_schedule())
+    _schedule = None
+
+    # Partition in use, if any (see partition())
+    _partition = None
+
+    # ComponentProfiler timing the simulation, if any, and the most
+    # recent one (see start_profiling())
+    _profiler = None
+    _profile = None
+
+    # Number of state_push() calls whose saving of each
+    # EventProcessor's state has been postponed (see
+    # copy_on_write_state); the postponed levels are always the most
+    # recent ones on the EventProcessor's state stack.  (Only ever
+    # modified on an instance: see state_push().)
+    _deferred_pushes = {}
+
     forever = param.Infinity()
 
     ### Simulation(register=True) is a singleton
@@ -1022,8 +1176,12 @@ class Simulation(param.Parameterized,OptionalSingleton):
             param.parameterized.dbprint_prefix= \
                (lambda: "Time: "+self.timestr()+" ")
 
-        self.events = [] # CB: consider collections.deque? (PEP 290)
+        self._event_queue = []
+        self._event_counter = 0
+        self._schedule = None
+        self._partition = None
         self._events_stack = []
+        self._eps_with_input = set()
         self.eps_to_start = []
         self.item_scale=1.0 # this variable determines the size of each item in a diagram
 
@@ -1136,6 +1294,8 @@ class Simulation(param.Parameterized,OptionalSingleton):
 
         # remove from simulation list of eps
         del self._event_processors[ep_name]
+        if self._deferred_pushes:
+            self._deferred_pushes.pop(ep,None)
 
         # remove out_conections that go to this ep
         for conn in ep.in_connections:
@@ -1313,45 +1473,106 @@ class Simulation(param.Parameterized,OptionalSingleton):
         # Stops time going backward if until less than current time.
         stop_time = self.time() if stop_time < self.time() else stop_time
 
-        did_event = False
+        self._eps_with_input = set()
+
+        # The queue is ordered by _time_key(event.time), so the engine
+        # compares times in that form too.
+        stop_key = None if stop_time == self.forever else _time_key(stop_time)
 
-        while self.events and (stop_time == self.forever or self.time() <= stop_time):
+        if self._schedule is not None:
+            self._schedule.run(stop_key)
+        else:
+            self._run_events(stop_key)
+
+        # The time needs updating if the events have not done it.
+        #if self.events and self.events[0].time >= stop_time:
+
+        if stop_time != self.forever:
+            self.time(stop_time)
+
+    def _run_events(self,stop_key,did_event=False,observer=None):
+        """
+        Deliver events and call process_current_time() until the time
+        key (see _time_key()) passes stop_key (None meaning forever),
+        or until the event queue is empty.
+
+        did_event says whether an event has already been delivered at
+        the current time.  If an observer (e.g. a CompiledSchedule) is
+        supplied, it is told about each event delivered, each round of
+        process_current_time() calls and each stale event, and each
+        time the simulation is about to move on to the time of the
+        next event its boundary() method is called with that time; if
+        boundary() returns True, the observer takes over and this
+        method returns True immediately.
+        """
+        # Note that events may replace the queue (e.g. via
+        # state_pop()) or change the time.
+        now_key = _time_key(self.time())
+
+        if observer is not None and not did_event and self._event_queue and \
+               self._event_queue[0][0] >= now_key and \
+               (stop_key is None or self._event_queue[0][0] <= stop_key):
+            if observer.boundary(self._event_queue[0][2].time):
+                return True
+
+        while self._event_queue and (stop_key is None or now_key <= stop_key):
             # Loop while there are events and it's not time to stop.
+            next_key = self._event_queue[0][0]
 
-            if self.events[0].time < self.time():
+            if next_key < now_key:
                 # Warn and then discard events scheduled *before* the current time
-                self.warning('Discarding stale (unprocessed) event %s',repr(self.events[0]))
-                self.events.pop(0)
+                self.warning('Discarding stale (unprocessed) event %s',repr(self._event_queue[0][2]))
+                heapq.heappop(self._event_queue)
+                if observer is not None:
+                    observer.stale()
 
-            elif self.events[0].time > self.time():
+            elif next_key > now_key:
                 # Before moving on to the next time, do any processing
                 # necessary for the current time.  This is necessary only
                 # if some event has been delivered at the current time.
 
                 if did_event:
                     did_event = False
-                    #self.debug("Time to sleep; next event time: %s",self.timestr(self.events[0].time))
-                    for ep in self._event_processors.values():
-                        ep.process_current_time()
+                    #self.debug("Time to sleep; next event time: %s",self.timestr(self._event_queue[0][2].time))
+                    eps_with_input = self._eps_with_input
+                    self._eps_with_input = set()
+                    eps = [ep for ep in self._event_processors.values()
+                           if ep in eps_with_input or ep.always_process_current_time]
+                    if observer is not None:
+                        observer.processing(eps)
+                    if self._deferred_pushes:
+                        self._complete_state_pushes(eps)
+                    if self.process_threads and len(eps)>1:
+                        self._process_current_time_concurrently(eps)
+                    else:
+                        for ep in eps:
+                            ep.process_current_time()
 
                 # Set the time to the frontmost event.  Bear in mind
                 # that the front event may have been changed by the
                 # .process_current_time() calls.
-                if self.events[0].time > self.time():
-                    self.sleep(self.events[0].time - self.time())
+                if self._event_queue and self._event_queue[0][0] > now_key:
+                    if observer is not None and \
+                           (stop_key is None or self._event_queue[0][0] <= stop_key):
+                        if observer.boundary(self._event_queue[0][2].time):
+                            return True
+                    self.sleep(self._event_queue[0][2].time - self.time())
+                now_key = _time_key(self.time())
 
             else:
                 # Pop and call the event at the head of the queue.
-                event = self.events.pop(0)
+                event = heapq.heappop(self._event_queue)[2]
                 self.debug("Delivering %s",event)
-                event(self)
+                if observer is not None:
+                    observer.delivering(event)
+                if self._profiler is None:
+                    event(self)
+                else:
+                    self._profiler.deliver(event)
                 did_event=True
+                now_key = _time_key(self.time())
 
-        # The time needs updating if the events have not done it.
-        #if self.events and self.events[0].time >= stop_time:
-
-        if stop_time != self.forever:
-            self.time(stop_time)
+        return False
 
     def sleep(self,delay):
         """
@@ -1366,24 +1587,113 @@ class Simulation(param.Parameterized,OptionalSingleton):
     def enqueue_event(self,event):
         """
         Enqueue an Event at an absolute simulation clock time.
+
+        New events are enqueued after existing events with the same
+        time, i.e. 'simultaneous' events are executed FIFO.
         """
         assert isinstance(event,Event)
+        if self._enqueue_hook is not None:
+            return self._enqueue_hook(event)
+        heapq.heappush(self._event_queue,(_time_key(event.time),self._event_counter,event))
+        self._event_counter += 1
+
+
+    def _push_event(self,event):
+        # Put the event on the queue, bypassing any _enqueue_hook
+        heapq.heappush(self._event_queue,(_time_key(event.time),self._event_counter,event))
+        self._event_counter += 1
+
+
+    def _zero_delay_groups(self,eps):
+        """
+        Split the given list of EventProcessors into groups that can be
+        processed independently, preserving their order.
+
+        EventProcessors joined (directly or indirectly) by connections
+        with zero delay can affect each other within a single time
+        step, and so are placed in the same group.
+        """
+        root = {}
+        def find(ep):
+            while root.get(ep,ep) is not ep:
+                ep = root[ep]
+            return ep
+        for conn in self.connections():
+            if conn.delay == 0:
+                a,b = find(conn.src),find(conn.dest)
+                if a is not b:
+                    root[a] = b
+
+        groups = OrderedDict()
+        for ep in eps:
+            groups.setdefault(find(ep),[]).append(ep)
+        return groups.values()
+
+
+    def _process_current_time_concurrently(self,eps):
+        """
+        Call process_current_time() on the given EventProcessors, using
+        process_threads threads (see process_threads).
+
+        The events sent by each EventProcessor are collected and then
+        enqueued in the order of the eps list, exactly as if they had
+        been processed one at a time in that order.
+        """
+        concurrent,serial = [],[]
+        for group in self._zero_delay_groups(eps):
+            if all(ep.concurrent_process_current_time for ep in group):
+                concurrent.append(group)
+            else:
+                serial.append(group)
+
+        capture = threading.local()
+        enqueue_hook = self._enqueue_hook
+        self._enqueue_hook = lambda event: capture.events.append(event)
+        try:
+            sent = {}
+            for group_sent in _thread_pool(self.process_threads).map(
+                    lambda group: self._process_group(group,capture),concurrent,chunksize=1):
+                sent.update(group_sent)
+            for group in serial:
+                sent.update(self._process_group(group,capture))
+        finally:
+            self._enqueue_hook = enqueue_hook
+
+        for ep in eps:
+            for event in sent[ep]:
+                self.enqueue_event(event)
+
+
+    def _process_group(self,group,capture):
+        # Process each EventProcessor in the group in turn, returning
+        # a dictionary of the events each one sent (collected in the
+        # threading.local capture)
+        sent = {}
+        for ep in group:
+            capture.events = sent[ep] = []
+            ep.process_current_time()
+        return sent
+
+
+    def _get_events(self):
+        self._materialize_schedule()
+        return [entry[2] for entry in sorted(self._event_queue)]
+
+    def _set_events(self,events):
+        self._materialize_schedule()
+        self._event_queue = [(_time_key(e.time),i,e) for i,e in enumerate(events)]
+        heapq.heapify(self._event_queue)
+        self._event_counter = len(events)
+
+    events = property(_get_events,_set_events,doc="""
+        List of the scheduled events, in the order in which they will
+        be delivered.
+
+        The list is a copy of the event queue, so modifying it has no
+        effect on the simulation; use enqueue_event() and
+        event_clear() to alter the queue, or assign a complete list of
+        events to replace it.""")
 
-        if not self.events or event >= self.events[-1]:
-            # The new event goes at the end of the event queue if there
-            # isn't a queue right now, or if it's later than the last
-            # event's time.
-            self.events.append(event)
-        elif event < self.events[0]:
-            # If it's earlier than the first item it goes at the beginning.
-            self.events.insert(0,event)
-        else:
-            # Otherwise, it's inserted at the appropriate
-            # position somewhere inside the event queue.
-            # New events are enqueued after (right of) existing
-            # events with the same time, i.e. 'simultaneous' events
-            # are executed FIFO.
-            bisect.insort_right(self.events,event)
 
     def schedule_command(self,times,command_string):
         """
@@ -1411,8 +1721,13 @@ class Simulation(param.Parameterized,OptionalSingleton):
         if self.eps_to_start != []:
             self.run(0.0)
         self.event_push()
-        for ep in self._event_processors.values():
-            ep.state_push()
+        if self.copy_on_write_state:
+            deferred = self.__dict__.setdefault('_deferred_pushes',{})
+            for ep in self._event_processors.values():
+                deferred[ep] = deferred.get(ep,0)+1
+        else:
+            for ep in self._event_processors.values():
+                ep.state_push()
 
         param.Parameterized.state_push(self)
 
@@ -1424,12 +1739,32 @@ class Simulation(param.Parameterized,OptionalSingleton):
         See state_push() for more details.
         """
         self.event_pop()
+        deferred = self._deferred_pushes
         for ep in self._event_processors.values():
-            ep.state_pop()
+            n = deferred.get(ep,0)
+            if n>1:
+                deferred[ep] = n-1
+            elif n==1:
+                # the state was never changed, so was never saved
+                del deferred[ep]
+            else:
+                ep.state_pop()
 
         param.Parameterized.state_pop(self)
 
 
+    def _complete_state_pushes(self,eps=None):
+        """
+        Save the state of each of the given EventProcessors (or of
+        all of them, if eps is None) for each state_push() that has
+        postponed doing so (see copy_on_write_state).
+        """
+        deferred = self._deferred_pushes
+        for ep in (deferred.keys() if eps is None else eps):
+            for i in range(deferred.pop(ep,0)):
+                ep.state_push()
+
+
     def event_push(self):
         """
         Save a copy of the events queue for later restoration.
@@ -1440,7 +1775,10 @@ class Simulation(param.Parameterized,OptionalSingleton):
         # CBALERT: does it make more sense to put the original events onto the
         # stack, and replace self.events with the copies? Not sure this makes
         # any practical difference currently.
-        self._events_stack.append((self.time(),[copy(event) for event in self.events]))
+        # Only events that are changed when delivered need copying.
+        self._materialize_schedule()
+        self._events_stack.append((self.time(),[(t,n,copy(event) if event.changed_by_delivery else event)
+                                                for (t,n,event) in self._event_queue]))
 
 
     def event_pop(self):
@@ -1449,7 +1787,8 @@ class Simulation(param.Parameterized,OptionalSingleton):
 
         Same as state_pop(), but does not restore EventProcessors' state.
         """
-        time, self.events = self._events_stack.pop()
+        self._materialize_schedule()
+        time, self._event_queue = self._events_stack.pop()
         self.time(time)
 
 
@@ -1463,11 +1802,177 @@ class Simulation(param.Parameterized,OptionalSingleton):
         function, then clear out the events that should be deleted, do the measurement or
         analysis, and then do state_pop to restore the original state.
         """
-        events_temp = []
-        for e in self.events:
-            if not isinstance(e,event_type):
-                events_temp = events_temp + [e]
-        self.events = events_temp
+        self._materialize_schedule()
+        self._event_queue = [entry for entry in self._event_queue
+                             if not isinstance(entry[2],event_type)]
+        heapq.heapify(self._event_queue)
+
+
+    def compile_schedule(self,period=None):
+        """
+        Replay a recorded plan of the events in each period of
+        simulation time, rather than scheduling every event
+        individually.
+
+        In most models the connections and their delays are fixed,
+        and the simulation is driven by PeriodicEventSequences (e.g.
+        the input presentations of GeneratorSheets), so that every
+        period consists of exactly the same sequence of event
+        deliveries and process_current_time() calls.  After calling
+        this method, the next period simulated by run() is recorded
+        as usual; later periods then follow the recorded plan
+        directly, which avoids creating, copying and sorting most
+        Event objects.  The results are identical to those of the
+        event engine.
+
+        The period defaults to the common period of the
+        PeriodicEventSequences on the event queue.  If the events do
+        not repeat with this period, a warning is printed and the
+        usual event engine is used instead.
+
+        The simulation falls back to the event engine whenever it
+        departs from the plan, e.g. when a scheduled command is due,
+        when the event queue is accessed (e.g. by state_push()), or
+        when the connections, their delays or the EventProcessors
+        change.  The plan is resumed at the start of a later period
+        if the pending events match it again, and is recorded afresh
+        if the model itself has changed.  See discard_schedule().
+        """
+        from topo.base.schedule import CompiledSchedule
+        self.discard_schedule()
+        self._schedule = CompiledSchedule(self,period)
+
+
+    def discard_schedule(self):
+        """Stop using any plan set up by compile_schedule()."""
+        self._materialize_schedule()
+        self._schedule = None
+
+
+    def _materialize_schedule(self):
+        # Put any events held by a CompiledSchedule back on the event
+        # queue, before the queue is inspected or changed.
+        if self._schedule is not None:
+            self._schedule.materialize()
+
+
+    def partition(self,assignment,transport=None):
+        """
+        Compute the given ProjectionSheets in separate worker
+        processes, which run in parallel while this process keeps
+        the event clock.
+
+        The assignment is a dictionary mapping Sheet names to worker
+        numbers (0,1,2,...), e.g. {'V1':0,'V2':1}.  A Sheet can also be
+        split into bands of rows computed by several workers, by
+        mapping it to a list of worker numbers, e.g. {'V1':[0,1,2,3]};
+        each worker then computes only its own rows, which requires
+        the Sheet's output functions and learning to treat each row
+        independently.
+
+        Each worker holds a copy of the model as it is when this
+        method is called, and the input arriving for its Sheets is
+        sent to it at each time step; the events its Sheets send are
+        scheduled here exactly as if they had been computed in this
+        process.  The workers' Sheets learn only in their own copies,
+        so use gather_partition() (or unpartition()) to update this
+        process's copies of their activity and weights, e.g. before
+        plotting or saving them.  Changes made to the model in this
+        process (e.g. to parameters) are not seen by the workers.
+
+        The workers are started by the transport (see
+        topo.base.partition.ActivityTransport), by default a
+        SharedMemoryTransport that forks them on this machine and
+        exchanges activity through shared memory.  The Sheets are
+        processed concurrently only if process_threads is nonzero, so
+        it is set to the number of workers if it is zero.
+        """
+        from topo.base.partition import Partition
+        self.unpartition()
+        self._partition = Partition(self,assignment,transport)
+
+
+    def gather_partition(self):
+        """
+        Copy the activity and weights of the Sheets computed by
+        partition()'s workers into this process's model.
+        """
+        if self._partition is not None:
+            self._partition.gather()
+
+
+    def unpartition(self):
+        """
+        Gather the state of any Sheets computed by partition()'s
+        workers, stop the workers, and go back to computing every
+        Sheet in this process.
+        """
+        if self._partition is not None:
+            partition,self._partition = self._partition,None
+            partition.stop()
+
+
+    def start_profiling(self):
+        """
+        Start keeping the cumulative time and number of calls of each
+        EventProcessor's input_event() and process_current_time(),
+        each Projection's activate(), learn() and
+        apply_learn_output_fns(), each output function of a Sheet or
+        Projection, and the delivery of each type of Event, discarding
+        any previous statistics.
+
+        Only the EventProcessors and connections already in the
+        Simulation are timed.  See perf_report() for the results.
+        """
+        from topo.base.profiling import ComponentProfiler
+        self.stop_profiling()
+        self._profiler = self._profile = ComponentProfiler(self)
+        self._profiler.start()
+
+
+    def stop_profiling(self):
+        """Stop timing the simulation (see start_profiling()), keeping the statistics."""
+        if self._profiler is not None:
+            self._profiler.stop()
+            self._profiler = None
+
+
+    def perf_report(self,format='text',filename=None):
+        """
+        Print the statistics collected since start_profiling() was
+        last called, most time-consuming operation first, or write
+        them to the named file if a filename is given.
+
+        The format can be 'text' (a table), 'csv' or 'json'; each
+        entry gives the number of calls of an operation, their total
+        and mean wall-clock time, and the percentage of the time spent
+        in run() that they account for.
+        """
+        if self._profile is None:
+            self.warning("No profiling statistics; call start_profiling() first.")
+            return
+        report = self._profile.report(format)
+        if filename is None:
+            print report
+        else:
+            with open(param.normalize_path(filename),'w') as f:
+                f.write(report)
+
+
+    def __getstate__(self):
+        if self._partition is not None:
+            raise ValueError("Cannot save a partitioned Simulation; call unpartition() first.")
+        if self._profiler is not None:
+            raise ValueError("Cannot save a Simulation while profiling it; call stop_profiling() first.")
+        # A CompiledSchedule is not saved (the plan is specific to
+        # the objects of this session); its events are.
+        self._materialize_schedule()
+        state = super(Simulation,self).__getstate__()
+        state.pop('_schedule',None)
+        state.pop('_enqueue_hook',None)
+        state.pop('_partition',None)
+        state.pop('_profile',None)
+        return state
 
 
 
@@ -0,0 +1,278 @@
+"""
+TickTime: an exact simulation time type stored as an integer number of ticks.
+
+A TickTime represents a time as an integer count of a fixed tick,
+1/TickTime.resolution time units long.  Because the value is always a
+plain integer, comparing, adding and subtracting times is much cheaper
+than with gmpy.mpq or fixedpoint.FixedPoint, and the simulation's
+event queue can order events by comparing integers directly.
+
+The resolution must be chosen so that every time used in the
+simulation (connection delays, input periods and phases, scheduled
+command times, etc.) is a whole number of ticks; the default of 1000
+ticks per time unit allows any time with up to three decimal places.
+lcm_resolution() can be used to find the smallest resolution that can
+represent a given list of times.  Conversions to and from other types
+are exact: a value that cannot be represented exactly raises a
+ValueError rather than being rounded.
+
+>>> TickTime.resolution = 1000
+>>> t = TickTime('0.05')
+>>> t.ticks
+50
+>>> t + 1
+TickTime('21/20')
+>>> TickTime(0.3) - TickTime(0.1) == TickTime('0.2')
+True
+
+To use TickTime for the simulation time, call
+topo.misc.ticktime.use_tick_time() before creating the model,
+e.g. ``use_tick_time(resolution=20)``.
+"""
+
+from fractions import Fraction
+
+
+def _as_fraction(value):
+    """Return the exact value of the given number as a Fraction."""
+    if isinstance(value,Fraction):
+        return value
+    elif isinstance(value,(int,long)):
+        return Fraction(value)
+    elif isinstance(value,float):
+        # Use the shortest decimal representation of the float,
+        # i.e. what the user typed (e.g. 0.05 rather than the
+        # nearest binary fraction).
+        return Fraction(repr(value))
+    elif hasattr(value,'numer') and hasattr(value,'denom'):
+        # gmpy.mpq
+        return Fraction(int(value.numer()),int(value.denom()))
+    else:
+        # strings, fixedpoint.FixedPoint, decimal.Decimal
+        try:
+            return Fraction(str(value))
+        except ValueError:
+            raise TypeError("Cannot convert %r to an exact time."%(value,))
+
+
+# Number of ticks for float and string values already converted, keyed
+# by (value,resolution); these are usually a handful of delays and
+# periods, converted over and over as events are scheduled.
+_ticks_cache = {}
+
+
+class TickTime(object):
+    """
+    Exact time value stored as an integer number of ticks, where one
+    tick is 1/resolution time units.
+
+    Can be constructed from an int, long, float, string, Fraction,
+    gmpy.mpq, FixedPoint, Decimal or another TickTime; a ValueError
+    is raised if the value is not a whole number of ticks.
+    """
+    __slots__ = ['ticks']
+
+    # Number of ticks per unit of time; shared by all TickTimes.
+    # Because a TickTime stores only its ticks, changing this changes
+    # the value of every existing TickTime; once the simulation has
+    # TickTime times, use topo.misc.ticktime.use_tick_time() to change
+    # it.
+    resolution = 1000
+
+    def __init__(self,value=0):
+        if value.__class__ is TickTime:
+            self.ticks = value.ticks
+        elif isinstance(value,(int,long)):
+            self.ticks = value*TickTime.resolution
+        elif isinstance(value,(float,str)):
+            key = (value,TickTime.resolution)
+            ticks = _ticks_cache.get(key)
+            if ticks is None:
+                if len(_ticks_cache)>1000: _ticks_cache.clear()
+                ticks = _ticks_cache[key] = TickTime._exact_ticks(value)
+            self.ticks = ticks
+        else:
+            self.ticks = TickTime._exact_ticks(value)
+
+    @staticmethod
+    def _exact_ticks(value):
+        ticks = _as_fraction(value)*TickTime.resolution
+        if ticks.denominator != 1:
+            raise ValueError("%s is not a whole number of ticks of length 1/%d; "
+                             "use a finer TickTime.resolution."%(value,TickTime.resolution))
+        return ticks.numerator
+
+    @classmethod
+    def from_ticks(cls,ticks):
+        """Return the TickTime that is the given integer number of ticks."""
+        t = object.__new__(cls)
+        t.ticks = ticks
+        return t
+
+    def fraction(self):
+        """Return the exact value of this time as a Fraction."""
+        return Fraction(self.ticks,TickTime.resolution)
+
+    # Same interface as gmpy.mpq, so that e.g. numbergen uses the same
+    # (numerator,denominator) pair for a given time with either type.
+    def numer(self):
+        return self.fraction().numerator
+
+    def denom(self):
+        return self.fraction().denominator
+
+    def _other_ticks(self,other):
+        if other.__class__ is TickTime:
+            return other.ticks
+        return TickTime(other).ticks
+
+
+    def __add__(self,other):
+        try:
+            return TickTime.from_ticks(self.ticks+self._other_ticks(other))
+        except TypeError:
+            return NotImplemented
+
+    __radd__ = __add__
+
+    def __sub__(self,other):
+        try:
+            return TickTime.from_ticks(self.ticks-self._other_ticks(other))
+        except TypeError:
+            return NotImplemented
+
+    def __rsub__(self,other):
+        try:
+            return TickTime.from_ticks(self._other_ticks(other)-self.ticks)
+        except TypeError:
+            return NotImplemented
+
+    def __mul__(self,other):
+        if isinstance(other,(int,long)):
+            return TickTime.from_ticks(self.ticks*other)
+        return TickTime(self.fraction()*_as_fraction(other))
+
+    __rmul__ = __mul__
+
+    def __div__(self,other):
+        # Times divided by times (or numbers) are ratios, not times
+        if other.__class__ is TickTime:
+            return Fraction(self.ticks,other.ticks)
+        return self.fraction()/_as_fraction(other)
+
+    __truediv__ = __div__
+
+    def __rdiv__(self,other):
+        return _as_fraction(other)/self.fraction()
+
+    __rtruediv__ = __rdiv__
+
+    def __mod__(self,other):
+        return TickTime.from_ticks(self.ticks % self._other_ticks(other))
+
+    def __neg__(self):
+        return TickTime.from_ticks(-self.ticks)
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return TickTime.from_ticks(abs(self.ticks))
+
+
+    # Comparisons with other TickTimes compare the integer ticks;
+    # comparisons with other numbers are exact.  Anything else
+    # (e.g. param.Infinity) is left to the other object.
+    def _cmp_values(self,other):
+        if other.__class__ is TickTime:
+            return self.ticks,other.ticks
+        elif isinstance(other,(int,long)):
+            return self.ticks,other*TickTime.resolution
+        else:
+            try:
+                return self.fraction(),_as_fraction(other)
+            except TypeError:
+                return None
+
+    def __eq__(self,other):
+        v = self._cmp_values(other)
+        return NotImplemented if v is None else v[0]==v[1]
+
+    def __ne__(self,other):
+        v = self._cmp_values(other)
+        return NotImplemented if v is None else v[0]!=v[1]
+
+    def __lt__(self,other):
+        v = self._cmp_values(other)
+        return NotImplemented if v is None else v[0]<v[1]
+
+    def __le__(self,other):
+        v = self._cmp_values(other)
+        return NotImplemented if v is None else v[0]<=v[1]
+
+    def __gt__(self,other):
+        v = self._cmp_values(other)
+        return NotImplemented if v is None else v[0]>v[1]
+
+    def __ge__(self,other):
+        v = self._cmp_values(other)
+        return NotImplemented if v is None else v[0]>=v[1]
+
+    def __hash__(self):
+        # Equal to the hash of an equal int, float or Fraction
+        return hash(self.fraction())
+
+    def __nonzero__(self):
+        return self.ticks != 0
+
+    def __float__(self):
+        return float(self.ticks)/TickTime.resolution
+
+    def __int__(self):
+        return int(self.__long__())
+
+    def __long__(self):
+        # truncate towards zero, as for int(float)
+        if self.ticks < 0:
+            return -(-self.ticks // TickTime.resolution)
+        return self.ticks // TickTime.resolution
+
+
+    def __str__(self):
+        return str(self.fraction())
+
+    def __repr__(self):
+        return "TickTime('%s')"%self.fraction()
+
+    # Pickled as the exact value, not the number of ticks, so that a
+    # snapshot can be loaded using any resolution that can represent
+    # its times.
+    def __reduce__(self):
+        return (TickTime,(str(self.fraction()),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self,memo):
+        return self
+
+
+
+def _gcd(a,b):
+    while b:
+        a,b = b,a%b
+    return a
+
+def lcm_resolution(times):
+    """
+    Return the smallest TickTime.resolution able to represent all of
+    the given times exactly, i.e. the lowest common multiple of their
+    denominators.
+
+    E.g. lcm_resolution([0.05,'1/3',1]) returns 60.
+    """
+    resolution = 1
+    for t in times:
+        d = _as_fraction(t).denominator
+        resolution = resolution*d//_gcd(resolution,d)
+    return resolution
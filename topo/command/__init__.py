@@ -923,10 +923,15 @@ def wipe_out_activity():
     # if there are often new types of objects created that store an
     # activity value.
     for s in topo.sim.objects(Sheet).values():
+        connections = [c for c in s.in_connections if hasattr(c,'activity')]
+        # (activity that is already zero is left alone, so that its
+        # saving can still be avoided; see Simulation.copy_on_write_state)
+        if not (s.activity.any() or any(c.activity.any() for c in connections)):
+            continue
+        s.complete_state_push()
         s.activity*=0.0
-        for c in s.in_connections:
-            if hasattr(c,'activity'):
-                c.activity*=0.0
+        for c in connections:
+            c.activity*=0.0
 
 
 
@@ -93,6 +93,10 @@ class GPUSparseCFProjection(SparseCFProjection):
 
     initialized = param.Boolean(default=False)
 
+    # The response is computed asynchronously on the GPU; CUDA
+    # contexts are per thread.
+    concurrent_activate = False
+
 
     def __init__(self,**params):
         #Hack-ish way to avoid initialisation until the weights are transfered:
@@ -40,6 +40,9 @@ class GPUSettlingCFSheet(SettlingCFSheet):
         Function to use to compute the norm_total for each CF in each
         gpu projection from a group to be normalized jointly.""")
 
+    # CUDA contexts are per thread
+    concurrent_process_current_time = False
+
 
     def __init__(self, **params):
         super(GPUSettlingCFSheet, self).__init__(**params)
@@ -87,6 +90,9 @@ class GPUSettlingCFSheet(SettlingCFSheet):
 
 class GPUCFSheet(CFSheet):
 
+    # CUDA contexts are per thread
+    concurrent_process_current_time = False
+
     def __init__(self, **params):
         super(GPUCFSheet, self).__init__(**params)
 
@@ -5,6 +5,7 @@ written in C to optimize performance.
 Requires the weave package; without it unoptimized versions are used.
 """
 
+import numpy as np
 from numpy import zeros, ones
 
 import param
@@ -14,8 +15,9 @@ from topo.base.cf import CFPLearningFn,CFPLF_Plugin
 from topo.learningfn.projfn import CFPLF_PluginScaled
 from topo.base.functionfamily import Hebbian,LearningFn
 from topo.misc.inlinec import inline,provide_unoptimized_equivalent,\
-     c_header,c_decorators
+     c_header,c_decorators,weight_c_header,weight_support_code,c_weights
 from topo.learningfn import BCMFixed
+from topo.misc.autotune import AutotunedFn,weights_reset,all_weights
 
 from projfn import CFPLF_Trace  # pyflakes:ignore (optimized version provided)
 
@@ -38,13 +40,15 @@ class CFPLF_Hebbian_opt(CFPLearningFn):
     """
     single_cf_fn = param.ClassSelector(LearningFn,default=Hebbian(),readonly=True)
 
+    learns_active_units_only = True
+
     def __call__(self, iterator, input_activity, output_activity, learning_rate, **params):
         single_connection_learning_rate = self.constant_sum_connection_rate(iterator.proj_n_units,learning_rate)
         if single_connection_learning_rate==0:
             return
 
         cfs = iterator.flatcfs
-        num_cfs = len(cfs)  # pyflakes:ignore (passed to weave C code)
+        slices = iterator.slices  # pyflakes:ignore (passed to weave C code)
         irows,icols = input_activity.shape
         cf_type = iterator.cf_type  # pyflakes:ignore (passed to weave C code)
 
@@ -57,67 +61,176 @@ class CFPLF_Hebbian_opt(CFPLearningFn):
         # iterator's active_units_mask to be True before calling the
         # iterator in the unoptimized version.)
 
-        sheet_mask = iterator.get_sheet_mask()  # pyflakes:ignore (passed to weave C code)
+        # Only the active units that are not masked out, as an index
+        # array shared by all the sheet's projections while learning
+        if output_activity is iterator.activity:
+            active_units = iterator.active_unit_indices()
+        else:
+            active_units = np.flatnonzero(np.logical_and(
+                output_activity,iterator.get_sheet_mask())).astype(np.int32)
+        num_active = len(active_units)  # pyflakes:ignore (passed to weave C code)
+
+        if iterator.packed is not None:
+            self._packed_hebbian(iterator.packed,input_activity,output_activity,
+                                 active_units,icols,single_connection_learning_rate)
+            return
 
-        code = c_header + """
+        code = c_header + weight_c_header(iterator.weight_dtype) + """
             DECLARE_SLOT_OFFSET(weights,cf_type);
-            DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
             DECLARE_SLOT_OFFSET(mask,cf_type);
             DECLARE_SLOT_OFFSET(_norm_total,cf_type);
             DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
 
             %(cfs_loop_pragma)s
-            for (int r=0; r<num_cfs; ++r) {
+            for (int k=0; k<num_active; ++k) {
+                int r = active_units[k];
+                double load = output_activity[r]*single_connection_learning_rate;
+
+                PyObject *cf = PyList_GetItem(cfs,r);
+
+                LOOKUP_FROM_SLOT_OFFSET(weight_t,weights,cf);
+                int *input_sheet_slice = slices+4*r;
+                LOOKUP_MASK_FROM_SLOT_OFFSET(cf);
+
+                UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
+
+                double total = 0.0;
+
+                // modify non-masked weights
+                npfloat *inpj = input_activity+icols*rr1+cc1;
+                for (int i=rr1; i<rr2; ++i) {
+                    npfloat *inpi = inpj;
+                    float *mask = mask_row+(i-rr1)*mask_rowstride;
+                    for (int j=cc1; j<cc2; ++j) {
+                        // The mask is floating point, so we have to
+                        // use a robust comparison instead of testing
+                        // against exactly 0.0.
+                        if (*(mask++) >= MASK_THRESHOLD) {
+                            *weights = DOUBLE_TO_WEIGHT(WEIGHT_TO_DOUBLE(*weights) + load * *inpi);
+                            total += fabs(WEIGHT_TO_DOUBLE(*weights));
+                        }
+                        ++weights;
+                        ++inpi;
+                    }
+                    inpj += icols;
+                }
+                // store the sum of the cf's weights
+                LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
+                _norm_total[0]=total;
+                LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
+                _has_norm_total[0]=1;
+            }
+        """%c_decorators
+
+        inline(code, ['input_activity', 'output_activity','active_units','num_active',
+                      'icols', 'cfs', 'slices', 'single_connection_learning_rate',
+                      'cf_type'],
+               local_dict=locals(),
+               headers=['<structmember.h>'],
+               support_code=weight_support_code)
+
+
+    def _packed_hebbian(self,packed,input_activity,output_activity,active_units,
+                        icols,single_connection_learning_rate):
+        """
+        Same as __call__, but working directly on the PackedWeights
+        storage of all the CFs.
+        """
+        weights = c_weights(packed.weights)  # pyflakes:ignore (passed to weave C code)
+        masks = packed.masks  # pyflakes:ignore (passed to weave C code)
+        mask_offsets = packed.mask_offsets  # pyflakes:ignore (passed to weave C code)
+        mask_rowstrides = packed.mask_rowstrides  # pyflakes:ignore (passed to weave C code)
+        offsets = packed.offsets  # pyflakes:ignore (passed to weave C code)
+        slices = packed.slices  # pyflakes:ignore (passed to weave C code)
+        norm_total = packed.norm_total  # pyflakes:ignore (passed to weave C code)
+        has_norm_total = packed.has_norm_total  # pyflakes:ignore (passed to weave C code)
+        num_active = len(active_units)  # pyflakes:ignore (passed to weave C code)
+
+        code = c_header + weight_c_header(packed.weights.dtype) + """
+            %(cfs_loop_pragma)s
+            for (int k=0; k<num_active; ++k) {
+                int r = active_units[k];
                 double load = output_activity[r];
-                if (load != 0 && sheet_mask[r] != 0) {
+                // (a null CF has an empty slice, so is left alone)
+                if (offsets[r+1] > offsets[r]) {
                     load *= single_connection_learning_rate;
 
-                    PyObject *cf = PyList_GetItem(cfs,r);
-
-                    LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
-                    LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
-                    LOOKUP_FROM_SLOT_OFFSET(float,mask,cf);
-
+                    int *input_sheet_slice = slices+4*r;
                     UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
 
+                    weight_t *wi = weights+offsets[r];
                     double total = 0.0;
 
                     // modify non-masked weights
                     npfloat *inpj = input_activity+icols*rr1+cc1;
                     for (int i=rr1; i<rr2; ++i) {
                         npfloat *inpi = inpj;
+                        float *mi = masks+mask_offsets[r]+(i-rr1)*mask_rowstrides[r];
                         for (int j=cc1; j<cc2; ++j) {
-                            // The mask is floating point, so we have to
-                            // use a robust comparison instead of testing
-                            // against exactly 0.0.
-                            if (*(mask++) >= MASK_THRESHOLD) {
-                                *weights += load * *inpi;
-                                total += fabs(*weights);
+                            if (*(mi++) >= MASK_THRESHOLD) {
+                                *wi = DOUBLE_TO_WEIGHT(WEIGHT_TO_DOUBLE(*wi) + load * *inpi);
+                                total += fabs(WEIGHT_TO_DOUBLE(*wi));
                             }
-                            ++weights;
+                            ++wi;
                             ++inpi;
                         }
                         inpj += icols;
                     }
                     // store the sum of the cf's weights
-                    LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
-                    _norm_total[0]=total;
-                    LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
-                    _has_norm_total[0]=1;
+                    norm_total[r]=total;
+                    has_norm_total[r]=1;
                 }
             }
         """%c_decorators
-
-        inline(code, ['input_activity', 'output_activity','sheet_mask','num_cfs',
-                      'icols', 'cfs', 'single_connection_learning_rate','cf_type'],
-               local_dict=locals(),
-               headers=['<structmember.h>'])
+        inline(code, ['input_activity','output_activity','active_units','num_active',
+                      'icols','single_connection_learning_rate','weights','masks',
+                      'mask_offsets','mask_rowstrides','offsets','slices',
+                      'norm_total','has_norm_total'],
+               local_dict=locals(), support_code=weight_support_code)
 
 
 class CFPLF_Hebbian(CFPLF_Plugin):
     """Same as CFPLF_Plugin(single_cf_fn=Hebbian()); just for non-optimized fallback."""
     single_cf_fn = param.ClassSelector(LearningFn,default=Hebbian(),readonly=True)
-provide_unoptimized_equivalent("CFPLF_Hebbian_opt","CFPLF_Hebbian",locals())
+
+    learns_active_units_only = True
+provide_unoptimized_equivalent("CFPLF_Hebbian_opt","CFPLF_Hebbian",locals(),
+                               "CFPLF_Hebbian_cython")
+
+
+class CFPLF_Autotuned(CFPLearningFn,AutotunedFn):
+    """
+    Hebbian learning function that uses whichever of its candidates
+    is fastest for each projection.
+
+    The first time it is called for a projection, each candidate
+    learns from the current activity, starting from the same weights
+    each time, and the fastest one giving the same weights as the
+    first candidate is used from then on for projections of that
+    geometry (see topo.misc.autotune).  Timing needs a copy of the
+    weights for the starting point and one for the reference result.
+    """
+
+    single_cf_fn = param.ClassSelector(LearningFn,default=Hebbian(),readonly=True)
+
+    learns_active_units_only = True
+
+    candidates = param.List(default=[CFPLF_Hebbian_opt(),CFPLF_Hebbian()],
+                            class_=CFPLearningFn,doc="""
+        Equivalent learning functions to choose from; the first one is
+        the reference for the learned weights.""")
+
+    cython_candidates = param.List(default=['CFPLF_Hebbian_cython'],class_=str,doc="""
+        Names of topo.optimized learning functions to add to the
+        candidates (if they exist).""")
+
+    def __call__(self, iterator, input_activity, output_activity, learning_rate, **params):
+        proj = iterator.proj
+        fn = self._chosen('learning_fn',proj,
+                          lambda fn: fn(iterator,input_activity,output_activity,learning_rate),
+                          lambda: all_weights(proj),weights_reset(proj))
+        fn(iterator,input_activity,output_activity,learning_rate)
+
 
 
 # CBERRORALERT: classes from here on probably ignore the sheet mask
@@ -140,10 +253,13 @@ class CFPLF_BCMFixed_opt(CFPLearningFn):
 
     unit_threshold=param.Number(default=0.5,bounds=(0,None),doc="Threshold between LTD and LTP.")
 
+    learns_active_units_only = True
+
     def __call__(self, iterator, input_activity, output_activity, learning_rate, **params):
         rows,cols = output_activity.shape
         cfs = iterator.flatcfs
         num_cfs = len(cfs)  # pyflakes:ignore (passed to weave C code)
+        slices = iterator.slices  # pyflakes:ignore (passed to weave C code)
         single_connection_learning_rate = self.constant_sum_connection_rate(iterator.proj_n_units,learning_rate)
         if single_connection_learning_rate==0:
             return
@@ -152,9 +268,8 @@ class CFPLF_BCMFixed_opt(CFPLearningFn):
 
         irows,icols = input_activity.shape
         cf_type = iterator.cf_type  # pyflakes:ignore (passed to weave C code)
-        code = c_header + """
+        code = c_header + weight_c_header(iterator.weight_dtype) + """
             DECLARE_SLOT_OFFSET(weights,cf_type);
-            DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
             DECLARE_SLOT_OFFSET(mask,cf_type);
             DECLARE_SLOT_OFFSET(_norm_total,cf_type);
             DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
@@ -168,9 +283,9 @@ class CFPLF_BCMFixed_opt(CFPLearningFn):
 
                     PyObject *cf = PyList_GetItem(cfs,r);
 
-                    LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
-                    LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
-                    LOOKUP_FROM_SLOT_OFFSET(float,mask,cf);
+                    LOOKUP_FROM_SLOT_OFFSET(weight_t,weights,cf);
+                    int *input_sheet_slice = slices+4*r;
+                    LOOKUP_MASK_FROM_SLOT_OFFSET(cf);
 
                     UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
 
@@ -180,14 +295,16 @@ class CFPLF_BCMFixed_opt(CFPLearningFn):
                     npfloat *inpj = input_activity+icols*rr1+cc1;
                     for (int i=rr1; i<rr2; ++i) {
                         npfloat *inpi = inpj;
+                        float *mask = mask_row+(i-rr1)*mask_rowstride;
                         for (int j=cc1; j<cc2; ++j) {
                             // The mask is floating point, so we have to
                             // use a robust comparison instead of testing
                             // against exactly 0.0.
                             if (*(mask++) >= MASK_THRESHOLD) {
-                                *weights += load * *inpi * (unit_activity - unit_threshold);
-                                if (*weights<0) { *weights = 0;}
-                                total += fabs(*weights);
+                                *weights = DOUBLE_TO_WEIGHT(WEIGHT_TO_DOUBLE(*weights) +
+                                                            load * *inpi * (unit_activity - unit_threshold));
+                                if (WEIGHT_TO_DOUBLE(*weights)<0) { *weights = DOUBLE_TO_WEIGHT(0.0);}
+                                total += fabs(WEIGHT_TO_DOUBLE(*weights));
                             }
                             ++weights;
                             ++inpi;
@@ -204,16 +321,20 @@ class CFPLF_BCMFixed_opt(CFPLearningFn):
         """%c_decorators
 
         inline(code, ['input_activity', 'output_activity','num_cfs',
-                      'icols', 'cfs', 'single_connection_learning_rate',
+                      'icols', 'cfs', 'slices', 'single_connection_learning_rate',
                       'unit_threshold','cf_type'],
                local_dict=locals(),
-               headers=['<structmember.h>'])
+               headers=['<structmember.h>'],
+               support_code=weight_support_code)
 
 
 class CFPLF_BCMFixed(CFPLF_Plugin):
     """Same as CFPLF_Plugin(single_cf_fn=BCMFixed()); just for non-optimized fallback."""
     single_cf_fn = param.ClassSelector(LearningFn,default=BCMFixed(),readonly=True)
-provide_unoptimized_equivalent("CFPLF_BCMFixed_opt","CFPLF_Hebbian",locals())
+
+    learns_active_units_only = True
+provide_unoptimized_equivalent("CFPLF_BCMFixed_opt","CFPLF_Hebbian",locals(),
+                               "CFPLF_BCMFixed_cython")
 
 
 # CEBALERT: 2009/04/03 - when used in GCA-LISSOM, causes Python to crash.
@@ -230,8 +351,9 @@ class CFPLF_Scaled_opt(CFPLF_PluginScaled):
     """
     single_cf_fn = param.ClassSelector(LearningFn,default=Hebbian(),readonly=True)
 
-    def __call__(self, iterator, input_activity, output_activity, learning_rate, **params):
+    learns_active_units_only = True
 
+    def __call__(self, iterator, input_activity, output_activity, learning_rate, **params):
         if self.learning_rate_scaling_factor is None:
             self.learning_rate_scaling_factor = ones(output_activity.shape)*1.0
         learning_rate_scaling_factor = self.learning_rate_scaling_factor  # pyflakes:ignore (passed to weave C code)
@@ -242,14 +364,14 @@ class CFPLF_Scaled_opt(CFPLF_PluginScaled):
 
         cfs = iterator.flatcfs
         num_cfs = len(cfs)  # pyflakes:ignore (passed to weave C code)
+        slices = iterator.slices  # pyflakes:ignore (passed to weave C code)
         irows,icols = input_activity.shape
         cf_type = iterator.cf_type  # pyflakes:ignore (passed to weave C code)
 
         sheet_mask = iterator.get_sheet_mask()  # pyflakes:ignore (passed to weave C code)
 
-        code = c_header + """
+        code = c_header + weight_c_header(iterator.weight_dtype) + """
             DECLARE_SLOT_OFFSET(weights,cf_type);
-            DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
             DECLARE_SLOT_OFFSET(mask,cf_type);
             DECLARE_SLOT_OFFSET(_norm_total,cf_type);
             DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
@@ -264,9 +386,9 @@ class CFPLF_Scaled_opt(CFPLF_PluginScaled):
 
                     PyObject *cf = PyList_GetItem(cfs,r);
 
-                    LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
-                    LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
-                    LOOKUP_FROM_SLOT_OFFSET(float,mask,cf);
+                    LOOKUP_FROM_SLOT_OFFSET(weight_t,weights,cf);
+                    int *input_sheet_slice = slices+4*r;
+                    LOOKUP_MASK_FROM_SLOT_OFFSET(cf);
 
                     UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
 
@@ -276,13 +398,14 @@ class CFPLF_Scaled_opt(CFPLF_PluginScaled):
                     npfloat *inpj = input_activity+icols*rr1+cc1;
                     for (int i=rr1; i<rr2; ++i) {
                         npfloat *inpi = inpj;
+                        float *mask = mask_row+(i-rr1)*mask_rowstride;
                         for (int j=cc1; j<cc2; ++j) {
                             // The mask is floating point, so we have to
                             // use a robust comparison instead of testing
                             // against exactly 0.0.
                             if (*(mask++) >= MASK_THRESHOLD) {
-                                *weights += load * *inpi;
-                                total += fabs(*weights);
+                                *weights = DOUBLE_TO_WEIGHT(WEIGHT_TO_DOUBLE(*weights) + load * *inpi);
+                                total += fabs(WEIGHT_TO_DOUBLE(*weights));
                             }
                             ++weights;
                             ++inpi;
@@ -299,16 +422,20 @@ class CFPLF_Scaled_opt(CFPLF_PluginScaled):
         """%c_decorators
 
         inline(code, ['input_activity','learning_rate_scaling_factor', 'output_activity',
-                      'sheet_mask', 'num_cfs', 'icols', 'cfs',
+                      'sheet_mask', 'num_cfs', 'icols', 'cfs', 'slices',
                       'single_connection_learning_rate','cf_type'],
                local_dict=locals(),
-               headers=['<structmember.h>'])
+               headers=['<structmember.h>'],
+               support_code=weight_support_code)
 
 
 class CFPLF_Scaled(CFPLF_PluginScaled):
     """Same as CFPLF_PluginScaled(single_cf_fn=Hebbian()); just for non-optimized fallback."""
     single_cf_fn = param.ClassSelector(LearningFn,default=Hebbian(),readonly=True)
-provide_unoptimized_equivalent("CFPLF_Scaled_opt","CFPLF_Scaled",locals())
+
+    learns_active_units_only = True
+provide_unoptimized_equivalent("CFPLF_Scaled_opt","CFPLF_Scaled",locals(),
+                               "CFPLF_Scaled_cython")
 
 
 
@@ -333,6 +460,7 @@ class CFPLF_Trace_opt(CFPLearningFn):
 
         cfs = iterator.flatcfs
         num_cfs = len(cfs)  # pyflakes:ignore (passed to weave C code)
+        slices = iterator.slices  # pyflakes:ignore (passed to weave C code)
 
         ##Initialise traces to zero if they don't already exist
         if not hasattr(self,'traces'):
@@ -340,10 +468,10 @@ class CFPLF_Trace_opt(CFPLearningFn):
 
         self.traces = (self.trace_strength*output_activity)+((1-self.trace_strength)*self.traces)
         traces = self.traces  # pyflakes:ignore (passed to weave C code)
+
         cf_type = iterator.cf_type  # pyflakes:ignore (passed to weave C code)
-        code = c_header + """
+        code = c_header + weight_c_header(iterator.weight_dtype) + """
             DECLARE_SLOT_OFFSET(weights,cf_type);
-            DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
             DECLARE_SLOT_OFFSET(mask,cf_type);
             DECLARE_SLOT_OFFSET(_norm_total,cf_type);
             DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
@@ -355,9 +483,9 @@ class CFPLF_Trace_opt(CFPLearningFn):
                     load *= single_connection_learning_rate;
                     PyObject *cf = PyList_GetItem(cfs,r);
 
-                    LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
-                    LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
-                    LOOKUP_FROM_SLOT_OFFSET(float,mask,cf);
+                    LOOKUP_FROM_SLOT_OFFSET(weight_t,weights,cf);
+                    int *input_sheet_slice = slices+4*r;
+                    LOOKUP_MASK_FROM_SLOT_OFFSET(cf);
 
                     UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
 
@@ -367,13 +495,14 @@ class CFPLF_Trace_opt(CFPLearningFn):
                     npfloat *inpj = input_activity+icols*rr1+cc1;
                     for (int i=rr1; i<rr2; ++i) {
                         npfloat *inpi = inpj;
+                        float *mask = mask_row+(i-rr1)*mask_rowstride;
                         for (int j=cc1; j<cc2; ++j) {
                             // The mask is floating point, so we have to
                             // use a robust comparison instead of testing
                             // against exactly 0.0.
                             if (*(mask++) >= MASK_THRESHOLD) {
-                                *weights += load * *inpi;
-                                total += fabs(*weight);
+                                *weights = DOUBLE_TO_WEIGHT(WEIGHT_TO_DOUBLE(*weights) + load * *inpi);
+                                total += fabs(WEIGHT_TO_DOUBLE(*weights));
                             }
                             ++weights;
                             ++inpi;
@@ -390,9 +519,11 @@ class CFPLF_Trace_opt(CFPLearningFn):
         """%c_decorators
 
         inline(code, ['input_activity', 'traces','num_cfs', 'icols',
-                      'cfs', 'single_connection_learning_rate','cf_type'],
+                      'cfs', 'slices', 'single_connection_learning_rate','cf_type'],
                local_dict=locals(),
-               headers=['<structmember.h>'])
+               headers=['<structmember.h>'],
+               support_code=weight_support_code)
 
 
-provide_unoptimized_equivalent("CFPLF_Trace_opt","CFPLF_Trace",locals())
+provide_unoptimized_equivalent("CFPLF_Trace_opt","CFPLF_Trace",locals(),
+                               "CFPLF_Trace_cython")
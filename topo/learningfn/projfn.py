@@ -32,19 +32,15 @@ class CFPLF_EuclideanHebbian(CFPLearningFn):
         # rate like some do, so it does not use constant_sum_connection_rate()
 
         cfs = iterator.flatcfs
-        rows,cols = output_activity.shape
-        for r in xrange(rows):
-            for c in xrange(cols):
-                flati = r*cols+c
-                out = output_activity.flat[flati]
-                if out !=0:
-                    rate = learning_rate * out
-                    cf = cfs[flati]
-                    X = cf.get_input_matrix(input_activity)
-                    cf.weights += rate * (X - cf.weights)
+        active = np.flatnonzero(output_activity)
+        for flati,out in zip(active,output_activity.flat[active]):
+            rate = learning_rate * out
+            cf = cfs[flati]
+            X = cf.get_input_matrix(input_activity)
+            cf.weights += rate * (X - cf.weights)
 
-                    # CEBHACKALERT: see ConnectionField.__init__()
-                    cf.weights *= cf.mask
+            # CEBHACKALERT: see ConnectionField.__init__()
+            cf.weights *= cf.mask
 
 
 
@@ -122,13 +118,13 @@ class CFPLF_Trace(CFPLearningFn):
         ##Initialise traces to zero if they don't already exist
         if not hasattr(self,'traces'):
             self.traces=np.zeros(output_activity.shape,activity_type)
-        for cf,i in iterator():
-            unit_activity = output_activity.flat[i]
-            #   print "unit activity is",unit_activity
-        #    print "self trace is",self.traces[r,c]
-            new_trace = (self.trace_strength*unit_activity)+((1-self.trace_strength)*self.traces.flat[i])
-        #     print "and is now",new_trace
-            self.traces.flat[i] = new_trace
+        cfs = iterator.flatcfs
+        indices = iterator.indices()
+        # update the traces of all the units being processed at once
+        new_traces = (self.trace_strength*output_activity.flat[indices])+((1-self.trace_strength)*self.traces.flat[indices])
+        self.traces.flat[indices] = new_traces
+        for i,new_trace in zip(indices,new_traces):
+            cf = cfs[i]
             cf.weights += single_connection_learning_rate * new_trace * \
                               (cf.get_input_matrix(input_activity) - cf.weights)
 
@@ -156,9 +152,12 @@ class CFPLF_OutstarHebbian(CFPLearningFn):
         # avoid evaluating these references each time in the loop
         single_cf_fn = self.single_cf_fn
         outstar_wsum = np.zeros(input_activity.shape)
-        for cf,i in iterator():
+        cfs = iterator.flatcfs
+        indices = iterator.indices()
+        for i,unit_activity in zip(indices,output_activity.flat[indices]):
+            cf = cfs[i]
             single_cf_fn(cf.get_input_matrix(input_activity),
-                         output_activity.flat[i], cf.weights, single_connection_learning_rate)
+                         unit_activity, cf.weights, single_connection_learning_rate)
             # Outstar normalization
             wrows,wcols = cf.weights.shape
             for wr in xrange(wrows):
@@ -212,7 +211,8 @@ class HomeoSynaptic(CFPLearningFn):
 
 
             # normalize initial weights to 1.0
-            for cf,i in iterator():
+            for i in iterator.indices():
+                cf = iterator.flatcfs[i]
                 current_norm_value = 1.0*np.sum(abs(cf.weights.ravel()))
                 if current_norm_value != 0:
                     factor = (1.0/current_norm_value)
@@ -227,12 +227,16 @@ class HomeoSynaptic(CFPLearningFn):
 
         # avoid evaluating these references each time in the loop
         single_cf_fn = self.single_cf_fn
-        for cf,i in iterator():
+        cfs = iterator.flatcfs
+        indices = iterator.indices()
+        for i,unit_activity,unit_norm in zip(indices,output_activity.flat[indices],
+                                             activity_norm.flat[indices]):
+            cf = cfs[i]
             single_cf_fn(cf.get_input_matrix(input_activity),
-                         output_activity.flat[i], cf.weights, single_connection_learning_rate)
+                         unit_activity, cf.weights, single_connection_learning_rate)
 
             # homeostatic normalization
-            cf.weights /= activity_norm.flat[i]
+            cf.weights /= unit_norm
 
             # CEBHACKALERT: see ConnectionField.__init__()
             cf.weights *= cf.mask
@@ -269,10 +273,14 @@ class CFPLF_PluginScaled(CFPLearningFn):
         single_cf_fn = self.single_cf_fn
         single_connection_learning_rate = self.constant_sum_connection_rate(iterator.proj_n_units,learning_rate)
 
-        for cf,i in iterator():
-            sc_learning_rate = self.learning_rate_scaling_factor.flat[i] * single_connection_learning_rate
+        cfs = iterator.flatcfs
+        indices = iterator.indices()
+        sc_learning_rates = self.learning_rate_scaling_factor.flat[indices] * single_connection_learning_rate
+        for i,unit_activity,sc_learning_rate in zip(indices,output_activity.flat[indices],
+                                                    sc_learning_rates):
+            cf = cfs[i]
             single_cf_fn(cf.get_input_matrix(input_activity),
-                         output_activity.flat[i], cf.weights, sc_learning_rate)
+                         unit_activity, cf.weights, sc_learning_rate)
             # CEBHACKALERT: see ConnectionField.__init__() re. mask & output fn
             cf.weights *= cf.mask
 
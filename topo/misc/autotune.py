@@ -0,0 +1,300 @@
+"""
+Support for choosing, at run time, the fastest of several equivalent
+implementations of a CFProjection's functions.
+
+A projection's response_fn, learning_fn and weights_output_fns can
+each be computed by a pure-Python plugin, a weave ``_opt`` component
+or a Cython ``_cython`` component from topo.optimized, and which of
+these is fastest depends on the machine and on the size and density
+of the projection. The autotuned components CFPRF_Autotuned
+(topo.responsefn.optimized), CFPLF_Autotuned
+(topo.learningfn.optimized) and CFPOF_Autotuned
+(topo.transferfn.optimized) use choose() the first time they are
+called for a projection to time each of their candidates on that
+projection, and then dispatch to the fastest one whose results match
+those of the first (reference) candidate.
+
+Decisions are stored in a cache file (see load_choices()), keyed by
+the machine and by the geometry of the projection, so that later runs
+of the same model on the same machine skip the timing.
+"""
+
+import os
+import socket
+import platform
+import time
+import cPickle as pickle
+
+import numpy as np
+
+import param
+
+
+def machine_key():
+    """
+    Return a tuple identifying the machine (and the number of OpenMP
+    threads the kernels will use) that timings were measured on.
+    """
+    return (socket.gethostname(), platform.machine(),
+            os.environ.get('OMP_NUM_THREADS'))
+
+
+def projection_key(proj):
+    """
+    Return a tuple describing the geometry and weight storage of the
+    given CFProjection: the properties that the relative speed of
+    equivalent implementations depends on.
+    """
+    if hasattr(proj,'_cf_sizes'):
+        # (cached by the projection, so this is cheap enough to do
+        # for every call of an autotuned component)
+        weight_bytes = int(proj._cf_sizes()[0].sum())
+    else:
+        weight_bytes = sum(cf.weights.nbytes for cf in proj.flatcfs if cf is not None)
+    return (type(proj).__name__, proj.src.activity.shape, proj.dest.activity.shape,
+            len(proj.flatcfs), weight_bytes,
+            np.dtype(getattr(proj,'weight_dtype','float32')).name,
+            getattr(proj,'_packed',None) is not None)
+
+
+def load_choices(filename):
+    """
+    Return the dictionary of decisions stored in the given cache file,
+    or an empty dictionary if there is no (readable) file.
+    """
+    try:
+        with open(filename,'rb') as f:
+            return pickle.load(f)
+    except (IOError,EOFError,pickle.UnpicklingError):
+        return {}
+
+
+def save_choice(filename,key,name):
+    """
+    Record in the given cache file that the candidate with the given
+    name is to be used for key, keeping any other decisions already
+    stored there.
+    """
+    choices = load_choices(filename)
+    choices[key] = name
+    tmpname = filename + '.tmp%d' % os.getpid()
+    try:
+        with open(tmpname,'wb') as f:
+            pickle.dump(choices,f,pickle.HIGHEST_PROTOCOL)
+        os.rename(tmpname,filename)
+    except (IOError,OSError) as e:
+        param.main.warning("Could not save autotuning decision to %s: %s" % (filename,e))
+
+
+def candidate_name(fn):
+    """Name identifying a candidate in the cache file."""
+    return type(fn).__name__
+
+
+def cython_candidates(names):
+    """
+    Return instances of those of the named topo.optimized components
+    that exist. topo.optimized is only imported here, as importing it
+    builds the Cython extension.
+    """
+    import topo.optimized
+    return [getattr(topo.optimized,name)() for name in names
+            if hasattr(topo.optimized,name)]
+
+
+def _packed_weights(proj):
+    # The PackedWeights of the projection's CFs, if any
+    get_packed_weights = getattr(proj,'get_packed_weights',None)
+    return None if get_packed_weights is None else get_packed_weights()
+
+
+def weights_state(proj):
+    """
+    Return a copy of the weights and stored norm totals of the given
+    CFProjection, for use with restore_weights_state().
+    """
+    packed = _packed_weights(proj)
+    if packed is not None:
+        return [packed.weights.copy(),packed.norm_total.copy(),
+                packed.has_norm_total.copy()]
+    return [(cf.weights.copy(),cf._norm_total.copy(),cf._has_norm_total.copy())
+            for cf in proj.flatcfs if cf is not None]
+
+
+def restore_weights_state(proj,state):
+    """Restore a state returned by weights_state()."""
+    packed = _packed_weights(proj)
+    if packed is not None:
+        packed.weights[...] = state[0]
+        packed.norm_total[...] = state[1]
+        packed.has_norm_total[...] = state[2]
+    else:
+        for cf,(weights,norm_total,has_norm_total) in \
+                zip([cf for cf in proj.flatcfs if cf is not None],state):
+            cf.weights[...] = weights
+            cf._norm_total[...] = norm_total
+            cf._has_norm_total[...] = has_norm_total
+
+
+def weights_reset(proj):
+    """
+    Return a function for choose() that restores the weights and
+    norm totals that the given CFProjection has when it is first
+    called.
+    """
+    state = []
+    def reset():
+        if not state:
+            state.append(weights_state(proj))
+        else:
+            restore_weights_state(proj,state[0])
+    return reset
+
+
+def all_weights(proj):
+    """Return a flat copy of all the weights of the given CFProjection."""
+    packed = _packed_weights(proj)
+    if packed is not None:
+        return packed.weights.astype(np.float64)
+    return np.concatenate([cf.weights.ravel() for cf in proj.flatcfs
+                           if cf is not None]).astype(np.float64)
+
+
+# Lazily built data that some candidates store on the projection
+# (see CFProjection.get_cf_matrix() and get_outstar_index()); these
+# are discarded after timing so that, unless the chosen candidate
+# needs them, they are neither kept in memory nor kept up to date.
+_derived_attributes = ('_cf_matrix','_outstar_index')
+
+
+def choose(component,candidates,proj,run,result,reset=None,
+           repeats=3,tolerance=1e-6,cache_file=None):
+    """
+    Return the fastest of the given candidates for the given
+    projection, among those whose result matches that of the first
+    candidate.
+
+    run(fn) must call candidate fn on the projection, result() must
+    return an array of the results of the most recent run, and
+    reset(), if supplied, must undo the effects of a run. Each
+    candidate is run once untimed (so that weave components are
+    compiled, and lazily built data created, before timing) and then
+    repeats times, the best time being used. A candidate whose result
+    differs from the reference by more than tolerance times the
+    largest reference value, or which raises an exception, is not
+    considered. The caller's projection state is reset afterwards,
+    so the chosen candidate must still be run.
+
+    If cache_file is not None, a decision previously stored there for
+    the same component, candidates, machine and projection geometry
+    is returned without timing, and a new decision is stored there.
+    """
+    names = [candidate_name(fn) for fn in candidates]
+    key = (component,tuple(names),machine_key(),projection_key(proj))
+
+    if cache_file is not None:
+        cache_file = param.normalize_path(cache_file)
+        name = load_choices(cache_file).get(key)
+        if name in names:
+            return candidates[names.index(name)]
+
+    derived = dict((a,getattr(proj,a,None)) for a in _derived_attributes)
+    reference = None
+    timings = []
+    try:
+        for fn in candidates:
+            try:
+                times = []
+                for i in range(repeats+1):
+                    if reset is not None:
+                        reset()
+                    start = time.time()
+                    run(fn)
+                    times.append(time.time()-start)
+                output = result()
+            except Exception as e:
+                proj.warning("Autotuning %s: %s failed (%s); not using it."
+                             % (component,candidate_name(fn),e))
+                continue
+
+            if reference is None:
+                reference,reference_name = output,candidate_name(fn)
+                scale = max(np.abs(reference).max(),1.0) if reference.size else 1.0
+            elif output.shape != reference.shape or \
+                    np.abs(output-reference).max() > tolerance*scale:
+                proj.warning("Autotuning %s: results of %s differ from those of %s; not using it."
+                             % (component,candidate_name(fn),reference_name))
+                continue
+            timings.append((min(times[1:]),fn))
+    finally:
+        if reset is not None:
+            reset()
+        for a,value in derived.items():
+            if getattr(proj,a,None) is not value:
+                setattr(proj,a,value)
+
+    if not timings:
+        raise ValueError("Autotuning %s for %s: none of the candidates %s could be used."
+                         % (component,proj.name,names))
+
+    best_time,best = min(timings,key=lambda t: t[0])
+    proj.verbose("Autotuning %s: using %s (%s)." % (component,candidate_name(best),
+        ", ".join("%s %.3gs" % (candidate_name(fn),t) for t,fn in timings)))
+    if cache_file is not None:
+        save_choice(cache_file,key,candidate_name(best))
+    return best
+
+
+class AutotunedFn(param.Parameterized):
+    """
+    Parameters and dispatching shared by the autotuned projection-level
+    components, which call one of their candidates, chosen by
+    choose() the first time they are used for a projection of a
+    particular geometry.
+
+    Subclasses must also inherit from the type of component they
+    replace, and declare a candidates parameter listing components of
+    that type (the first being the reference implementation).
+    """
+    __abstract = True
+
+    cython_candidates = param.List(default=[],class_=str,doc="""
+        Names of topo.optimized components to add to the candidates
+        (if they exist).  topo.optimized, which builds the Cython
+        extension when first imported, is imported only if this list
+        is not empty.""")
+
+    repeats = param.Integer(default=3,bounds=(1,None),doc="""
+        Number of timed runs of each candidate (after one untimed run);
+        the fastest run is used.""")
+
+    tolerance = param.Number(default=1e-6,bounds=(0,None),doc="""
+        Maximum difference from the results of the first candidate,
+        relative to the largest of those results, for a candidate
+        to be used.""")
+
+    cache_file = param.String(default='autotune.pickle',allow_None=True,doc="""
+        File storing the decisions, relative to the output path
+        (see param.normalize_path); None not to store them.""")
+
+    def __init__(self,**params):
+        super(AutotunedFn,self).__init__(**params)
+        self._choices = {}
+
+
+    def _chosen(self,component,proj,run,result,reset=None):
+        """
+        Return the candidate to use for the given projection, calling
+        choose() with the given run, result and reset functions if
+        there is no decision yet for its geometry.
+        """
+        key = projection_key(proj)
+        fn = self._choices.get(key)
+        if fn is None:
+            candidates = list(self.candidates)
+            if self.cython_candidates:
+                candidates += cython_candidates(self.cython_candidates)
+            fn = choose(component,candidates,proj,run,result,reset,
+                        self.repeats,self.tolerance,self.cache_file)
+            self._choices[key] = fn
+        return fn
@@ -80,7 +80,8 @@ for (int i=0; i<Nred[0]; ++i) {
     return numpy.dstack((hue,sat,val))
 
 
-provide_unoptimized_equivalent("_rgb_to_hsv_array_opt","_rgb_to_hsv_array",locals())
+provide_unoptimized_equivalent("_rgb_to_hsv_array_opt","_rgb_to_hsv_array",locals(),
+                               "rgb_to_hsv_array_cython")
 
 
 
@@ -146,6 +147,7 @@ for (int i=0; i<Nhue[0]; ++i) {
     inline(code, ['red','grn','blu','hue','sat','val'], local_dict=locals())
     return numpy.dstack((red,grn,blu))
 
-provide_unoptimized_equivalent("_hsv_to_rgb_array_opt","_hsv_to_rgb_array",locals())
+provide_unoptimized_equivalent("_hsv_to_rgb_array_opt","_hsv_to_rgb_array",locals(),
+                               "hsv_to_rgb_array_cython")
 
 
@@ -49,6 +49,8 @@ import collections
 import os
 from copy import copy
 
+import numpy as np
+
 # If import_weave is not defined, or is set to True, will attempt to
 # import weave.  Set import_weave to False if you want to avoid weave
 # altogether, e.g. if your installation is broken.
@@ -166,7 +168,8 @@ warn_for_each_unoptimized_component = False
 # JABALERT: I can't see any reason why this function accepts names rather
 # than the more pythonic option of accepting objects, from which names
 # can be extracted if necessary.
-def provide_unoptimized_equivalent(optimized_name, unoptimized_name, local_dict):
+def provide_unoptimized_equivalent(optimized_name, unoptimized_name, local_dict,
+                                   cython_name=None):
     """
     If not using optimization, replace the optimized component with its unoptimized equivalent.
 
@@ -186,12 +189,25 @@ def provide_unoptimized_equivalent(optimized_name, unoptimized_name, local_dict)
       if not optimized:
         sort_opt = sort
         print 'module: Inline-optimized components not available; using sort instead of sort_opt.'
+
+    If cython_name is given, it names a plug-compatible component in
+    topo.optimized that is used in preference to the unoptimized one
+    if the Cython components could be built.  topo.optimized, which
+    builds them when first imported, is imported only if it is needed
+    here.
     """
     if not optimized:
-        local_dict[optimized_name] = local_dict[unoptimized_name]
+        replacement_name = unoptimized_name
+        replacement = local_dict[unoptimized_name]
+        if cython_name is not None:
+            import topo.optimized
+            if topo.optimized.cython_optimized:
+                replacement_name = cython_name
+                replacement = getattr(topo.optimized,cython_name)
+        local_dict[optimized_name] = replacement
         if warn_for_each_unoptimized_component:
             print '%s: Inline-optimized components not available; using %s instead of %s.' \
-                  % (local_dict['__name__'], optimized_name, unoptimized_name)
+                  % (local_dict['__name__'], replacement_name, optimized_name)
 
 if not optimized and not warn_for_each_unoptimized_component:
     print "Note: Inline-optimized components are currently disabled; see topo.misc.inlinec"
@@ -254,6 +270,17 @@ typedef double npfloat;
    if(attr ## _array != 0) { \
        Py_DECREF(attr ## _array); }
 
+/* After a previous DECLARE_SLOT_OFFSET(mask,cls), for a CF obj,
+   declares mask_row, pointing to the first element of its mask, and
+   mask_rowstride, the number of elements from one row of the mask to
+   the next.  The mask need not be contiguous: it is usually a view of
+   a mask template shared by all the CFs, cropped for CFs at the edges
+   of the input sheet (but its rows must be contiguous). */
+#define LOOKUP_MASK_FROM_SLOT_OFFSET(obj) \
+  PyArrayObject *mask_obj = *((PyArrayObject **)((char *)obj + mask_offset)); \
+  float *mask_row = (float *)(mask_obj->data); \
+  npy_intp mask_rowstride = mask_obj->strides[0]/sizeof(float)
+
 #define UNPACK_FOUR_TUPLE(type,i1,i2,i3,i4,tuple) \
   type i1 = *tuple++; \
   type i2 = *tuple++; \
@@ -262,14 +289,16 @@ typedef double npfloat;
 
 #define MASK_THRESHOLD 0.5
 
+/* (requires weight_c_header()) */
 #define SUM_NORM_TOTAL(cf,weights,_norm_total,rr1,rr2,cc1,cc2) \
-  LOOKUP_FROM_SLOT_OFFSET(float,mask,cf); \
+  LOOKUP_MASK_FROM_SLOT_OFFSET(cf); \
   double total = 0.0; \
-  float* weights_init = weights; \
+  weight_t* weights_init = weights; \
   for (int i=rr1; i<rr2; ++i) { \
+    float *mask = mask_row+(i-rr1)*mask_rowstride; \
     for (int j=cc1; j<cc2; ++j) { \
       if (*(mask++) >= MASK_THRESHOLD) { \
-        total += fabs(*weights_init); \
+        total += fabs(WEIGHT_TO_DOUBLE(*weights_init)); \
       } \
       ++weights_init; \
     } \
@@ -277,6 +306,102 @@ typedef double npfloat;
   _norm_total[0] = total
 """
 
+
+# C type in which the C code accesses weights of each type
+_weight_c_types = {'float16':'npy_uint16','float32':'float','float64':'double'}
+
+def weight_c_header(dtype):
+    """
+    Return C declarations of weight_t, the C type of CF weights of
+    the given numpy dtype (float16, float32 or float64), and of the
+    macros WEIGHT_TO_DOUBLE(w) and DOUBLE_TO_WEIGHT(x), which convert
+    weights to and from double, the type in which all arithmetic on
+    them is done.
+
+    The declarations differ for each type, so C code that starts with
+    them is compiled separately for each type of weights it is used
+    with.  C has no half-precision type, so float16 weights are
+    accessed as their bits (see weight_support_code), and arrays of
+    them must be passed to weave as c_weights(array).
+    """
+    name = np.dtype(dtype).name
+    if name=='float16':
+        conversions = ("#define WEIGHT_TO_DOUBLE(w) half_to_double(w)\n"
+                       "#define DOUBLE_TO_WEIGHT(x) double_to_half(x)\n")
+    else:
+        conversions = ("#define WEIGHT_TO_DOUBLE(w) ((double)(w))\n"
+                       "#define DOUBLE_TO_WEIGHT(x) ((weight_t)(x))\n")
+    return "\ntypedef %s weight_t;\n%s" % (_weight_c_types[name],conversions)
+
+
+def c_weights(weights):
+    """
+    Return the given array of weights as it is to be passed to weave
+    for use as weight_t (see weight_c_header()): a view of the bits of
+    float16 weights, and otherwise the array itself.
+    """
+    return weights.view(np.uint16) if weights.dtype==np.float16 else weights
+
+
+# Support code (to be passed to inline() as support_code) defining
+# the conversions of float16 weights used by weight_c_header()
+weight_support_code = """
+#include <string.h>
+
+/* float16 weights are stored as the bits of IEEE 754 half-precision
+   values, converted to and from double here (rounding to the nearest
+   value, ties to even, as numpy does). */
+static inline double half_to_double(npy_uint16 h) {
+    npy_uint64 sign = ((npy_uint64)(h & 0x8000u)) << 48;
+    npy_uint64 exp = (h >> 10) & 0x1fu;
+    npy_uint64 sig = h & 0x3ffu;
+    npy_uint64 bits;
+    double d;
+    if (exp == 0) {
+        /* zero or subnormal: sig * 2**-24 */
+        d = (double)sig * 5.9604644775390625e-08;
+        return sign ? -d : d;
+    }
+    if (exp == 0x1fu)
+        bits = sign | 0x7ff0000000000000ULL | (sig << 42);
+    else
+        bits = sign | ((exp + 1008) << 52) | (sig << 42);
+    memcpy(&d,&bits,sizeof(d));
+    return d;
+}
+
+static inline npy_uint16 double_to_half(double d) {
+    npy_uint64 bits;
+    memcpy(&bits,&d,sizeof(bits));
+    npy_uint16 sign = (npy_uint16)((bits >> 48) & 0x8000u);
+    int exp = (int)((bits >> 52) & 0x7ffu);
+    npy_uint64 sig = bits & 0x000fffffffffffffULL;
+    if (exp == 0x7ff)
+        /* infinity or NaN */
+        return sign | 0x7c00u | (sig ? 0x200u : 0u);
+    /* the exponent of the half-precision value, before rounding */
+    int e = exp - 1008;
+    if (e >= 31)
+        return sign | 0x7c00u;
+    /* keep the 11 significant bits of a normal value (fewer of a
+       subnormal one), rounding away the rest */
+    int shift = e >= 1 ? 42 : 43 - e;
+    if (shift > 53)
+        return sign;
+    sig |= 0x0010000000000000ULL;
+    npy_uint64 kept = sig >> shift;
+    npy_uint64 rest = sig & ((1ULL << shift) - 1);
+    npy_uint64 halfway = 1ULL << (shift - 1);
+    if (rest > halfway || (rest == halfway && (kept & 1)))
+        ++kept;
+    /* (a carry out of the significand correctly increments the
+       exponent, possibly to infinity) */
+    if (e >= 1)
+        return sign | (npy_uint16)(((npy_uint64)e << 10) + kept - 0x400u);
+    return sign | (npy_uint16)kept;
+}
+"""
+
 # Simple test
 if __name__ == '__main__':
     inline('printf("Hello World!!\\n");')
@@ -57,6 +57,20 @@ def simsize():
 
 
 
+def wtsize():
+    """
+    Return the memory taken by the Sheets' activity and weights, as
+    estimated by topo.command.n_bytes().
+
+    The Projections keep the sizes of their weights from one call to
+    the next (until the weights change shape), so this is cheap enough
+    to call repeatedly, e.g. from memuse_batch().
+    """
+    from topo.command import n_bytes
+    return n_bytes()
+
+
+
 ###############################################################################
 # String-formatted versions of the above
 
@@ -74,8 +88,7 @@ def simsize_mb():
 
 def wtsize_mb():
     """String-formatted version of the memory taken by the weights, from print_sizes()."""
-    from topo.command import n_bytes
-    return "wtsize:%s" % (mb(n_bytes()))
+    return "wtsize:%s" % (mb(wtsize()))
 
 def allsizes_mb():
     """
@@ -84,8 +97,9 @@ def allsizes_mb():
     Formatted to suggest that the topsize is made up of code (not
     currently estimated), topo.sim (apart from weights), and weights.
     """
-    from topo.command import n_bytes
-    return "%s =? code + %s + %s (%s tot)" % (topsize_mb(),simsize_mb(),wtsize_mb(),mb(simsize()+n_bytes()))
+    sim_bytes,wt_bytes = simsize(),wtsize()
+    return "topsize:%s =? code + simsize:%s + wtsize:%s (%s tot)" % \
+           (topsize(),mb(sim_bytes),mb(wt_bytes),mb(sim_bytes+wt_bytes))
 
 
 ###############################################################################
@@ -0,0 +1,77 @@
+"""
+Support for using TickTime (see topo.base.ticktime) as the
+simulation time type.
+"""
+
+from topo.base.ticktime import TickTime, lcm_resolution # pyflakes:ignore (API import)
+
+
+def _event_times(event):
+    # Return the times in an Event (including those of the events in
+    # an EventSequence).
+    from topo.base.simulation import EventSequence, PeriodicEventSequence
+    times = [event.time]
+    if isinstance(event,EventSequence):
+        for e in event.sequence: times += _event_times(e)
+    if isinstance(event,PeriodicEventSequence):
+        times.append(event.period)
+    return times
+
+
+def _set_event_times(event,times):
+    # Set the times returned by _event_times() (consuming them from
+    # the front of the given list).
+    from topo.base.simulation import EventSequence, PeriodicEventSequence
+    event.time = times.pop(0)
+    if isinstance(event,EventSequence):
+        for e in event.sequence: _set_event_times(e,times)
+    if isinstance(event,PeriodicEventSequence):
+        event.period = times.pop(0)
+
+
+def _exact(t):
+    # Value of t that does not depend on TickTime.resolution
+    return t.fraction() if t.__class__ is TickTime else t
+
+
+def use_tick_time(resolution=None):
+    """
+    Make TickTime the time type of the global time function
+    (param.Dynamic.time_fn, i.e. topo.sim.time), optionally setting
+    TickTime.resolution first.
+
+    The current time and the times of any events already scheduled in
+    topo.sim are converted exactly (including any that are already
+    TickTimes, which keep their values when the resolution changes),
+    and the event queue is rebuilt; a ValueError is raised, leaving
+    the resolution and times unchanged, if one of them is not a whole
+    number of ticks.
+
+    Any other TickTime objects (e.g. parameter values) would change
+    value if the resolution changes, so the resolution should be set
+    before they are created.
+    """
+    import param
+    import topo
+
+    time_fn = param.Dynamic.time_fn
+    events = topo.sim.events
+    # (recorded before changing the resolution, so that TickTimes
+    # keep their values)
+    times = [[_exact(t) for t in _event_times(e)] for e in events]
+    now = _exact(time_fn())
+
+    old_resolution = TickTime.resolution
+    if resolution is not None:
+        TickTime.resolution = resolution
+    try:
+        tick_times = [[TickTime(t) for t in ts] for ts in times]
+        now = TickTime(now)
+    except ValueError:
+        TickTime.resolution = old_resolution
+        raise
+
+    for e,ts in zip(events,tick_times):
+        _set_event_times(e,ts)
+    time_fn(now,time_type=TickTime)
+    topo.sim.events = events
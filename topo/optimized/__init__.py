@@ -1,9 +1,14 @@
 import os
+from unittest import SkipTest
 
 (basepath, _) = os.path.split(os.path.abspath(__file__))
 
 warn_for_each_unoptimized_component = False
 
+# Whether the Cython components were built (if not, the names below
+# refer to the unoptimized equivalents in unoptimized.py)
+cython_optimized = False
+
 try:
     from distutils.core import run_setup
 
@@ -11,7 +16,10 @@ try:
     run_setup(basepath + "/compile.py")
 
     from optimized import * # pyflakes:ignore (API import)
-except ImportError:
+    cython_optimized = True
+except (ImportError, SkipTest, SystemExit):
+    # (compile.py raises SkipTest if Cython is missing, and distutils
+    # exits if the extension fails to compile)
     print "WARNING: Install distutils and Cython to build optimized component, " \
           "falling back to unoptimized components."
-    from unoptimized import * # pyflakes:ignore (API import)
\ No newline at end of file
+    from unoptimized import * # pyflakes:ignore (API import)
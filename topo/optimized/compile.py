@@ -19,7 +19,8 @@ ext_module = Extension(
     extra_compile_args=['-fopenmp', '-O2', '-Wno-unused-variable',
                         '-fomit-frame-pointer','-funroll-loops'],
     extra_link_args=['-fopenmp', '-lstdc++'],
-    include_dirs=[numpy.get_include()]
+    include_dirs=[numpy.get_include()],
+    depends=[basepath + "/optimized.h", basepath + "/optimized_weights.h"]
 )
 
 setup_args = ['--quiet', 'build_ext', '--build-lib', basepath]
@@ -1,6 +1,8 @@
 #include <structmember.h>
 #include <omp.h>
 #include <math.h>
+#include <stdlib.h>
+#include <string.h>
 
 /* For a given class cls and an attribute attr, defines a variable
    attr_offset containing the offset of that attribute in the class's
@@ -53,6 +55,17 @@
    if(attr ## _array != 0) { \
        Py_DECREF(attr ## _array); }
 
+/* After a previous DECLARE_SLOT_OFFSET(mask,cls), for a CF obj,
+   declares mask_row, pointing to the first element of its mask, and
+   mask_rowstride, the number of elements from one row of the mask to
+   the next.  The mask need not be contiguous: it is usually a view of
+   a mask template shared by all the CFs, cropped for CFs at the edges
+   of the input sheet (but its rows must be contiguous). */
+#define LOOKUP_MASK_FROM_SLOT_OFFSET(obj) \
+  PyArrayObject *mask_obj = *((PyArrayObject **)((char *)obj + mask_offset)); \
+  float *mask_row = (float *)(mask_obj->data); \
+  npy_intp mask_rowstride = mask_obj->strides[0]/sizeof(float)
+
 #define UNPACK_FOUR_TUPLE(type,i1,i2,i3,i4,tuple) \
   type i1 = *tuple++; \
   type i2 = *tuple++; \
@@ -61,15 +74,17 @@
 
 #define MASK_THRESHOLD 0.5
 
+/* (requires weight_t and WEIGHT_TO_DOUBLE; see below) */
 #define SUM_NORM_TOTAL(cf,weights,_norm_total,rr1,rr2,cc1,cc2) \
-  LOOKUP_FROM_SLOT_OFFSET(float,mask,cf); \
+  LOOKUP_MASK_FROM_SLOT_OFFSET(cf); \
   double total = 0.0; \
-  float* weights_init = weights; \
+  weight_t* weights_init = weights; \
   int i, j; \
   for (i=rr1; i<rr2; ++i) { \
+    float *mask = mask_row+(i-rr1)*mask_rowstride; \
     for (j=cc1; j<cc2; ++j) { \
       if (*(mask++) >= MASK_THRESHOLD) { \
-        total += fabs(*weights_init); \
+        total += fabs(WEIGHT_TO_DOUBLE(*weights_init)); \
       } \
       ++weights_init; \
     } \
@@ -77,315 +92,291 @@
   _norm_total[0] = total
 
 
+/* float16 weights are stored as the bits of IEEE 754 half-precision
+   values, converted to and from double here (rounding to the nearest
+   value, ties to even, as numpy does). */
+static inline double half_to_double(npy_uint16 h) {
+    npy_uint64 sign = ((npy_uint64)(h & 0x8000u)) << 48;
+    npy_uint64 exp = (h >> 10) & 0x1fu;
+    npy_uint64 sig = h & 0x3ffu;
+    npy_uint64 bits;
+    double d;
+    if (exp == 0) {
+        /* zero or subnormal: sig * 2**-24 */
+        d = (double)sig * 5.9604644775390625e-08;
+        return sign ? -d : d;
+    }
+    if (exp == 0x1fu)
+        bits = sign | 0x7ff0000000000000ULL | (sig << 42);
+    else
+        bits = sign | ((exp + 1008) << 52) | (sig << 42);
+    memcpy(&d,&bits,sizeof(d));
+    return d;
+}
 
-void dot_product(double mask[], double X[], double strength, int icols,
-                 double temp_act[], PyObject* cfs, int num_cfs, PyObject* cf_type) {
-
-    DECLARE_SLOT_OFFSET(weights,cf_type);
-    DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
-
-    int r, i, j;
-
-    #pragma omp parallel for schedule(guided, 8)
-    for (r=0; r<num_cfs; ++r) {
-        if(mask[r] == 0.0) {
-            temp_act[r] = 0;
-        } else {
-            PyObject *cf = PyList_GetItem(cfs,r);
-
-            LOOKUP_FROM_SLOT_OFFSET_UNDECL_DATA(float,weights,cf);
-            char *data = weights_obj->data;
-            int s0 = weights_obj->strides[0];
-            int s1 = weights_obj->strides[1];
-
-            LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
+static inline npy_uint16 double_to_half(double d) {
+    npy_uint64 bits;
+    npy_uint16 sign;
+    int exp, e, shift;
+    npy_uint64 sig, kept, rest, halfway;
+    memcpy(&bits,&d,sizeof(bits));
+    sign = (npy_uint16)((bits >> 48) & 0x8000u);
+    exp = (int)((bits >> 52) & 0x7ffu);
+    sig = bits & 0x000fffffffffffffULL;
+    if (exp == 0x7ff)
+        /* infinity or NaN */
+        return sign | 0x7c00u | (sig ? 0x200u : 0u);
+    /* the exponent of the half-precision value, before rounding */
+    e = exp - 1008;
+    if (e >= 31)
+        return sign | 0x7c00u;
+    /* keep the 11 significant bits of a normal value (fewer of a
+       subnormal one), rounding away the rest */
+    shift = e >= 1 ? 42 : 43 - e;
+    if (shift > 53)
+        return sign;
+    sig |= 0x0010000000000000ULL;
+    kept = sig >> shift;
+    rest = sig & ((1ULL << shift) - 1);
+    halfway = 1ULL << (shift - 1);
+    if (rest > halfway || (rest == halfway && (kept & 1)))
+        ++kept;
+    /* (a carry out of the significand correctly increments the
+       exponent, possibly to infinity) */
+    if (e >= 1)
+        return sign | (npy_uint16)(((npy_uint64)e << 10) + kept - 0x400u);
+    return sign | (npy_uint16)kept;
+}
 
-            UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
 
-            double tot = 0.0;
-            double *xj = X+icols*rr1+cc1;
+/* The functions accessing the weights of CFs (optimized_weights.h),
+   defined for each type of weights: float16 (accessed as its bits),
+   float32 and float64. */
+
+#define weight_t npy_uint16
+#define WEIGHT_TO_DOUBLE(w) half_to_double(w)
+#define DOUBLE_TO_WEIGHT(x) double_to_half(x)
+#define WEIGHT_FN(name) name ## _float16
+#include "optimized_weights.h"
+#undef weight_t
+#undef WEIGHT_TO_DOUBLE
+#undef DOUBLE_TO_WEIGHT
+#undef WEIGHT_FN
+
+#define weight_t float
+#define WEIGHT_TO_DOUBLE(w) ((double)(w))
+#define DOUBLE_TO_WEIGHT(x) ((weight_t)(x))
+#define WEIGHT_FN(name) name ## _float32
+#include "optimized_weights.h"
+#undef WEIGHT_FN
+#undef weight_t
+
+#define weight_t double
+#define WEIGHT_FN(name) name ## _float64
+#include "optimized_weights.h"
+#undef WEIGHT_FN
+#undef weight_t
+#undef WEIGHT_TO_DOUBLE
+#undef DOUBLE_TO_WEIGHT
+
+/* Calls the version of function name for weights of weight_size
+   bytes with the given (parenthesized) arguments */
+#define CALL_FOR_WEIGHT_SIZE(name,weight_size,args) \
+  switch (weight_size) { \
+    case 2: name ## _float16 args; break; \
+    case 8: name ## _float64 args; break; \
+    default: name ## _float32 args; \
+  }
 
-            // computes the dot product
-            for (i=rr1; i<rr2; ++i) {
-                double *xi = xj;
 
-           for (j=cc1; j<cc2; ++j) {
-              tot += *((float *)(data + (i-rr1)*s0 + (j-cc1)*s1)) * *xi;
-              ++xi;
-           }
-                xj += icols;
-            }
-            temp_act[r] = tot*strength;
-        }
-    }
+void dot_product(int weight_size, double mask[], double X[], double strength, int icols,
+                 double temp_act[], PyObject* cfs, int slices[], int num_cfs,
+                 PyObject* cf_type) {
+    CALL_FOR_WEIGHT_SIZE(dot_product,weight_size,
+        (mask,X,strength,icols,temp_act,cfs,slices,num_cfs,cf_type));
 }
 
 
-void euclidean_response(double input_activity[], double strength, int icols,
-                        double temp_act[], PyObject* cfs, int num_cfs) {
-    double *tact = temp_act;
-    double max_dist=0.0;
-
-    int r;
-
-    for (r=0; r<num_cfs; ++r) {
-        PyObject *cf = PyList_GetItem(cfs,r);
+void euclidean_response(int weight_size, double input_activity[], double strength, int icols,
+                        double temp_act[], PyObject* cfs, int slices[], int num_cfs) {
+    CALL_FOR_WEIGHT_SIZE(euclidean_response,weight_size,
+        (input_activity,strength,icols,temp_act,cfs,slices,num_cfs));
+}
 
-        PyObject *weights_obj = PyObject_GetAttrString(cf,"weights");
-        PyObject *slice_obj   = PyObject_GetAttrString(cf,"input_sheet_slice");
 
-        float *wj = (float *)(((PyArrayObject*)weights_obj)->data);
-        int *slice =  (int *)(((PyArrayObject*)slice_obj)->data);
+/* Learning Functions including simple Hebbian, BCM etc. */
 
-        int rr1 = *slice++;
-        int rr2 = *slice++;
-        int cc1 = *slice++;
-        int cc2 = *slice;
+void hebbian(int weight_size, double input_activity[], double output_activity[],
+             double sheet_mask[], const int num_cfs, const int icols,
+             PyObject* cfs, int slices[], double single_connection_learning_rate,
+             PyObject* cf_type) {
+    CALL_FOR_WEIGHT_SIZE(hebbian,weight_size,
+        (input_activity,output_activity,sheet_mask,num_cfs,icols,cfs,slices,
+         single_connection_learning_rate,cf_type));
+}
 
-        double *xj = input_activity+icols*rr1+cc1;
 
-        int i, j;
+void bcm_fixed(int weight_size, double input_activity[], double output_activity[], int num_cfs,
+               int icols, PyObject* cfs, int slices[],
+               double single_connection_learning_rate,
+               double unit_threshold, PyObject* cf_type) {
+    CALL_FOR_WEIGHT_SIZE(bcm_fixed,weight_size,
+        (input_activity,output_activity,num_cfs,icols,cfs,slices,
+         single_connection_learning_rate,unit_threshold,cf_type));
+}
 
-        // computes the dot product
-        double tot = 0.0;
-        for (i=rr1; i<rr2; ++i) {
-            double *xi = xj;
-            float *wi = wj;
-            for (j=cc1; j<cc2; ++j) {
-                double diff = *wi - *xi;
-                tot += diff*diff;
-                ++wi;
-                ++xi;
-            }
-            xj += icols;
-            wj += cc2-cc1;
-        }
 
-        double euclidean_distance = sqrt(tot);
-        if (euclidean_distance>max_dist)
-            max_dist = euclidean_distance;
+void trace_learning(int weight_size, double input_activity[], double traces[], int num_cfs,
+                    int icols, PyObject* cfs, int slices[],
+                    double single_connection_learning_rate,
+                    PyObject* cf_type) {
+    CALL_FOR_WEIGHT_SIZE(trace_learning,weight_size,
+        (input_activity,traces,num_cfs,icols,cfs,slices,
+         single_connection_learning_rate,cf_type));
+}
 
-        *tact = euclidean_distance;
-        ++tact;
 
-        // Anything obtained with PyObject_GetAttrString must be explicitly freed
-        Py_DECREF(weights_obj);
-        Py_DECREF(slice_obj);
-    }
-    tact = temp_act;
-    for (r=0; r<num_cfs; ++r) {
-        *tact = strength*(max_dist - *tact);
-        ++tact;
-    }
+void divisive_normalize_l1(int weight_size, double sheet_mask[], double active_units_mask[],
+                           PyObject* cfs, int slices[], PyObject* cf_type, int num_cfs) {
+    CALL_FOR_WEIGHT_SIZE(divisive_normalize_l1,weight_size,
+        (sheet_mask,active_units_mask,cfs,slices,cf_type,num_cfs));
 }
 
 
-/* Learning Functions including simple Hebbian, BCM etc. */
+void scaled_hebbian(int weight_size, double input_activity[], double output_activity[],
+                    double learning_rate_scaling_factor[], double sheet_mask[],
+                    const int num_cfs, const int icols, PyObject* cfs, int slices[],
+                    double single_connection_learning_rate, PyObject* cf_type) {
+    CALL_FOR_WEIGHT_SIZE(scaled_hebbian,weight_size,
+        (input_activity,output_activity,learning_rate_scaling_factor,sheet_mask,
+         num_cfs,icols,cfs,slices,single_connection_learning_rate,cf_type));
+}
 
-void hebbian(double input_activity[], double output_activity[],
-             double sheet_mask[], const int num_cfs, const int icols,
-             PyObject* cfs, double single_connection_learning_rate, PyObject* cf_type) {
-    DECLARE_SLOT_OFFSET(weights,cf_type);
-    DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
-    DECLARE_SLOT_OFFSET(mask,cf_type);
-    DECLARE_SLOT_OFFSET(_norm_total,cf_type);
-    DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
 
-    int r;
+/* Sheet-level functions */
 
-    #pragma omp parallel for schedule(guided, 8)
-    for (r=0; r<num_cfs; ++r) {
-        double load = output_activity[r];
-        if (load != 0 && sheet_mask[r] != 0) {
-            load *= single_connection_learning_rate;
-
-            PyObject *cf = PyList_GetItem(cfs,r);
-
-            LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
-            LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
-            LOOKUP_FROM_SLOT_OFFSET(float,mask,cf);
-
-            UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
-
-            double total = 0.0;
-
-            // modify non-masked weights
-            double *inpj = input_activity+icols*rr1+cc1;
-            int i, j;
-            for (i=rr1; i<rr2; ++i) {
-                double *inpi = inpj;
-                for (j=cc1; j<cc2; ++j) {
-                    // The mask is floating point, so we have to
-                    // use a robust comparison instead of testing
-                    // against exactly 0.0.
-                    if (*(mask++) >= MASK_THRESHOLD) {
-                          *weights += load * *inpi;
-                          total += fabs(*weights);
-                    }
-                    ++weights;
-                    ++inpi;
-                }
-                inpj += icols;
-            }
-            // store the sum of the cf's weights
-            LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
-            _norm_total[0]=total;
-            LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
-            _has_norm_total[0]=1;
-        }
-    }
+void joint_norm_totals(int weight_size, PyObject* cfs_list, PyObject* slices_list,
+                       double active_units_mask[], double sheet_mask[],
+                       const int num_cfs, const int length, PyObject* cf_type) {
+    CALL_FOR_WEIGHT_SIZE(joint_norm_totals,weight_size,
+        (cfs_list,slices_list,active_units_mask,sheet_mask,num_cfs,length,cf_type));
 }
 
 
-void bcm_fixed(double input_activity[], double output_activity[], int num_cfs,
-               int icols, PyObject* cfs, double single_connection_learning_rate,
-               double unit_threshold, PyObject* cf_type) {
-    DECLARE_SLOT_OFFSET(weights,cf_type);
-    DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
-    DECLARE_SLOT_OFFSET(mask,cf_type);
-    DECLARE_SLOT_OFFSET(_norm_total,cf_type);
-    DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
-
+void neighborhood_mask(double activity[], double mask[], const int rows,
+                       const int cols, const int matradius, const double thr) {
     int r;
 
     #pragma omp parallel for schedule(guided, 8)
-    for (r=0; r<num_cfs; ++r) {
-        double load = output_activity[r];
-        double unit_activity= load;
-        if (load != 0) {
-            load *= single_connection_learning_rate;
-
-            PyObject *cf = PyList_GetItem(cfs,r);
-
-            LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
-            LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
-            LOOKUP_FROM_SLOT_OFFSET(float,mask,cf);
-
-            UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
-
-            double total = 0.0;
-            int i, j;
-
-            // modify non-masked weights
-            double *inpj = input_activity+icols*rr1+cc1;
-            for (i=rr1; i<rr2; ++i) {
-                double *inpi = inpj;
-                for (j=cc1; j<cc2; ++j) {
-                    // The mask is floating point, so we have to
-                    // use a robust comparison instead of testing
-                    // against exactly 0.0.
-                    if (*(mask++) >= MASK_THRESHOLD) {
-                        *weights += load * *inpi * (unit_activity - unit_threshold);
-                        if (*weights<0) { *weights = 0;}
-                        total += fabs(*weights);
+    for (r=0; r<rows; ++r) {
+        int lbr = r-matradius > 0 ? r-matradius : 0;
+        int hbr = r+matradius+1 < rows ? r+matradius+1 : rows;
+        int c;
+        for (c=0; c<cols; ++c) {
+            int lbc = c-matradius > 0 ? c-matradius : 0;
+            int hbc = c+matradius+1 < cols ? c+matradius+1 : cols;
+            // 1.0 if any unit in the neighborhood is over the threshold
+            double active = 0.0;
+            int k, l;
+            for (k=lbr; k<hbr && active==0.0; ++k) {
+                for (l=lbc; l<hbc; ++l) {
+                    if (activity[k*cols+l] > thr) {
+                        active = 1.0;
+                        break;
                     }
-                    ++weights;
-                    ++inpi;
                 }
-                inpj += icols;
             }
-            // store the sum of the cf's weights
-            LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
-            _norm_total[0]=total;
-            LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
-            _has_norm_total[0]=1;
+            mask[r*cols+c] = active;
         }
     }
 }
 
 
+/* Color conversion, for n values in each of the (contiguous) channels */
 
-void trace_learning(double input_activity[], double traces[], int num_cfs,
-                    int icols, PyObject* cfs, double single_connection_learning_rate,
-                    PyObject* cf_type) {
-    DECLARE_SLOT_OFFSET(weights,cf_type);
-    DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
-    DECLARE_SLOT_OFFSET(mask,cf_type);
-    DECLARE_SLOT_OFFSET(_norm_total,cf_type);
-    DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
+#define MIN3(x,y,z)  ((y) <= (z) ? ((x) <= (y) ? (x) : (y)) : ((x) <= (z) ? (x) : (z)))
+#define MAX3(x,y,z)  ((y) >= (z) ? ((x) >= (y) ? (x) : (y)) : ((x) >= (z) ? (x) : (z)))
 
-    int r;
+void rgb_to_hsv(double red[], double grn[], double blu[],
+                double hue[], double sat[], double val[], const int n) {
+    int k;
 
-    #pragma omp parallel for schedule(guided, 8)
-    for (r=0; r<num_cfs; ++r) {
-        double load = traces[r];
-        if (load != 0) {
-            load *= single_connection_learning_rate;
-            PyObject *cf = PyList_GetItem(cfs,r);
-
-            LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
-            LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
-            LOOKUP_FROM_SLOT_OFFSET(float,mask,cf);
-
-            UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
-
-            double total = 0.0;
-            int i, j;
-
-            // modify non-masked weights
-            double *inpj = input_activity+icols*rr1+cc1;
-            for (i=rr1; i<rr2; ++i) {
-                double *inpi = inpj;
-                for (j=cc1; j<cc2; ++j) {
-                    // The mask is floating point, so we have to
-                    // use a robust comparison instead of testing
-                    // against exactly 0.0.
-                    if (*(mask++) >= MASK_THRESHOLD) {
-                        *weights += load * *inpi;
-                        total += fabs(*weights);
-                    }
-                    ++weights;
-                    ++inpi;
-                }
-                inpj += icols;
-            }
-            // store the sum of the cf's weights
-            LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
-            _norm_total[0]=total;
-            LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
-            _has_norm_total[0]=1;
+    #pragma omp parallel for schedule(static)
+    for (k=0; k<n; ++k) {
+        // translation of Python's colorsys.rgb_to_hsv()
+        double r=red[k], g=grn[k], b=blu[k];
+        double minc=MIN3(r,g,b);
+        double maxc=MAX3(r,g,b);
+
+        val[k]=maxc;
+        if (minc==maxc) {
+            hue[k]=0.0;
+            sat[k]=0.0;
+        } else {
+            double delta=maxc-minc;
+            double rc=(maxc-r)/delta;
+            double gc=(maxc-g)/delta;
+            double bc=(maxc-b)/delta;
+            double h;
+
+            sat[k]=delta/maxc;
+            if (r==maxc)
+                h=bc-gc;
+            else if (g==maxc)
+                h=2.0+rc-bc;
+            else
+                h=4.0+gc-rc;
+            h=h/6.0;
+            if (h<0)
+                h+=1;
+            hue[k]=h;
         }
     }
 }
 
 
-void divisive_normalize_l1(double sheet_mask[], double active_units_mask[],
-                           PyObject* cfs, PyObject* cf_type, int num_cfs) {
-    DECLARE_SLOT_OFFSET(weights,cf_type);
-    DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
-    DECLARE_SLOT_OFFSET(_norm_total,cf_type);
-    DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
-    DECLARE_SLOT_OFFSET(mask,cf_type);
-
-    int r;
+void hsv_to_rgb(double hue[], double sat[], double val[],
+                double red[], double grn[], double blu[], const int n) {
+    int k;
 
-    #pragma omp parallel for schedule(guided, 8)
-    for (r=0; r<num_cfs; ++r) {
-        if (active_units_mask[r] != 0 && sheet_mask[r] != 0) {
-            PyObject *cf = PyList_GetItem(cfs,r);
+    #pragma omp parallel for schedule(static)
+    for (k=0; k<n; ++k) {
+        // translation of Python's colorsys.hsv_to_rgb()
+        double h=hue[k], s=sat[k], v=val[k];
+        double r, g, b;
 
-            LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
-            LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
-            LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
-            LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
-
-            UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
-
-            // if normalized total is not available, sum the weights
-            if (_has_norm_total[0] == 0) {
-                SUM_NORM_TOTAL(cf,weights,_norm_total,rr1,rr2,cc1,cc2);
-            }
-
-            // normalize the weights
-            double factor = 1.0/_norm_total[0];
-            int rc = (rr2-rr1)*(cc2-cc1);
-            int i;
-            for (i=0; i<rc; ++i) {
-                *(weights++) *= factor;
+        if (s==0) {
+            r=g=b=v;
+        } else {
+            // (truncated, and the sector wrapped around, as in
+            // colorsys, so that hues outside [0,1) are allowed)
+            int i=(int)(h*6.0);
+
+            double f=(h*6.0)-i;
+            double p=v*(1.0-s);
+            double q=v*(1.0-s*f);
+            double t=v*(1.0-s*(1-f));
+
+            i%=6;
+            if (i<0) i+=6;
+
+            switch(i) {
+                case 0:
+                    r = v;  g = t;  b = p;  break;
+                case 1:
+                    r = q;  g = v;  b = p;  break;
+                case 2:
+                    r = p;  g = v;  b = t;  break;
+                case 3:
+                    r = p;  g = q;  b = v;  break;
+                case 4:
+                    r = t;  g = p;  b = v;  break;
+                default:
+                    r = v;  g = p;  b = q;  break;
             }
-
-            // Indicate that norm_total is stale
-            _has_norm_total[0]=0;
         }
+        red[k]=r;
+        grn[k]=g;
+        blu[k]=b;
     }
-}
\ No newline at end of file
+}
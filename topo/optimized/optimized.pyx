@@ -3,29 +3,48 @@ cimport numpy as np
 
 import param
 
-from topo.base.cf import CFPResponseFn, CFPLearningFn, CFPOutputFn
-from topo.base.functionfamily import ResponseFn, DotProduct, LearningFn, Hebbian
+from topo.base.cf import CFPResponseFn, CFPLearningFn, CFPOutputFn, CFIter
+from topo.base.functionfamily import ResponseFn, DotProduct, LearningFn, Hebbian, TransferFn
+from topo.base.projection import NeighborhoodMask
 from topo.base.sheet import activity_type
+from topo.learningfn.projfn import CFPLF_PluginScaled
+from topo.sheet import compute_joint_norm_totals
+from topo.transferfn import DivisiveNormalizeL1
 
 cdef extern from "optimized.h":
-    void dot_product(double*, double*, np.float64_t, np.int64_t,
-                     double*, cfs, np.int64_t, cf_type)
+    void dot_product(int, double*, double*, np.float64_t, np.int64_t,
+                     double*, cfs, int*, np.int64_t, cf_type)
 
-    void euclidean_response(double*, np.float64_t, np.int64_t, double*, cfs,
-                            np.int64_t)
+    void euclidean_response(int, double*, np.float64_t, np.int64_t, double*, cfs,
+                            int*, np.int64_t)
 
-    void hebbian(double*, double*, double*, np.int64_t,
-                 np.int64_t, cfs, np.float64_t, cf_type)
+    void hebbian(int, double*, double*, double*, np.int64_t,
+                 np.int64_t, cfs, int*, np.float64_t, cf_type)
 
-    void bcm_fixed(double*, double*, np.int64_t, np.int64_t,
-                   cfs, np.float64_t, np.float64_t, cf_type)
+    void bcm_fixed(int, double*, double*, np.int64_t, np.int64_t,
+                   cfs, int*, np.float64_t, np.float64_t, cf_type)
 
-    void trace_learning(double*, double*, np.int64_t, np.int64_t, cfs,
-                        np.float64_t, cf_type)
+    void trace_learning(int, double*, double*, np.int64_t, np.int64_t, cfs,
+                        int*, np.float64_t, cf_type)
 
-    void divisive_normalize_l1(double*, double*, cfs, cf_type,
+    void divisive_normalize_l1(int, double*, double*, cfs, int*, cf_type,
                                np.int64_t)
 
+    void scaled_hebbian(int, double*, double*, double*, double*, np.int64_t,
+                        np.int64_t, cfs, int*, np.float64_t, cf_type)
+
+    void joint_norm_totals(int, cfs_list, slices_list, double*, double*,
+                           np.int64_t, np.int64_t, cf_type)
+
+    void neighborhood_mask(double*, double*, np.int64_t, np.int64_t,
+                           np.int64_t, np.float64_t)
+
+    void rgb_to_hsv(double*, double*, double*, double*, double*, double*,
+                    np.int64_t)
+
+    void hsv_to_rgb(double*, double*, double*, double*, double*, double*,
+                    np.int64_t)
+
 
 class CFPRF_DotProduct_cython(CFPResponseFn):
     """
@@ -47,11 +66,13 @@ class CFPRF_DotProduct_cython(CFPResponseFn):
         cfs = iterator.flatcfs
         cdef np.int64_t num_cfs = len(cfs)
         cdef np.ndarray[np.float64_t, ndim=2] mask = iterator.mask.data
+        cdef np.ndarray[np.int32_t, ndim=2] slices = iterator.slices
 
         cf_type = iterator.cf_type
 
-        dot_product(<double*> mask.data, <double*> X.data, strength, icols,
-                    <double*> activity.data, cfs, num_cfs, cf_type)
+        dot_product(iterator.weight_dtype.itemsize,
+                    <double*> mask.data, <double*> X.data, strength, icols,
+                    <double*> activity.data, cfs, <int*> slices.data, num_cfs, cf_type)
 
 
 class CFPRF_EuclideanDistance_cython(CFPResponseFn):
@@ -70,14 +91,20 @@ class CFPRF_EuclideanDistance_cython(CFPResponseFn):
 
         cfs = iterator.flatcfs
         cdef np.int64_t num_cfs = len(cfs)
+        cdef np.ndarray[np.int32_t, ndim=2] slices = iterator.slices
 
-        euclidean_response(<double*> X.data, strength, icols, <double*> activity.data,
-                           cfs, num_cfs)
+        euclidean_response(iterator.weight_dtype.itemsize,
+                           <double*> X.data, strength, icols, <double*> activity.data,
+                           cfs, <int*> slices.data, num_cfs)
 
 
 
 class CFPLF_Hebbian_cython(CFPLearningFn):
 
+    single_cf_fn = param.ClassSelector(LearningFn,default=Hebbian(),readonly=True)
+
+    learns_active_units_only = True
+
     def __call__(self, iterator, np.ndarray[np.float64_t, ndim=2] input_activity,
                  np.ndarray[np.float64_t, ndim=2] output_activity,
                  np.float64_t learning_rate, **params):
@@ -92,9 +119,11 @@ class CFPLF_Hebbian_cython(CFPLearningFn):
         cf_type = iterator.cf_type
 
         cdef np.ndarray[np.float64_t, ndim=2] sheet_mask = iterator.get_sheet_mask()
+        cdef np.ndarray[np.int32_t, ndim=2] slices = iterator.slices
 
-        hebbian(<double*> input_activity.data, <double*> output_activity.data,
-                <double*> sheet_mask.data, num_cfs, icols, cfs,
+        hebbian(iterator.weight_dtype.itemsize,
+                <double*> input_activity.data, <double*> output_activity.data,
+                <double*> sheet_mask.data, num_cfs, icols, cfs, <int*> slices.data,
                 single_connection_learning_rate, cf_type)
 
 
@@ -117,6 +146,8 @@ class CFPLF_BCMFixed_cython(CFPLearningFn):
     unit_threshold=param.Number(default=0.5, bounds=(0, None), doc="""
         Threshold between LTD and LTP.""")
 
+    learns_active_units_only = True
+
     def __call__(self, iterator, np.ndarray[np.float64_t, ndim=2] input_activity,
                  np.ndarray[np.float64_t, ndim=2] output_activity,
                  np.float64_t learning_rate, **params):
@@ -133,10 +164,12 @@ class CFPLF_BCMFixed_cython(CFPLearningFn):
         cdef np.float64_t unit_threshold=self.unit_threshold
 
         cdef np.int64_t icols = input_activity.shape[1]
+        cdef np.ndarray[np.int32_t, ndim=2] slices = iterator.slices
 
-        bcm_fixed(<double*> input_activity.data, <double*> output_activity.data,
-                  num_cfs, icols, cfs, single_connection_learning_rate,
-                  unit_threshold, cf_type)
+        bcm_fixed(iterator.weight_dtype.itemsize,
+                  <double*> input_activity.data, <double*> output_activity.data,
+                  num_cfs, icols, cfs, <int*> slices.data,
+                  single_connection_learning_rate, unit_threshold, cf_type)
 
 
 
@@ -175,9 +208,12 @@ class CFPLF_Trace_cython(CFPLearningFn):
         traces = self.traces
 
         cdef np.int64_t icols = input_activity.shape[1]
+        cdef np.ndarray[np.int32_t, ndim=2] slices = iterator.slices
 
-        trace_learning(<double*> input_activity.data, <double*> traces.data,
-                       num_cfs, icols, cfs, single_connection_learning_rate, cf_type)
+        trace_learning(iterator.weight_dtype.itemsize,
+                       <double*> input_activity.data, <double*> traces.data,
+                       num_cfs, icols, cfs, <int*> slices.data,
+                       single_connection_learning_rate, cf_type)
 
 
 
@@ -188,12 +224,157 @@ class CFPOF_DivisiveNormalize_L1_cython(CFPOutputFn):
     CFPOF_DivisiveNormalizeL1.
     """
 
+    single_cf_fn = param.ClassSelector(
+        TransferFn,DivisiveNormalizeL1(norm_value=1.0),readonly=True)
+
     def __call__(self, iterator, **params):
         cf_type=iterator.cf_type
         cfs = iterator.flatcfs
         cdef np.int64_t num_cfs = len(iterator.flatcfs)
         cdef np.ndarray[np.float64_t, ndim=2] active_units_mask = iterator.get_active_units_mask()
         cdef np.ndarray[np.float64_t, ndim=2] sheet_mask = iterator.get_sheet_mask()
+        cdef np.ndarray[np.int32_t, ndim=2] slices = iterator.slices
+
+        divisive_normalize_l1(iterator.weight_dtype.itemsize,
+                              <double*> sheet_mask.data, <double*> active_units_mask.data,
+                              cfs, <int*> slices.data, cf_type, num_cfs)
+
+
+# (the name of the non-optimized equivalent in unoptimized.py)
+CFPOF_DivisiveNormalizeL1_cython = CFPOF_DivisiveNormalize_L1_cython
+
+
+
+class CFPLF_Scaled_cython(CFPLF_PluginScaled):
+    """
+    CF-aware Scaled Hebbian learning rule.
+
+    Implemented in C for speed.  Should be equivalent to
+    CFPLF_PluginScaled(single_cf_fn=Hebbian()), except faster.
 
-        divisive_normalize_l1(<double*> sheet_mask.data, <double*> active_units_mask.data,
-                              cfs, cf_type, num_cfs)
+    As a side effect, sets the norm_total attribute on any cf whose
+    weights are updated during learning, to speed up later operations
+    that might depend on it.
+    """
+
+    single_cf_fn = param.ClassSelector(LearningFn,default=Hebbian(),readonly=True)
+
+    learns_active_units_only = True
+
+    def __call__(self, iterator, np.ndarray[np.float64_t, ndim=2] input_activity,
+                 np.ndarray[np.float64_t, ndim=2] output_activity,
+                 np.float64_t learning_rate, **params):
+
+        if self.learning_rate_scaling_factor is None:
+            self.learning_rate_scaling_factor = np.ones(output_activity.shape)
+        cdef np.ndarray[np.float64_t, ndim=2] learning_rate_scaling_factor = \
+            np.ascontiguousarray(self.learning_rate_scaling_factor,dtype=np.float64)
+
+        cdef np.float64_t single_connection_learning_rate = self.constant_sum_connection_rate(iterator.proj_n_units,learning_rate)
+        if single_connection_learning_rate==0:
+            return
+
+        cfs = iterator.flatcfs
+        cdef np.int64_t num_cfs = len(cfs)
+        cdef np.int64_t icols = input_activity.shape[1]
+        cf_type = iterator.cf_type
+
+        cdef np.ndarray[np.float64_t, ndim=2] sheet_mask = iterator.get_sheet_mask()
+        cdef np.ndarray[np.int32_t, ndim=2] slices = iterator.slices
+
+        scaled_hebbian(iterator.weight_dtype.itemsize,
+                       <double*> input_activity.data, <double*> output_activity.data,
+                       <double*> learning_rate_scaling_factor.data, <double*> sheet_mask.data,
+                       num_cfs, icols, cfs, <int*> slices.data,
+                       single_connection_learning_rate, cf_type)
+
+
+
+def compute_joint_norm_totals_cython(projlist,active_units_mask=True):
+    """
+    Compute norm_total for each CF in each projection from a group to
+    be normalized jointly.
+
+    Implemented in C for speed; equivalent to
+    topo.sheet.compute_joint_norm_totals.
+    """
+    assert len(projlist)>=1
+    iterator = CFIter(projlist[0],active_units_mask=active_units_mask)
+
+    if len(set(CFIter(p).weight_dtype for p in projlist))>1:
+        # (the C code reads the weights of all the projections as
+        # the same type)
+        compute_joint_norm_totals(projlist,active_units_mask)
+        return
+
+    cdef np.int64_t num_cfs = len(iterator.flatcfs)
+    cdef np.int64_t length = len(projlist)
+    cdef np.ndarray[np.float64_t, ndim=2] active_units = iterator.get_active_units_mask()
+    cdef np.ndarray[np.float64_t, ndim=2] sheet_mask = iterator.get_sheet_mask()
+    cfs_list = [p.flatcfs for p in projlist]
+    slices_list = [CFIter(p).slices for p in projlist]
+
+    joint_norm_totals(iterator.weight_dtype.itemsize,
+                      cfs_list, slices_list, <double*> active_units.data,
+                      <double*> sheet_mask.data, num_cfs, length, iterator.cf_type)
+
+
+
+class NeighborhoodMask_cython(NeighborhoodMask):
+    """
+    NeighborhoodMask whose calculate() is implemented in C for speed.
+    """
+
+    def calculate(self):
+        cdef np.ndarray[np.float64_t, ndim=2] mask = self.data
+        cdef np.ndarray[np.float64_t, ndim=2] activity = \
+            np.ascontiguousarray(self.sheet.activity,dtype=np.float64)
+        ignore1,matradius = self.sheet.sheet2matrixidx(self.radius,0)
+        ignore2,x = self.sheet.sheet2matrixidx(0,0)
+        cdef np.int64_t radius = int(abs(matradius-x))
+
+        neighborhood_mask(<double*> activity.data, <double*> mask.data,
+                          mask.shape[0], mask.shape[1], radius, self.threshold)
+
+
+
+def _color_channels(array):
+    # Each of the three channels of the 3D array, as contiguous
+    # float64 arrays
+    return [np.ascontiguousarray(array[:,:,i],dtype=np.float64) for i in range(3)]
+
+
+def rgb_to_hsv_array_cython(RGB):
+    """
+    Convert an RGB array (rows x cols x 3) to HSV.
+
+    Implemented in C for speed; equivalent to
+    imagen.colorspaces._rgb_to_hsv_array.
+    """
+    cdef np.ndarray[np.float64_t, ndim=2] red, grn, blu
+    red,grn,blu = _color_channels(RGB)
+    cdef np.ndarray[np.float64_t, ndim=2] hue = np.empty_like(red)
+    cdef np.ndarray[np.float64_t, ndim=2] sat = np.empty_like(red)
+    cdef np.ndarray[np.float64_t, ndim=2] val = np.empty_like(red)
+
+    rgb_to_hsv(<double*> red.data, <double*> grn.data, <double*> blu.data,
+               <double*> hue.data, <double*> sat.data, <double*> val.data, red.size)
+    return np.dstack((hue,sat,val)).astype(RGB.dtype)
+
+
+def hsv_to_rgb_array_cython(HSV):
+    """
+    Convert an HSV array (rows x cols x 3) to RGB.
+
+    Implemented in C for speed; equivalent to
+    imagen.colorspaces._hsv_to_rgb_array.
+    """
+    cdef np.ndarray[np.float64_t, ndim=2] hue, sat, val
+    hue,sat,val = _color_channels(HSV)
+    cdef np.ndarray[np.float64_t, ndim=2] red = np.empty_like(hue)
+    cdef np.ndarray[np.float64_t, ndim=2] grn = np.empty_like(hue)
+    cdef np.ndarray[np.float64_t, ndim=2] blu = np.empty_like(hue)
+
+    hsv_to_rgb(<double*> hue.data, <double*> sat.data, <double*> val.data,
+               <double*> red.data, <double*> grn.data, <double*> blu.data, hue.size)
+    return np.dstack((red,grn,blu)).astype(HSV.dtype)
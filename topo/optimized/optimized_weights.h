@@ -0,0 +1,442 @@
+/* The functions of optimized.h that access the weights of CFs.
+
+   This file is included by optimized.h once for each type of
+   weights, with weight_t defined as the C type in which the weights
+   are accessed, WEIGHT_TO_DOUBLE(w) and DOUBLE_TO_WEIGHT(x)
+   converting them to and from double (in which all the arithmetic is
+   done), and WEIGHT_FN(name) giving the name of each function for
+   that type. */
+
+void WEIGHT_FN(dot_product)(double mask[], double X[], double strength, int icols,
+                            double temp_act[], PyObject* cfs, int slices[], int num_cfs,
+                            PyObject* cf_type) {
+
+    DECLARE_SLOT_OFFSET(weights,cf_type);
+
+    int r, i, j;
+
+    // Collect the location and strides of the weights of each CF
+    // while holding the GIL, so that the loop below uses no Python
+    // objects and other threads (e.g. other projections; see
+    // ProjectionSheet.activation_threads) can run while it does.
+    char **cf_data = (char **)malloc(num_cfs*sizeof(char *));
+    int *cf_s0 = (int *)malloc(num_cfs*sizeof(int));
+    int *cf_s1 = (int *)malloc(num_cfs*sizeof(int));
+    for (r=0; r<num_cfs; ++r) {
+        if(mask[r] != 0.0) {
+            PyObject *cf = PyList_GetItem(cfs,r);
+            LOOKUP_FROM_SLOT_OFFSET_UNDECL_DATA(weight_t,weights,cf);
+            cf_data[r] = weights_obj->data;
+            cf_s0[r] = weights_obj->strides[0];
+            cf_s1[r] = weights_obj->strides[1];
+        }
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+
+    #pragma omp parallel for schedule(guided, 8)
+    for (r=0; r<num_cfs; ++r) {
+        if(mask[r] == 0.0) {
+            temp_act[r] = 0;
+        } else {
+            char *data = cf_data[r];
+            int s0 = cf_s0[r];
+            int s1 = cf_s1[r];
+
+            int *input_sheet_slice = slices+4*r;
+
+            UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
+
+            double tot = 0.0;
+            double *xj = X+icols*rr1+cc1;
+
+            // computes the dot product
+            for (i=rr1; i<rr2; ++i) {
+                double *xi = xj;
+
+           for (j=cc1; j<cc2; ++j) {
+              tot += WEIGHT_TO_DOUBLE(*((weight_t *)(data + (i-rr1)*s0 + (j-cc1)*s1))) * *xi;
+              ++xi;
+           }
+                xj += icols;
+            }
+            temp_act[r] = tot*strength;
+        }
+    }
+
+    Py_END_ALLOW_THREADS
+
+    free(cf_data);
+    free(cf_s0);
+    free(cf_s1);
+}
+
+
+void WEIGHT_FN(euclidean_response)(double input_activity[], double strength, int icols,
+                                   double temp_act[], PyObject* cfs, int slices[], int num_cfs) {
+    double *tact = temp_act;
+    double max_dist=0.0;
+
+    int r;
+
+    for (r=0; r<num_cfs; ++r) {
+        PyObject *cf = PyList_GetItem(cfs,r);
+
+        PyObject *weights_obj = PyObject_GetAttrString(cf,"weights");
+
+        weight_t *wj = (weight_t *)(((PyArrayObject*)weights_obj)->data);
+        int *slice = slices+4*r;
+
+        int rr1 = *slice++;
+        int rr2 = *slice++;
+        int cc1 = *slice++;
+        int cc2 = *slice;
+
+        double *xj = input_activity+icols*rr1+cc1;
+
+        int i, j;
+
+        // computes the dot product
+        double tot = 0.0;
+        for (i=rr1; i<rr2; ++i) {
+            double *xi = xj;
+            weight_t *wi = wj;
+            for (j=cc1; j<cc2; ++j) {
+                double diff = WEIGHT_TO_DOUBLE(*wi) - *xi;
+                tot += diff*diff;
+                ++wi;
+                ++xi;
+            }
+            xj += icols;
+            wj += cc2-cc1;
+        }
+
+        double euclidean_distance = sqrt(tot);
+        if (euclidean_distance>max_dist)
+            max_dist = euclidean_distance;
+
+        *tact = euclidean_distance;
+        ++tact;
+
+        // Anything obtained with PyObject_GetAttrString must be explicitly freed
+        Py_DECREF(weights_obj);
+    }
+    tact = temp_act;
+    for (r=0; r<num_cfs; ++r) {
+        *tact = strength*(max_dist - *tact);
+        ++tact;
+    }
+}
+
+
+/* Learning Functions including simple Hebbian, BCM etc. */
+
+void WEIGHT_FN(hebbian)(double input_activity[], double output_activity[],
+                        double sheet_mask[], const int num_cfs, const int icols,
+                        PyObject* cfs, int slices[], double single_connection_learning_rate,
+                        PyObject* cf_type) {
+    DECLARE_SLOT_OFFSET(weights,cf_type);
+    DECLARE_SLOT_OFFSET(mask,cf_type);
+    DECLARE_SLOT_OFFSET(_norm_total,cf_type);
+    DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
+
+    int r;
+
+    #pragma omp parallel for schedule(guided, 8)
+    for (r=0; r<num_cfs; ++r) {
+        double load = output_activity[r];
+        if (load != 0 && sheet_mask[r] != 0) {
+            load *= single_connection_learning_rate;
+
+            PyObject *cf = PyList_GetItem(cfs,r);
+
+            LOOKUP_FROM_SLOT_OFFSET(weight_t,weights,cf);
+            int *input_sheet_slice = slices+4*r;
+            LOOKUP_MASK_FROM_SLOT_OFFSET(cf);
+
+            UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
+
+            double total = 0.0;
+
+            // modify non-masked weights
+            double *inpj = input_activity+icols*rr1+cc1;
+            int i, j;
+            for (i=rr1; i<rr2; ++i) {
+                double *inpi = inpj;
+                float *mask = mask_row+(i-rr1)*mask_rowstride;
+                for (j=cc1; j<cc2; ++j) {
+                    // The mask is floating point, so we have to
+                    // use a robust comparison instead of testing
+                    // against exactly 0.0.
+                    if (*(mask++) >= MASK_THRESHOLD) {
+                          *weights = DOUBLE_TO_WEIGHT(WEIGHT_TO_DOUBLE(*weights) + load * *inpi);
+                          total += fabs(WEIGHT_TO_DOUBLE(*weights));
+                    }
+                    ++weights;
+                    ++inpi;
+                }
+                inpj += icols;
+            }
+            // store the sum of the cf's weights
+            LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
+            _norm_total[0]=total;
+            LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
+            _has_norm_total[0]=1;
+        }
+    }
+}
+
+
+void WEIGHT_FN(bcm_fixed)(double input_activity[], double output_activity[], int num_cfs,
+                          int icols, PyObject* cfs, int slices[],
+                          double single_connection_learning_rate,
+                          double unit_threshold, PyObject* cf_type) {
+    DECLARE_SLOT_OFFSET(weights,cf_type);
+    DECLARE_SLOT_OFFSET(mask,cf_type);
+    DECLARE_SLOT_OFFSET(_norm_total,cf_type);
+    DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
+
+    int r;
+
+    #pragma omp parallel for schedule(guided, 8)
+    for (r=0; r<num_cfs; ++r) {
+        double load = output_activity[r];
+        double unit_activity= load;
+        if (load != 0) {
+            load *= single_connection_learning_rate;
+
+            PyObject *cf = PyList_GetItem(cfs,r);
+
+            LOOKUP_FROM_SLOT_OFFSET(weight_t,weights,cf);
+            int *input_sheet_slice = slices+4*r;
+            LOOKUP_MASK_FROM_SLOT_OFFSET(cf);
+
+            UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
+
+            double total = 0.0;
+            int i, j;
+
+            // modify non-masked weights
+            double *inpj = input_activity+icols*rr1+cc1;
+            for (i=rr1; i<rr2; ++i) {
+                double *inpi = inpj;
+                float *mask = mask_row+(i-rr1)*mask_rowstride;
+                for (j=cc1; j<cc2; ++j) {
+                    // The mask is floating point, so we have to
+                    // use a robust comparison instead of testing
+                    // against exactly 0.0.
+                    if (*(mask++) >= MASK_THRESHOLD) {
+                        *weights = DOUBLE_TO_WEIGHT(WEIGHT_TO_DOUBLE(*weights) +
+                                                    load * *inpi * (unit_activity - unit_threshold));
+                        if (WEIGHT_TO_DOUBLE(*weights)<0) { *weights = DOUBLE_TO_WEIGHT(0.0);}
+                        total += fabs(WEIGHT_TO_DOUBLE(*weights));
+                    }
+                    ++weights;
+                    ++inpi;
+                }
+                inpj += icols;
+            }
+            // store the sum of the cf's weights
+            LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
+            _norm_total[0]=total;
+            LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
+            _has_norm_total[0]=1;
+        }
+    }
+}
+
+
+
+void WEIGHT_FN(trace_learning)(double input_activity[], double traces[], int num_cfs,
+                               int icols, PyObject* cfs, int slices[],
+                               double single_connection_learning_rate,
+                               PyObject* cf_type) {
+    DECLARE_SLOT_OFFSET(weights,cf_type);
+    DECLARE_SLOT_OFFSET(mask,cf_type);
+    DECLARE_SLOT_OFFSET(_norm_total,cf_type);
+    DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
+
+    int r;
+
+    #pragma omp parallel for schedule(guided, 8)
+    for (r=0; r<num_cfs; ++r) {
+        double load = traces[r];
+        if (load != 0) {
+            load *= single_connection_learning_rate;
+            PyObject *cf = PyList_GetItem(cfs,r);
+
+            LOOKUP_FROM_SLOT_OFFSET(weight_t,weights,cf);
+            int *input_sheet_slice = slices+4*r;
+            LOOKUP_MASK_FROM_SLOT_OFFSET(cf);
+
+            UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
+
+            double total = 0.0;
+            int i, j;
+
+            // modify non-masked weights
+            double *inpj = input_activity+icols*rr1+cc1;
+            for (i=rr1; i<rr2; ++i) {
+                double *inpi = inpj;
+                float *mask = mask_row+(i-rr1)*mask_rowstride;
+                for (j=cc1; j<cc2; ++j) {
+                    // The mask is floating point, so we have to
+                    // use a robust comparison instead of testing
+                    // against exactly 0.0.
+                    if (*(mask++) >= MASK_THRESHOLD) {
+                        *weights = DOUBLE_TO_WEIGHT(WEIGHT_TO_DOUBLE(*weights) + load * *inpi);
+                        total += fabs(WEIGHT_TO_DOUBLE(*weights));
+                    }
+                    ++weights;
+                    ++inpi;
+                }
+                inpj += icols;
+            }
+            // store the sum of the cf's weights
+            LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
+            _norm_total[0]=total;
+            LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
+            _has_norm_total[0]=1;
+        }
+    }
+}
+
+
+void WEIGHT_FN(divisive_normalize_l1)(double sheet_mask[], double active_units_mask[],
+                                      PyObject* cfs, int slices[], PyObject* cf_type, int num_cfs) {
+    DECLARE_SLOT_OFFSET(weights,cf_type);
+    DECLARE_SLOT_OFFSET(_norm_total,cf_type);
+    DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
+    DECLARE_SLOT_OFFSET(mask,cf_type);
+
+    int r;
+
+    #pragma omp parallel for schedule(guided, 8)
+    for (r=0; r<num_cfs; ++r) {
+        if (active_units_mask[r] != 0 && sheet_mask[r] != 0) {
+            PyObject *cf = PyList_GetItem(cfs,r);
+
+            LOOKUP_FROM_SLOT_OFFSET(weight_t,weights,cf);
+            int *input_sheet_slice = slices+4*r;
+            LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
+            LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
+
+            UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
+
+            // if normalized total is not available, sum the weights
+            if (_has_norm_total[0] == 0) {
+                SUM_NORM_TOTAL(cf,weights,_norm_total,rr1,rr2,cc1,cc2);
+            }
+
+            // normalize the weights
+            double factor = 1.0/_norm_total[0];
+            int rc = (rr2-rr1)*(cc2-cc1);
+            int i;
+            for (i=0; i<rc; ++i) {
+                *weights = DOUBLE_TO_WEIGHT(WEIGHT_TO_DOUBLE(*weights)*factor);
+                ++weights;
+            }
+
+            // Indicate that norm_total is stale
+            _has_norm_total[0]=0;
+        }
+    }
+}
+
+void WEIGHT_FN(scaled_hebbian)(double input_activity[], double output_activity[],
+                               double learning_rate_scaling_factor[], double sheet_mask[],
+                               const int num_cfs, const int icols, PyObject* cfs, int slices[],
+                               double single_connection_learning_rate, PyObject* cf_type) {
+    DECLARE_SLOT_OFFSET(weights,cf_type);
+    DECLARE_SLOT_OFFSET(mask,cf_type);
+    DECLARE_SLOT_OFFSET(_norm_total,cf_type);
+    DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
+
+    int r;
+
+    #pragma omp parallel for schedule(guided, 8)
+    for (r=0; r<num_cfs; ++r) {
+        double load = output_activity[r]*learning_rate_scaling_factor[r];
+        if (load != 0 && sheet_mask[r] != 0) {
+            load *= single_connection_learning_rate;
+
+            PyObject *cf = PyList_GetItem(cfs,r);
+
+            LOOKUP_FROM_SLOT_OFFSET(weight_t,weights,cf);
+            int *input_sheet_slice = slices+4*r;
+            LOOKUP_MASK_FROM_SLOT_OFFSET(cf);
+
+            UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
+
+            double total = 0.0;
+
+            // modify non-masked weights
+            double *inpj = input_activity+icols*rr1+cc1;
+            int i, j;
+            for (i=rr1; i<rr2; ++i) {
+                double *inpi = inpj;
+                float *mask = mask_row+(i-rr1)*mask_rowstride;
+                for (j=cc1; j<cc2; ++j) {
+                    if (*(mask++) >= MASK_THRESHOLD) {
+                          *weights = DOUBLE_TO_WEIGHT(WEIGHT_TO_DOUBLE(*weights) + load * *inpi);
+                          total += fabs(WEIGHT_TO_DOUBLE(*weights));
+                    }
+                    ++weights;
+                    ++inpi;
+                }
+                inpj += icols;
+            }
+            // store the sum of the cf's weights
+            LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
+            _norm_total[0]=total;
+            LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
+            _has_norm_total[0]=1;
+        }
+    }
+}
+
+
+/* Sheet-level functions */
+
+void WEIGHT_FN(joint_norm_totals)(PyObject* cfs_list, PyObject* slices_list,
+                                  double active_units_mask[], double sheet_mask[],
+                                  const int num_cfs, const int length, PyObject* cf_type) {
+    DECLARE_SLOT_OFFSET(_norm_total,cf_type);
+    DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
+    DECLARE_SLOT_OFFSET(weights,cf_type);
+    DECLARE_SLOT_OFFSET(mask,cf_type);
+
+    int r, p;
+
+    // (cfs_list and slices_list hold the flatcfs and the
+    // input_sheet_slices table of each projection)
+    for (r=0; r<num_cfs; ++r) {
+        if (sheet_mask[r] != 0 && active_units_mask[r] != 0) {
+            double nt = 0;
+
+            for (p=0; p<length; p++) {
+                PyObject *cf = PyList_GetItem(PyList_GetItem(cfs_list,p),r);
+                LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
+                LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
+                if (_has_norm_total[0] == 0) {
+                    LOOKUP_FROM_SLOT_OFFSET(weight_t,weights,cf);
+                    PyArrayObject *slices = (PyArrayObject *)PyList_GetItem(slices_list,p);
+                    int *input_sheet_slice = (int *)(slices->data)+4*r;
+
+                    UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
+
+                    SUM_NORM_TOTAL(cf,weights,_norm_total,rr1,rr2,cc1,cc2);
+                }
+                nt += _norm_total[0];
+            }
+
+            for (p=0; p<length; p++) {
+                PyObject *cf = PyList_GetItem(PyList_GetItem(cfs_list,p),r);
+                LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
+                _norm_total[0] = nt;
+                LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
+                _has_norm_total[0] = 1;
+            }
+        }
+    }
+}
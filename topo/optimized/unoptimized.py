@@ -10,6 +10,13 @@ from topo.learningfn import BCMFixed
 from topo.transferfn import DivisiveNormalizeL1
 
 from topo.learningfn.projfn import CFPLF_Trace as CFPLF_Trace_cython # pyflakes:ignore (optimized version provided)
+from topo.learningfn.projfn import CFPLF_PluginScaled
+from topo.responsefn.projfn import CFPRF_EuclideanDistance as CFPRF_EuclideanDistance_cython # pyflakes:ignore (optimized version provided)
+from topo.base.projection import NeighborhoodMask as NeighborhoodMask_cython # pyflakes:ignore (optimized version provided)
+from topo.sheet import compute_joint_norm_totals as compute_joint_norm_totals_cython # pyflakes:ignore (optimized version provided)
+
+from imagen.colorspaces import _rgb_to_hsv_array as rgb_to_hsv_array_cython # pyflakes:ignore (optimized version provided)
+from imagen.colorspaces import _hsv_to_rgb_array as hsv_to_rgb_array_cython # pyflakes:ignore (optimized version provided)
 
 
 class CFPRF_DotProduct_cython(CFPRF_Plugin):
@@ -34,6 +41,11 @@ class CFPLF_BCMFixed_cython(CFPLF_Plugin):
     single_cf_fn = param.ClassSelector(LearningFn,default=BCMFixed(),readonly=True)
 
 
+class CFPLF_Scaled_cython(CFPLF_PluginScaled):
+    """Same as CFPLF_PluginScaled(single_cf_fn=Hebbian()); just for non-optimized fallback."""
+    single_cf_fn = param.ClassSelector(LearningFn,default=Hebbian(),readonly=True)
+
+
 class CFPOF_DivisiveNormalizeL1_cython(CFPOutputFn):
     """
     Non-optimized version of CFPOF_DivisiveNormalizeL1_cython.
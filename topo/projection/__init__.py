@@ -19,13 +19,14 @@ from topo.base.projection import Projection
 from topo.base.boundingregion import BoundingBox
 from topo.base.sheet import activity_type
 from topo.base.sheetcoords import Slice
-from topo.base.cf import CFProjection,ConnectionField,\
+from topo.base.cf import CFProjection,ConnectionField,CFPResponseFn,\
      CFPLearningFn,CFPLF_Identity,CFPOutputFn,CFIter,ResizableCFProjection
 from topo.base.patterngenerator import PatternGenerator,Constant
 from topo.base.functionfamily import CoordinateMapperFn,IdentityMF
 from topo.misc.util import rowcol2idx
 from topo.transferfn import TransferFn,IdentityTF
 from topo.learningfn import LearningFn,IdentityLF
+from topo.responsefn.optimized import CFPRF_DotProduct_opt
 from topo.base import patterngenerator
 
 class CFPOF_SharedWeight(CFPOutputFn):
@@ -111,6 +112,9 @@ class SharedWeightCFProjection(CFProjection):
     ### learning if desired, e.g. to learn position-independent responses.
     learning_fn = param.ClassSelector(CFPLearningFn,CFPLF_Identity(),constant=True)
     weights_output_fns = param.HookList(default=[CFPOF_SharedWeight()])
+    # The weights of each SharedWeightCF are a view of the shared CF's
+    # weights, so they cannot be packed
+    packed_weights = param.Boolean(default=False,constant=True)
     precedence = param.Number(default=0.5)
 
     def __init__(self,**params):
@@ -138,7 +142,8 @@ class SharedWeightCFProjection(CFProjection):
                                      weights_generator=self.weights_generator,
                                      mask=self.mask_template,
                                      output_fns=[wof.single_cf_fn for wof in self.weights_output_fns],
-                                     min_matrix_radius=self.min_matrix_radius)
+                                     min_matrix_radius=self.min_matrix_radius,
+                                     weight_dtype=self.weight_dtype)
 
         self._create_cfs()
 
@@ -179,6 +184,68 @@ class SharedWeightCFProjection(CFProjection):
                     for cf,i in CFIter(self)()])
 
 
+    def _shared_kernel(self):
+        """
+        Return the shared weights and, for each unit, the input sheet
+        row and column of their top-left corner before the CF is
+        cropped to the input sheet (see CFPRF_SharedWeightCorrelation).
+        """
+        # (computed when first needed, so that older snapshots work too)
+        if getattr(self,'_kernel_origins',None) is None:
+            X,Y = self._generate_coords()
+            origins = np.empty((2,X.size),dtype=np.int64)
+            for i,(x,y) in enumerate(zip(X.flat,Y.flat)):
+                uncropped = copy(self._slice_template)
+                uncropped.positionedcrop(x,y,self.src)
+                origins[:,i] = uncropped[0],uncropped[2]
+            self._kernel_origins = origins
+        return self.__sharedcf.weights,self._kernel_origins[0],self._kernel_origins[1]
+
+
+
+class CFPRF_SharedWeightCorrelation(CFPResponseFn):
+    """
+    Response function computing a SharedWeightCFProjection's response
+    as a single 2D correlation.
+
+    Because every unit has the same weights, the dot products of all
+    the CFs with the input together form the correlation of the input
+    with the shared weights. This is computed for the whole input at
+    once, treating the input as zero outside the sheet (which is the
+    same as cropping the CFs at the edges), and each unit then takes
+    the value at the location of its CF. The result is the same as
+    CFPRF_DotProduct's up to rounding.
+
+    Small sets of weights are correlated directly, while larger ones
+    are correlated using the FFT, which is faster once there are more
+    than a few hundred weights. Other types of projection are handled
+    by CFPRF_DotProduct_opt.
+    """
+
+    fft_min_weights = param.Integer(default=225,bounds=(0,None),doc="""
+        Number of shared weights from which the FFT is used rather
+        than direct correlation (225 being e.g. 15x15).""")
+
+    def __call__(self, iterator, input_activity, activity, strength, **params):
+        if not isinstance(iterator.proj,SharedWeightCFProjection):
+            CFPRF_DotProduct_opt()(iterator,input_activity,activity,strength)
+            return
+
+        from scipy.signal import correlate2d,fftconvolve
+        weights,rows,cols = iterator.proj._shared_kernel()
+        weights = np.asarray(weights,dtype=np.float64)
+        if weights.size >= self.fft_min_weights:
+            correlation = fftconvolve(input_activity,weights[::-1,::-1],mode='full')
+        else:
+            correlation = correlate2d(input_activity,weights,mode='full')
+
+        # (index [h-1,w-1] of the full correlation has the weights'
+        # top-left corner on the input's)
+        h,w = weights.shape
+        i = iterator.indices()
+        activity.flat[i] = strength*correlation[rows[i]+h-1,cols[i]+w-1]
+
+
 
 
 
@@ -394,6 +461,7 @@ _public = list(set([_k for _k,_v in locals().items()
                     if isinstance(_v,type) and issubclass(_v,Projection)]))
 _public += [
     "CFPOF_SharedWeight",
+    "CFPRF_SharedWeightCorrelation",
     "SharedWeightCF",
 ]
 
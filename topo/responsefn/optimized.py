@@ -5,14 +5,18 @@ in C to optimize performance.
 Requires the weave package; without it unoptimized versions are used.
 """
 
+import numpy as np
+
 import param
 
 from topo.base.functionfamily import ResponseFn,DotProduct
 from topo.base.cf import CFPResponseFn, CFPRF_Plugin
 from topo.misc.inlinec import inline,provide_unoptimized_equivalent,\
-     c_header,c_decorators
+     c_header,c_decorators,weight_c_header,weight_support_code,c_weights
 from topo.misc.pyxhandler import provide_unoptimized_equivalent_cy
+from topo.misc.autotune import AutotunedFn
 from topo.responsefn.projfn import CFPRF_EuclideanDistance  # pyflakes:ignore (optimized version provided)
+from topo.responsefn.projfn import CFPRF_DotProduct_Batched
 
 
 # CEBALERT: this function works for 1D arrays; the docstring below is
@@ -31,37 +35,55 @@ class CFPRF_DotProduct_opt(CFPResponseFn):
     single_cf_fn = param.ClassSelector(ResponseFn,DotProduct(),readonly=True)
 
     def __call__(self, iterator, input_activity, activity, strength, **params):
-
         temp_act = activity  # pyflakes:ignore (passed to weave C code)
         irows,icols = input_activity.shape
         X = input_activity.ravel()  # pyflakes:ignore (passed to weave C code)
         cfs = iterator.flatcfs
         num_cfs = len(cfs)  # pyflakes:ignore (passed to weave C code)
+        slices = iterator.slices  # pyflakes:ignore (passed to weave C code)
         mask = iterator.mask.data  # pyflakes:ignore (passed to weave C code)
 
         cf_type = iterator.cf_type  # pyflakes:ignore (passed to weave C code)
 
+        if iterator.packed is not None:
+            self._packed_dot_product(iterator.packed,X,icols,mask,temp_act,strength)
+            return
+
         # Note: no performance hit from array indexing of mask and
         # temp_act (r11447).
-        code = c_header + """
+        code = c_header + weight_c_header(iterator.weight_dtype) + """
             DECLARE_SLOT_OFFSET(weights,cf_type);
-            DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
+
+            // Collect the location and strides of the weights of each
+            // CF while holding the GIL, so that the loop below uses no
+            // Python objects
+            char **cf_data = new char*[num_cfs];
+            int *cf_s0 = new int[num_cfs];
+            int *cf_s1 = new int[num_cfs];
+            for (int r=0; r<num_cfs; ++r) {
+                if(mask[r] != 0.0) {
+                    PyObject *cf = PyList_GetItem(cfs,r);
+                    LOOKUP_FROM_SLOT_OFFSET_UNDECL_DATA(weight_t,weights,cf);
+                    cf_data[r] = weights_obj->data;
+                    cf_s0[r] = weights_obj->strides[0];
+                    cf_s1[r] = weights_obj->strides[1];
+                }
+            }
+
+            // No Python API calls below, so let other threads run
+            // (see ProjectionSheet.activation_threads)
+            Py_BEGIN_ALLOW_THREADS
 
             %(cfs_loop_pragma)s
             for (int r=0; r<num_cfs; ++r) {
                 if(mask[r] == 0.0) {
                     temp_act[r] = 0;
                 } else {
-                    PyObject *cf = PyList_GetItem(cfs,r);
+                    char *data = cf_data[r];
+                    int s0 = cf_s0[r];
+                    int s1 = cf_s1[r];
 
-                    // CONTIGUOUS_ARRAY_FROM_SLOT_OFFSET(float,weights,cf) <<<<<<<<<<<
-
-                    LOOKUP_FROM_SLOT_OFFSET_UNDECL_DATA(float,weights,cf);
-                    char *data = weights_obj->data;
-                    int s0 = weights_obj->strides[0];
-                    int s1 = weights_obj->strides[1];
-
-                    LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
+                    int *input_sheet_slice = slices+4*r;
 
                     UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
 
@@ -82,7 +104,7 @@ class CFPRF_DotProduct_opt(CFPResponseFn):
 
 
                    for (int j=cc1; j<cc2; ++j) {
-                      tot += *((float *)(data + (i-rr1)*s0 + (j-cc1)*s1)) * *xi;
+                      tot += WEIGHT_TO_DOUBLE(*((weight_t *)(data + (i-rr1)*s0 + (j-cc1)*s1))) * *xi;
                       ++xi;
                    }
 
@@ -94,9 +116,66 @@ class CFPRF_DotProduct_opt(CFPResponseFn):
                 //    DECREF_CONTIGUOUS_ARRAY(weights);
                 }
             }
+
+            Py_END_ALLOW_THREADS
+
+            delete[] cf_data;
+            delete[] cf_s0;
+            delete[] cf_s1;
         """%c_decorators
-        inline(code, ['mask','X', 'strength', 'icols', 'temp_act','cfs','num_cfs','cf_type'],
-               local_dict=locals(), headers=['<structmember.h>'])
+        inline(code, ['mask','X', 'strength', 'icols', 'temp_act','cfs','num_cfs','cf_type',
+                      'slices'],
+               local_dict=locals(), headers=['<structmember.h>'],
+               support_code=weight_support_code)
+
+
+    def _packed_dot_product(self,packed,X,icols,mask,temp_act,strength):
+        """
+        Same as __call__, but reading the weights of all the CFs
+        directly from their PackedWeights storage.
+        """
+        weights = c_weights(packed.weights)  # pyflakes:ignore (passed to weave C code)
+        offsets = packed.offsets  # pyflakes:ignore (passed to weave C code)
+        slices = packed.slices  # pyflakes:ignore (passed to weave C code)
+        num_cfs = len(packed)  # pyflakes:ignore (passed to weave C code)
+
+        code = c_header + weight_c_header(packed.weights.dtype) + """
+            // No Python API calls at all, so let other threads run
+            // (see ProjectionSheet.activation_threads)
+            Py_BEGIN_ALLOW_THREADS
+
+            %(cfs_loop_pragma)s
+            for (int r=0; r<num_cfs; ++r) {
+                if(mask[r] == 0.0) {
+                    temp_act[r] = 0;
+                } else {
+                    // (a null CF has an empty slice, so gives 0)
+                    int *input_sheet_slice = slices+4*r;
+                    UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
+
+                    weight_t *wi = weights+offsets[r];
+                    double tot = 0.0;
+                    npfloat *xj = X+icols*rr1+cc1;
+
+                    // computes the dot product
+                    for (int i=rr1; i<rr2; ++i) {
+                        npfloat *xi = xj;
+                        for (int j=cc1; j<cc2; ++j) {
+                            tot += WEIGHT_TO_DOUBLE(*wi) * *xi;
+                            ++wi;
+                            ++xi;
+                        }
+                        xj += icols;
+                    }
+                    temp_act[r] = tot*strength;
+                }
+            }
+
+            Py_END_ALLOW_THREADS
+        """%c_decorators
+        inline(code, ['mask','X','strength','icols','temp_act','weights',
+                      'offsets','slices','num_cfs'],
+               local_dict=locals(), support_code=weight_support_code)
 
 class CFPRF_DotProduct(CFPRF_Plugin):
     """
@@ -107,7 +186,104 @@ class CFPRF_DotProduct(CFPRF_Plugin):
     def __init__(self,**params):
         super(CFPRF_DotProduct,self).__init__(single_cf_fn=DotProduct(),**params)
 
-provide_unoptimized_equivalent("CFPRF_DotProduct_opt","CFPRF_DotProduct",locals())
+
+class CFPRF_DotProduct_SparseInput_opt(CFPRF_DotProduct_opt):
+    """
+    Dot-product response function that skips the zero input units.
+
+    Inputs such as the half-rectified LGN activity are mostly zero,
+    yet the dot product of each CF multiplies every weight by its
+    input.  For each input pattern, this function instead finds the
+    nonzero input units and, if that is estimated to be cheaper,
+    scatters each one's contribution to the responses of all the CFs
+    it connects to, using the projection's CFOutstarIndex (see
+    CFProjection.get_outstar_index()).  Otherwise it computes the
+    dot products as CFPRF_DotProduct_opt does.
+
+    The responses are the same as those of CFPRF_DotProduct_opt: the
+    weighted inputs of each CF are summed in the same order, leaving
+    out only the zero terms.  Scattering is done only for packed
+    weights (see CFProjection.packed_weights), and runs on a single
+    thread, because the contributions of different inputs are added
+    to the same CFs.
+    """
+
+    mode = param.ObjectSelector(default='auto',objects=['auto','dense','scatter'],doc="""
+        How to compute the responses: 'dense' computes the dot product
+        of every CF, 'scatter' scatters the contributions of the
+        nonzero inputs, and 'auto' chooses whichever is estimated to
+        be faster for each input pattern (see scatter_cost).""")
+
+    scatter_cost = param.Number(default=4.0,bounds=(0,None),doc="""
+        Estimated cost of scattering the contribution of one weight,
+        relative to that of one multiply-add in the dot product (which
+        reads the weights and inputs in order, rather than at scattered
+        positions).  In 'auto' mode, the contributions are scattered
+        if the number of weights from the nonzero inputs, times this
+        cost, is less than the total number of weights, e.g. for the
+        default of 4.0 when (roughly) less than a quarter of the
+        inputs are nonzero.""")
+
+    def __call__(self, iterator, input_activity, activity, strength, **params):
+        packed = iterator.packed
+        if self.mode=='dense' or packed is None:
+            super(CFPRF_DotProduct_SparseInput_opt,self).__call__(
+                iterator,input_activity,activity,strength)
+            return
+
+        X = input_activity.ravel()
+        nonzero = np.flatnonzero(X).astype(np.int32)
+        outstar = iterator.proj.get_outstar_index()
+        if self.mode=='auto' and \
+           self.scatter_cost*outstar.fan_out(nonzero) >= len(packed.weights):
+            super(CFPRF_DotProduct_SparseInput_opt,self).__call__(
+                iterator,input_activity,activity,strength)
+            return
+
+        temp_act = activity  # pyflakes:ignore (passed to weave C code)
+        mask = iterator.mask.data  # pyflakes:ignore (passed to weave C code)
+        weights = c_weights(packed.weights)  # pyflakes:ignore (passed to weave C code)
+        starts = outstar.starts  # pyflakes:ignore (passed to weave C code)
+        cf_index = outstar.cf_index  # pyflakes:ignore (passed to weave C code)
+        weight_index = outstar.weight_index  # pyflakes:ignore (passed to weave C code)
+        num_nonzero = len(nonzero)  # pyflakes:ignore (passed to weave C code)
+        num_cfs = len(packed)  # pyflakes:ignore (passed to weave C code)
+        tot = np.zeros(num_cfs,dtype=np.float64)  # pyflakes:ignore (passed to weave C code)
+
+        code = c_header + weight_c_header(packed.weights.dtype) + """
+            // No Python API calls at all, so let other threads run
+            // (see ProjectionSheet.activation_threads)
+            Py_BEGIN_ALLOW_THREADS
+
+            // add the contribution of each nonzero input to the CFs
+            // it connects to
+            for (int k=0; k<num_nonzero; ++k) {
+                int j = nonzero[k];
+                npfloat x = X[j];
+                for (int e=starts[j]; e<starts[j+1]; ++e) {
+                    tot[cf_index[e]] += WEIGHT_TO_DOUBLE(weights[weight_index[e]]) * x;
+                }
+            }
+
+            for (int r=0; r<num_cfs; ++r) {
+                if(mask[r] == 0.0) {
+                    temp_act[r] = 0;
+                } else {
+                    temp_act[r] = tot[r]*strength;
+                }
+            }
+
+            Py_END_ALLOW_THREADS
+        """
+        inline(code, ['mask','X','strength','temp_act','weights','starts','cf_index',
+                      'weight_index','nonzero','num_nonzero','num_cfs','tot'],
+               local_dict=locals(), support_code=weight_support_code)
+
+
+provide_unoptimized_equivalent("CFPRF_DotProduct_opt","CFPRF_DotProduct",locals(),
+                               "CFPRF_DotProduct_cython")
+provide_unoptimized_equivalent("CFPRF_DotProduct_SparseInput_opt","CFPRF_DotProduct",locals(),
+                               "CFPRF_DotProduct_cython")
 
 
 try:
@@ -119,6 +295,46 @@ provide_unoptimized_equivalent_cy("CFPRF_DotProduct_cyopt","CFPRF_DotProduct",lo
 
 
 
+class CFPRF_Autotuned(CFPResponseFn,AutotunedFn):
+    """
+    Dot-product response function that uses whichever of its
+    candidates is fastest for each projection.
+
+    The first time it is called for a projection, each candidate
+    computes the response to the current input, and the fastest one
+    giving the same response as the first candidate is used from then
+    on for projections of that geometry (see topo.misc.autotune).
+    Because timing is done on the first input only, candidates whose
+    speed depends on the input (such as
+    CFPRF_DotProduct_SparseInput_opt, on its density) are judged on
+    an input that may not be typical.
+    """
+
+    single_cf_fn = param.ClassSelector(ResponseFn,DotProduct(),readonly=True)
+
+    candidates = param.List(default=[CFPRF_DotProduct_opt(),CFPRF_DotProduct_SparseInput_opt(),
+                                     CFPRF_DotProduct_Batched(),CFPRF_DotProduct()],
+                            class_=CFPResponseFn,doc="""
+        Equivalent response functions to choose from; the first one is
+        the reference for the responses.""")
+
+    cython_candidates = param.List(default=['CFPRF_DotProduct_cython'],class_=str,doc="""
+        Names of topo.optimized response functions to add to the
+        candidates (if they exist).""")
+
+    def __call__(self, iterator, input_activity, activity, strength, **params):
+        response = np.zeros_like(activity)
+
+        def run(fn):
+            response.fill(0.0)
+            fn(iterator,input_activity,response,strength)
+
+        fn = self._chosen('response_fn',iterator.proj,run,
+                          lambda: response.astype(np.float64).ravel())
+        fn(iterator,input_activity,activity,strength)
+
+
+
 # CEBERRORALERT: ignores the sheet mask!
 class CFPRF_EuclideanDistance_opt(CFPResponseFn):
     """
@@ -135,8 +351,9 @@ class CFPRF_EuclideanDistance_opt(CFPResponseFn):
         X = input_activity.ravel()  # pyflakes:ignore (passed to weave C code)
         cfs = iterator.flatcfs
         num_cfs = len(cfs)  # pyflakes:ignore (passed to weave C code)
+        slices = iterator.slices  # pyflakes:ignore (passed to weave C code)
 
-        code = c_header + """
+        code = c_header + weight_c_header(iterator.weight_dtype) + """
             #include <math.h>
             npfloat *tact = temp_act;
             double max_dist=0.0;
@@ -145,10 +362,9 @@ class CFPRF_EuclideanDistance_opt(CFPResponseFn):
                 PyObject *cf = PyList_GetItem(cfs,r);
 
                 PyObject *weights_obj = PyObject_GetAttrString(cf,"weights");
-                PyObject *slice_obj   = PyObject_GetAttrString(cf,"input_sheet_slice");
 
-                float *wj = (float *)(((PyArrayObject*)weights_obj)->data);
-                int *slice =  (int *)(((PyArrayObject*)slice_obj)->data);
+                weight_t *wj = (weight_t *)(((PyArrayObject*)weights_obj)->data);
+                int *slice = slices+4*r;
 
                 int rr1 = *slice++;
                 int rr2 = *slice++;
@@ -161,9 +377,9 @@ class CFPRF_EuclideanDistance_opt(CFPResponseFn):
                 double tot = 0.0;
                 for (int i=rr1; i<rr2; ++i) {
                     npfloat *xi = xj;
-                    float *wi = wj;
+                    weight_t *wi = wj;
                     for (int j=cc1; j<cc2; ++j) {
-                        double diff = *wi - *xi;
+                        double diff = WEIGHT_TO_DOUBLE(*wi) - *xi;
                         tot += diff*diff;
                         ++wi;
                         ++xi;
@@ -181,7 +397,6 @@ class CFPRF_EuclideanDistance_opt(CFPResponseFn):
 
                 // Anything obtained with PyObject_GetAttrString must be explicitly freed
                 Py_DECREF(weights_obj);
-                Py_DECREF(slice_obj);
             }
             tact = temp_act;
             for (int r=0; r<num_cfs; ++r) {
@@ -189,7 +404,8 @@ class CFPRF_EuclideanDistance_opt(CFPResponseFn):
                 ++tact;
             }
         """
-        inline(code, ['X', 'strength', 'icols', 'temp_act','cfs','num_cfs'],
-               local_dict=locals())
+        inline(code, ['X', 'strength', 'icols', 'temp_act','cfs','num_cfs','slices'],
+               local_dict=locals(), support_code=weight_support_code)
 
-provide_unoptimized_equivalent("CFPRF_EuclideanDistance_opt","CFPRF_EuclideanDistance",locals())
+provide_unoptimized_equivalent("CFPRF_EuclideanDistance_opt","CFPRF_EuclideanDistance",locals(),
+                               "CFPRF_EuclideanDistance_cython")
@@ -62,7 +62,7 @@ class CFPRF_DotProduct_cyopt(CFPResponseFn):
     def __call__(self, object iterator, np.ndarray[np.double_t,  ndim=2] input_activity,
                  np.ndarray[np.double_t,  ndim=2] activity, np.double_t strength):
 
-        cdef np.ndarray[np.int32_t] input_sheet_slice
+        cdef np.ndarray[np.int32_t, ndim=2] slices
         cdef np.ndarray[np.float32_t, ndim=2] weights
         cdef np.ndarray[np.double_t, ndim=2] mask
 
@@ -72,6 +72,7 @@ class CFPRF_DotProduct_cyopt(CFPResponseFn):
 
         cfs = iterator.flatcfs
         mask = iterator.mask.data
+        slices = iterator.slices
 
         for i in range(len(cfs)):
 
@@ -85,11 +86,10 @@ class CFPRF_DotProduct_cyopt(CFPResponseFn):
 
                 #####
                 # r1,r2,c1,c2 = cf.input_sheet_slice
-                input_sheet_slice = <np.ndarray>cf.input_sheet_slice # slow?
-                r1=input_sheet_slice[0]
-                r2=input_sheet_slice[1]
-                c1=input_sheet_slice[2]
-                c2=input_sheet_slice[3]
+                r1=slices[i,0]
+                r2=slices[i,1]
+                c1=slices[i,2]
+                c2=slices[i,3]
                 #####
 
                 weights = cf.weights # slow?
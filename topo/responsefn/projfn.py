@@ -41,6 +41,31 @@ class CFPRF_EuclideanDistance(CFPResponseFn):
         activity *= strength
 
 
+class CFPRF_DotProduct_Batched(CFPResponseFn):
+    """
+    Dot-product response function computing the responses of all the
+    CFs together.
+
+    Uses the projection's CFMatrix (see CFProjection.get_cf_matrix()),
+    a copy of all the weights as one matrix that the projection keeps
+    up to date as it learns, gathering each CF's input with the
+    matrix's precomputed index table and computing all the dot
+    products in a few vectorized numpy operations rather than one CF
+    at a time.  The result is the same as that of CFPRF_DotProduct,
+    but a second copy of the weights is stored, and the matrix is
+    padded to the size of the largest CF, so it is most efficient
+    when the CFs are of similar sizes.
+    """
+
+    single_cf_fn = param.ClassSelector(ResponseFn,DotProduct(),readonly=True)
+
+    def __call__(self, iterator, input_activity, activity, strength, **params):
+        indices = iterator.indices()
+        cf_matrix = iterator.proj.get_cf_matrix()
+        activity *= 0.0
+        activity.flat[indices] = strength*cf_matrix.dot(input_activity,indices)
+
+
 
 class CFPRF_ActivityBased(CFPResponseFn):
     """
@@ -93,6 +118,7 @@ class CFPRF_ActivityBased(CFPResponseFn):
 
 __all__ = [
     "CFPRF_EuclideanDistance",
+    "CFPRF_DotProduct_Batched",
     "CFPRF_ActivityBased",
     "CFPRF_Plugin",
 ]
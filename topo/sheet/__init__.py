@@ -96,12 +96,32 @@ def compute_joint_norm_totals(projlist,active_units_mask=True):
     # Assumes that all Projections in the list have the same r,c size
     assert len(projlist)>=1
     iterator = CFIter(projlist[0],active_units_mask=active_units_mask)
+    flatcfs_list = [p.flatcfs for p in projlist]
 
-    for junk,i in iterator():
-        sums = [p.flatcfs[i].norm_total for p in projlist]
-        joint_sum = numpy.add.reduce(sums)
-        for p in projlist:
-            p.flatcfs[i].norm_total=joint_sum
+    for i in iterator.indices():
+        cfs = [flatcfs[i] for flatcfs in flatcfs_list]
+        joint_sum = numpy.add.reduce([cf.norm_total for cf in cfs])
+        for cf in cfs:
+            cf.norm_total=joint_sum
+
+
+def learn_and_normalize(projlist,joint_norm_fn=None):
+    """
+    Learn, and then apply the weights_output_fns for the active units,
+    for a group of Projections to be normalized jointly (computing the
+    norm_totals with joint_norm_fn) or, if joint_norm_fn is None,
+    individually.
+
+    Each step is a separate pass over the weights; see
+    topo.sheet.optimized.learn_and_normalize_opt for a version that
+    does all of them in a single pass.
+    """
+    for p in projlist:
+        p.learn()
+    if joint_norm_fn is not None:
+        joint_norm_fn(projlist,True)
+    for p in projlist:
+        p.apply_learn_output_fns(active_units_mask=True)
 
 
 class JointNormalizingCFSheet(CFSheet):
@@ -137,6 +157,15 @@ class JointNormalizingCFSheet(CFSheet):
         Function to use to compute the norm_total for each CF in each
         projection from a group to be normalized jointly.""")
 
+    fused_learning_fn = param.Callable(default=None,doc="""
+        If not None, a function f(projlist,joint_norm_fn) used by
+        learn() for each group of Projections, instead of learning
+        and then normalizing them in separate steps, so that both can
+        be done in a single pass over the weights.  joint_norm_fn is
+        None for the group of Projections normalized individually.
+        See learn_and_normalize and
+        topo.sheet.optimized.learn_and_normalize_opt.""")
+
     # JABALERT: Should check that whenever a connection is added to a
     # group, it has the same no of cfs as the existing connections.
     def start(self):
@@ -170,15 +199,26 @@ class JointNormalizingCFSheet(CFSheet):
         Call the learn() method on every Projection to the Sheet, and
         call the output functions (jointly if necessary).
         """
-        # Ask all projections to learn independently
-        for proj in self.in_connections:
-            if not isinstance(proj,Projection):
-                self.debug("Skipping non-Projection "+proj.name)
-            else:
-                proj.learn()
+        self._activate_pending()
+        # (shared by all the projections; see active_unit_indices())
+        self._active_units = self.active_unit_indices()
+        try:
+            if self.fused_learning_fn is not None:
+                for key,projlist in self._grouped_in_projections('JointNormalize').items():
+                    self.fused_learning_fn(projlist,None if key is None else self.joint_norm_fn)
+                return
+
+            # Ask all projections to learn independently
+            for proj in self.in_connections:
+                if not isinstance(proj,Projection):
+                    self.debug("Skipping non-Projection "+proj.name)
+                else:
+                    proj.learn()
 
-        # Apply output function in groups determined by dest_port
-        self._normalize_weights()
+            # Apply output function in groups determined by dest_port
+            self._normalize_weights()
+        finally:
+            self._active_units = None
 
 
 
@@ -270,6 +310,7 @@ class SettlingCFSheet(JointNormalizingCFSheet):
     def input_event(self,conn,data):
         # On a new afferent input, clear the activity
         if self.new_iteration:
+            self._activate_pending()
             for f in self.beginning_of_iteration: f()
             self.new_iteration = False
             self.activity *= 0.0
@@ -338,11 +379,21 @@ class SettlingCFSheet(JointNormalizingCFSheet):
         self.activation_count,self.new_iteration=self.__counter_stack.pop()
 
     def send_output(self,src_port=None,data=None):
-        """Send some data out to all connections on the given src_port."""
+        """
+        Send some data out to all connections on the given src_port.
+
+        If zero_copy_output is True, all the connections share a single
+        read-only snapshot of the data; otherwise each connection
+        receives its own copy.
+        """
 
         out_conns_on_src_port = [conn for conn in self.out_connections
                                  if self._port_match(conn.src_port,[src_port])]
 
+        zero_copy = self.zero_copy_output and isinstance(data,numpy.ndarray)
+        if zero_copy:
+            data = self._output_snapshot(data)
+
         for conn in out_conns_on_src_port:
             if self.strict_tsettle != None:
                if self.activation_count < self.strict_tsettle:
@@ -350,7 +401,10 @@ class SettlingCFSheet(JointNormalizingCFSheet):
                        continue
             self.verbose("Sending output on src_port %s via connection %s to %s",
                          src_port, conn.name, conn.dest.name)
-            e=EPConnectionEvent(self.simulation.convert_to_time_type(conn.delay)+self.simulation.time(),conn,data)
+            if zero_copy:
+                e=EPConnectionEvent(self.simulation.convert_to_time_type(conn.delay)+self.simulation.time(),conn,data.view(),deep_copy=False)
+            else:
+                e=EPConnectionEvent(self.simulation.convert_to_time_type(conn.delay)+self.simulation.time(),conn,data)
             self.simulation.enqueue_event(e)
 
 
@@ -359,6 +413,7 @@ class SettlingCFSheet(JointNormalizingCFSheet):
 _public = list(set([_k for _k,_v in locals().items() if isinstance(_v,type) and issubclass(_v,Sheet)]))
 _public += [
     "compute_joint_norm_totals",
+    "learn_and_normalize",
     "BoundingBox",
     "activity_type",
 ]
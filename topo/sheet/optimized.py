@@ -2,13 +2,19 @@
 Inline-optimized Sheet classes
 """
 
+import numpy
+
 import param
 
-from topo.base.cf import CFIter
+from topo.base.cf import CFIter, CFProjection
 from topo.base.projection import NeighborhoodMask
-from topo.misc.inlinec import inline,provide_unoptimized_equivalent,c_header
+from topo.misc.inlinec import inline,provide_unoptimized_equivalent,c_header,c_decorators,\
+     weight_c_header,weight_support_code
 from topo.sheet import SettlingCFSheet
 from topo.sheet import compute_joint_norm_totals  # pyflakes:ignore (optimized version provided)
+from topo.sheet import learn_and_normalize  # pyflakes:ignore (optimized version provided)
+from topo.learningfn.optimized import CFPLF_Hebbian_opt, CFPLF_Hebbian
+from topo.transferfn.optimized import CFPOF_DivisiveNormalizeL1_opt, CFPOF_DivisiveNormalizeL1
 
 def compute_joint_norm_totals_opt(projlist,active_units_mask):
     """
@@ -22,69 +28,236 @@ def compute_joint_norm_totals_opt(projlist,active_units_mask):
 
     proj = projlist[0]
     iterator = CFIter(proj,active_units_mask=active_units_mask)
-    num_cfs = len(proj.flatcfs)  # pyflakes:ignore (passed to weave C code)
-    active_units_mask = iterator.get_active_units_mask()
-    sheet_mask = iterator.get_sheet_mask()  # pyflakes:ignore (passed to weave C code)
-    cf_type = iterator.cf_type  # pyflakes:ignore (passed to weave C code)
 
-    # CEBALERT: Not consistent with other C code. E.g. could be
-    # simplified to use active_units_mask[] and sheet_mask[]?
+    if len(set(CFIter(p).weight_dtype for p in projlist))>1:
+        # (the C code reads the weights of all the projections as
+        # the same type)
+        compute_joint_norm_totals(projlist,active_units_mask)
+        return
+
+    # (when skipping inactive units, the index array shared by all
+    # the sheet's projections while learning)
+    indices = iterator.indices()
+    num_indices = len(indices)  # pyflakes:ignore (passed to weave C code)
+    cf_type = iterator.cf_type  # pyflakes:ignore (passed to weave C code)
+    slice_tables = [CFIter(p).slices for p in projlist]  # pyflakes:ignore (passed to weave C code)
 
-    code = c_header + """
+    code = c_header + weight_c_header(iterator.weight_dtype) + """
         DECLARE_SLOT_OFFSET(_norm_total,cf_type);
         DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
         DECLARE_SLOT_OFFSET(weights,cf_type);
-        DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
         DECLARE_SLOT_OFFSET(mask,cf_type);
 
-        npfloat *x = active_units_mask;
-        npfloat *m = sheet_mask;
-        for (int r=0; r<num_cfs; ++r) {
-            double load = *x++;
-            double msk = *m++;
-            if (msk!=0 && load != 0) {
-                double nt = 0;
-
-                for(int p=0; p<length; p++) {
-                    PyObject *proj = PyList_GetItem(projlist,p);
-                    PyObject *cfs = PyObject_GetAttrString(proj,"flatcfs");
-                    PyObject *cf = PyList_GetItem(cfs,r);
-                    LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
-                    LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
-                    if (_has_norm_total[0] == 0) {
-                        LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
-                        LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
-
-                        UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
-
-                        SUM_NORM_TOTAL(cf,weights,_norm_total,rr1,rr2,cc1,cc2);
-                    }
-                    nt += _norm_total[0];
-                    Py_DECREF(cfs);
-                }
+        for (int k=0; k<num_indices; ++k) {
+            int r = indices[k];
+            double nt = 0;
 
-                for(int p=0; p<length; p++) {
-                    PyObject *proj = PyList_GetItem(projlist,p);
-                    PyObject *cfs = PyObject_GetAttrString(proj,"flatcfs");
-                    PyObject *cf = PyList_GetItem(cfs,r);
+            for(int p=0; p<length; p++) {
+                PyObject *proj = PyList_GetItem(projlist,p);
+                PyObject *cfs = PyObject_GetAttrString(proj,"flatcfs");
+                PyObject *cf = PyList_GetItem(cfs,r);
+                LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
+                LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
+                if (_has_norm_total[0] == 0) {
+                    LOOKUP_FROM_SLOT_OFFSET(weight_t,weights,cf);
+                    PyArrayObject *slices = (PyArrayObject *)PyList_GetItem(slice_tables,p);
+                    int *input_sheet_slice = (int *)(slices->data)+4*r;
 
-                    LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
-                    _norm_total[0] = nt;
-                    LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
-                    _has_norm_total[0] = 1;
+                    UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
 
-                    Py_DECREF(cfs);
+                    SUM_NORM_TOTAL(cf,weights,_norm_total,rr1,rr2,cc1,cc2);
                 }
+                nt += _norm_total[0];
+                Py_DECREF(cfs);
             }
 
+            for(int p=0; p<length; p++) {
+                PyObject *proj = PyList_GetItem(projlist,p);
+                PyObject *cfs = PyObject_GetAttrString(proj,"flatcfs");
+                PyObject *cf = PyList_GetItem(cfs,r);
+
+                LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
+                _norm_total[0] = nt;
+                LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
+                _has_norm_total[0] = 1;
+
+                Py_DECREF(cfs);
+            }
         }
     """
-    inline(code, ['projlist','active_units_mask','sheet_mask','num_cfs','length','cf_type'],
+    inline(code, ['projlist','indices','num_indices','length','cf_type','slice_tables'],
            local_dict=locals(),
-           headers=['<structmember.h>'])
+           headers=['<structmember.h>'],
+           support_code=weight_support_code)
 
 provide_unoptimized_equivalent("compute_joint_norm_totals_opt",
-                               "compute_joint_norm_totals",locals())
+                               "compute_joint_norm_totals",locals(),
+                               "compute_joint_norm_totals_cython")
+
+
+def _fusable(proj):
+    """
+    Whether learn_and_normalize_opt can learn and normalize proj: a
+    CFProjection with Hebbian learning and L1 divisive normalization
+    (to a total of 1.0), whose weights can be changed.
+    """
+    if not (isinstance(proj,CFProjection) and proj._weights_writeable()):
+        return False
+    output_fns = proj.weights_output_fns
+    return (type(proj.learning_fn) in (CFPLF_Hebbian_opt,CFPLF_Hebbian) and
+            len(output_fns)==1 and
+            type(output_fns[0]) in (CFPOF_DivisiveNormalizeL1_opt,CFPOF_DivisiveNormalizeL1) and
+            output_fns[0].single_cf_fn.norm_value==1.0)
+
+
+def learn_and_normalize_opt(projlist,joint_norm_fn=None):
+    """
+    Same as learn_and_normalize, but doing the Hebbian learning, the
+    (joint) norm_total computation and the divisive normalization of
+    each CF in a single pass over the Projections' CFs, so that the
+    weights of each CF are normalized while they are still in the
+    cache from being learned.
+
+    Used for the Projections that use CFPLF_Hebbian_opt and
+    CFPOF_DivisiveNormalizeL1_opt (see _fusable); the others, and
+    joint groups that contain any of them or that use a joint_norm_fn
+    other than compute_joint_norm_totals(_opt), are handled by
+    learn_and_normalize.
+    """
+    if joint_norm_fn is None:
+        fused = [p for p in projlist if _fusable(p)]
+        learn_and_normalize([p for p in projlist if p not in fused])
+        # (each pass handles Projections with one weight type)
+        for weight_dtype in set(CFIter(p).weight_dtype for p in fused):
+            _fused_learn_and_normalize([p for p in fused if CFIter(p).weight_dtype==weight_dtype],
+                                       False)
+    elif (joint_norm_fn in (compute_joint_norm_totals,compute_joint_norm_totals_opt) and
+          all(_fusable(p) for p in projlist) and
+          len(set(CFIter(p).cf_type for p in projlist))==1 and
+          len(set(CFIter(p).weight_dtype for p in projlist))==1):
+        _fused_learn_and_normalize(projlist,True)
+    else:
+        learn_and_normalize(projlist,joint_norm_fn)
+
+
+def _fused_learn_and_normalize(fused,joint):
+    """
+    Learn and normalize the given Projections, which must all pass
+    _fusable and have the same weight type, in a single pass over
+    their CFs (normalizing them jointly if joint is True).
+    """
+    iterator = CFIter(fused[0],active_units_mask=True)
+    length = len(fused)
+    num_cfs = len(fused[0].flatcfs)  # pyflakes:ignore (passed to weave C code)
+    joint = int(joint)  # pyflakes:ignore (passed to weave C code)
+    cf_type = iterator.cf_type  # pyflakes:ignore (passed to weave C code)
+    output_activity = fused[0].dest.activity  # pyflakes:ignore (passed to weave C code)
+    # (the units to be normalized, which include all those that learn)
+    indices = iterator.indices()
+    num_indices = len(indices)  # pyflakes:ignore (passed to weave C code)
+    cfs_list = [p.flatcfs for p in fused]  # pyflakes:ignore (passed to weave C code)
+    slices = numpy.array([CFIter(p).slices for p in fused],dtype=numpy.int32)  # pyflakes:ignore (passed to weave C code)
+
+    # A single-connection learning rate of 0 means that the
+    # Projection does not learn, as in CFPLF_Hebbian_opt (e.g. it has
+    # no input yet), but its CFs are still normalized.
+    rates = numpy.zeros(length,dtype=numpy.float64)
+    inputs = []
+    icols = numpy.zeros(length,dtype=numpy.int32)
+    for k,p in enumerate(fused):
+        if p.input_buffer is not None:
+            rates[k] = p.learning_fn.constant_sum_connection_rate(p.n_units,p.learning_rate)
+            icols[k] = p.input_buffer.shape[1]
+        inputs.append(p.input_buffer if rates[k]!=0 else numpy.zeros((1,1)))
+
+    code = c_header + weight_c_header(iterator.weight_dtype) + """
+        DECLARE_SLOT_OFFSET(weights,cf_type);
+        DECLARE_SLOT_OFFSET(mask,cf_type);
+        DECLARE_SLOT_OFFSET(_norm_total,cf_type);
+        DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
+
+        %(cfs_loop_pragma)s
+        for (int k=0; k<num_indices; ++k) {
+            int r = indices[k];
+            double load = output_activity[r];
+            double nt = 0.0;
+
+            // learn, finding the sum of the weights of each CF
+            for (int p=0; p<length; ++p) {
+                PyObject *cf = PyList_GetItem(PyList_GetItem(cfs_list,p),r);
+
+                LOOKUP_FROM_SLOT_OFFSET(weight_t,weights,cf);
+                LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
+                LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
+                int *input_sheet_slice = slices+4*(p*num_cfs+r);
+
+                UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
+
+                if (load != 0 && rates[p] != 0) {
+                    LOOKUP_MASK_FROM_SLOT_OFFSET(cf);
+                    double l = load*rates[p];
+                    int ic = icols[p];
+                    npfloat *input_activity = (npfloat *)(((PyArrayObject *)PyList_GetItem(inputs,p))->data);
+                    double total = 0.0;
+
+                    // modify non-masked weights
+                    npfloat *inpj = input_activity+ic*rr1+cc1;
+                    weight_t *wi = weights;
+                    for (int i=rr1; i<rr2; ++i) {
+                        npfloat *inpi = inpj;
+                        float *mask = mask_row+(i-rr1)*mask_rowstride;
+                        for (int j=cc1; j<cc2; ++j) {
+                            if (*(mask++) >= MASK_THRESHOLD) {
+                                *wi = DOUBLE_TO_WEIGHT(WEIGHT_TO_DOUBLE(*wi) + l * *inpi);
+                                total += fabs(WEIGHT_TO_DOUBLE(*wi));
+                            }
+                            ++wi;
+                            ++inpi;
+                        }
+                        inpj += ic;
+                    }
+                    _norm_total[0] = total;
+                } else if (_has_norm_total[0] == 0) {
+                    SUM_NORM_TOTAL(cf,weights,_norm_total,rr1,rr2,cc1,cc2);
+                }
+                nt += _norm_total[0];
+            }
+
+            // normalize the weights
+            for (int p=0; p<length; ++p) {
+                PyObject *cf = PyList_GetItem(PyList_GetItem(cfs_list,p),r);
+
+                LOOKUP_FROM_SLOT_OFFSET(weight_t,weights,cf);
+                LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
+                LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
+                int *input_sheet_slice = slices+4*(p*num_cfs+r);
+
+                UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
+
+                if (joint) {
+                    _norm_total[0] = nt;
+                }
+                double factor = 1.0/_norm_total[0];
+                int rc = (rr2-rr1)*(cc2-cc1);
+                for (int i=0; i<rc; ++i) {
+                    weights[i] = DOUBLE_TO_WEIGHT(WEIGHT_TO_DOUBLE(weights[i])*factor);
+                }
+
+                // Indicate that norm_total is stale
+                _has_norm_total[0] = 0;
+            }
+        }
+    """%c_decorators
+    inline(code, ['cfs_list','inputs','icols','rates','slices','output_activity',
+                  'indices','num_indices','num_cfs','length','joint','cf_type'],
+           local_dict=locals(),
+           headers=['<structmember.h>'],
+           support_code=weight_support_code)
+
+    for p in fused:
+        p.update_cf_matrix(True)
+
+provide_unoptimized_equivalent("learn_and_normalize_opt","learn_and_normalize",locals())
 
 # CEBALERT: not tested
 class SettlingCFSheet_Opt(SettlingCFSheet):
@@ -168,11 +341,13 @@ class NeighborhoodMask_Opt(NeighborhoodMask):
         """
         inline(code, ['thr','activity','matradius','mask','rows','cols'], local_dict=locals())
 
-provide_unoptimized_equivalent("NeighborhoodMask_Opt","NeighborhoodMask",locals())
+provide_unoptimized_equivalent("NeighborhoodMask_Opt","NeighborhoodMask",locals(),
+                               "NeighborhoodMask_cython")
 
 
 __all__ = [
     "compute_joint_norm_totals",
+    "learn_and_normalize",
     "SettlingCFSheet",
     "NeighborhoodMask",
 ]
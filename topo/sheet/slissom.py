@@ -89,6 +89,7 @@ class SLISSOM(SettlingCFSheet):
         This function also updates and maintains internal values such as
         membrane_potential, spike, etc.
         """
+        self._activate_pending()
         self.activity *= 0.0
 
         for proj in self.in_connections:
@@ -663,6 +663,13 @@ class SparseCFProjection(CFProjection):
     weights_output_fns = param.HookList(default=[CFPOF_DivisiveNormalizeL1_Sparse],doc="""
         Functions applied to each CF after learning.""")
 
+    packed_weights = param.Boolean(default=False,constant=True,doc="""
+        Not applicable: the weights are held in a single sparse matrix.""")
+
+    weight_dtype = param.ObjectSelector(default=sparse_type,objects=[sparse_type],
+        constant=True,doc="""
+        Not applicable: the sparse weights are always stored as sparse_type.""")
+
     initialized = param.Boolean(default=False)
 
 
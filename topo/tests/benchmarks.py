@@ -0,0 +1,208 @@
+"""
+Micro-benchmarks for individual components of the simulator.
+
+Unlike the speedtests in test_script.py, which time complete models,
+these functions time one mechanism at a time so that the effect of a
+change can be seen in isolation. Each one prints a small table and
+returns the raw results, e.g.:
+
+  ./topographica -c "from topo.tests.benchmarks import event_queue; event_queue()"
+"""
+
+import __main__
+import bisect
+import heapq
+import random
+import timeit
+
+import numpy
+
+import topo
+from topo.base.simulation import Simulation, Event
+from topo.base.projection import ProjectionSheet
+
+
+def _sorted_list_hold(queue_size,n_holds,times):
+    # The event queue as it used to be implemented: a sorted list,
+    # with insort_right to enqueue and pop(0) to deliver.
+    events = sorted(Event(t) for t in times[:queue_size])
+    start = timeit.default_timer()
+    for t in times[queue_size:queue_size+n_holds]:
+        ev = events.pop(0)
+        ev.time += t
+        bisect.insort_right(events,ev)
+    return timeit.default_timer()-start
+
+
+def _heap_hold(queue_size,n_holds,times):
+    sim = Simulation(register=False)
+    for t in times[:queue_size]:
+        sim.enqueue_event(Event(t))
+    queue = sim._event_queue
+    start = timeit.default_timer()
+    for t in times[queue_size:queue_size+n_holds]:
+        ev = heapq.heappop(queue)[2]
+        ev.time += t
+        sim.enqueue_event(ev)
+    return timeit.default_timer()-start
+
+
+def event_queue(sizes=[2**i for i in range(0,15)],n_holds=20000,seed=0):
+    """
+    Compare the cost of event delivery for a sorted-list event queue
+    and Simulation's heap-based queue, at a range of queue sizes.
+
+    Uses the classic 'hold' model: each operation removes the
+    earliest event and reschedules it at a random later time, so the
+    queue stays at a fixed size. Prints the time per hold for both
+    queues, and the smallest queue size at which the heap is faster
+    (the crossover), which is returned along with the timings.
+    """
+    rng = random.Random(seed)
+    times = [rng.random() for i in range(max(sizes)+n_holds)]
+
+    results = []
+    crossover = None
+    print "%8s %14s %14s" % ("size","list (us/op)","heap (us/op)")
+    for size in sizes:
+        t_list = 1e6*_sorted_list_hold(size,n_holds,times)/n_holds
+        t_heap = 1e6*_heap_hold(size,n_holds,times)/n_holds
+        results.append((size,t_list,t_heap))
+        if crossover is None and t_heap < t_list:
+            crossover = size
+        print "%8d %14.3f %14.3f" % (size,t_list,t_heap)
+
+    print "Heap queue faster from queue size: %s" % crossover
+    return crossover, results
+
+
+def projection_activation(script="examples/gcal_oo_or.ty",iterations=10,
+                          threads=[0,2,3,4]):
+    """
+    Time topo.sim.run(iterations) for the given model script with each
+    of the given values of ProjectionSheet.activation_threads (0
+    being the usual one-projection-at-a-time activation).
+
+    The script is re-run for each setting, so that each run starts
+    from the same state, and the final activity of every sheet is
+    checked against that of the first setting. Returns a list of
+    (threads,seconds) pairs.
+    """
+    results = []
+    reference = None
+    print "%8s %10s %8s" % ("threads","time (s)","speedup")
+    for n in threads:
+        execfile(script,__main__.__dict__)
+        for sheet in topo.sim.objects(ProjectionSheet).values():
+            sheet.activation_threads = n
+        topo.sim.run(1) # ensure compilations etc happen outside timing
+        start = timeit.default_timer()
+        topo.sim.run(iterations)
+        t = timeit.default_timer()-start
+
+        activities = dict((name,sheet.activity.copy()) for name,sheet
+                          in topo.sim.objects(ProjectionSheet).items())
+        if reference is None:
+            reference = activities
+        for name,activity in activities.items():
+            if not numpy.array_equal(activity,reference[name]):
+                raise AssertionError("%s activity differs with activation_threads=%s"%(name,n))
+
+        results.append((n,t))
+        print "%8d %10.3f %8.2f" % (n,t,results[0][1]/t)
+    return results
+
+
+def _present_probes(n_probes,duration):
+    # Present a series of patterns to the model as a pattern_response
+    # measurement does (see the PatternDrivenAnalysis hooks in
+    # topo.command), restoring the model's state after each one.
+    import imagen
+    from topo.command import save_input_generators, restore_input_generators, \
+         wipe_out_activity, clear_event_queue
+    from topo.base.sheet import Sheet
+    from topo.base.generatorsheet import GeneratorSheet
+
+    sheets = topo.sim.objects(Sheet).values()
+    generator_sheets = topo.sim.objects(GeneratorSheet).values()
+    for i in range(n_probes):
+        topo.sim.state_push()
+        wipe_out_activity()
+        clear_event_queue()
+        for sheet in sheets:
+            sheet.override_plasticity_state(new_plasticity_state=False)
+        save_input_generators()
+        for sheet in generator_sheets:
+            sheet.set_input_generator(imagen.Gaussian(orientation=numpy.pi*i/n_probes,
+                                                      aspect_ratio=4.0,size=0.1))
+        topo.sim.run(duration)
+        restore_input_generators()
+        for sheet in sheets:
+            sheet.restore_plasticity_state()
+        topo.sim.state_pop()
+
+
+def state_probes(script="examples/gcal.ty",n_probes=50,duration=1.0,
+                 copy_on_write=[False,True]):
+    """
+    Time n_probes pattern_response-style presentations (each a
+    state_push(), a run of the given duration with a new input
+    pattern and plasticity turned off, and a state_pop()) for the
+    given model script, with each of the given values of
+    Simulation.copy_on_write_state.
+
+    The script is re-run for each setting, and the activity of every
+    sheet after the presentations is checked against that of the
+    first setting. Returns a list of (copy_on_write,seconds) pairs.
+    """
+    results = []
+    reference = None
+    print "%14s %10s %8s" % ("copy_on_write","time (s)","speedup")
+    for cow in copy_on_write:
+        execfile(script,__main__.__dict__)
+        topo.sim.copy_on_write_state = cow
+        topo.sim.run(1)
+        _present_probes(1,duration) # ensure compilations etc happen outside timing
+        start = timeit.default_timer()
+        _present_probes(n_probes,duration)
+        t = timeit.default_timer()-start
+
+        topo.sim.run(1)
+        activities = dict((name,sheet.activity.copy()) for name,sheet
+                          in topo.sim.objects(ProjectionSheet).items())
+        if reference is None:
+            reference = activities
+        for name,activity in activities.items():
+            if not numpy.array_equal(activity,reference[name]):
+                raise AssertionError("%s activity differs with copy_on_write_state=%s"%(name,cow))
+
+        results.append((cow,t))
+        print "%14s %10.3f %8.2f" % (cow,t,results[0][1]/t)
+    return results
+
+
+def profiling_overhead(script="examples/gcal.ty",iterations=20,repeats=3):
+    """
+    Time topo.sim.run(iterations) for the given model script with and
+    without Simulation.start_profiling(), and print the overhead of
+    profiling as a percentage of the unprofiled time (the best of the
+    given number of repeats of each). Returns the overhead.
+    """
+    times = {}
+    for profiled in [False,True]*repeats:
+        execfile(script,__main__.__dict__)
+        topo.sim.run(1) # ensure compilations etc happen outside timing
+        if profiled:
+            topo.sim.start_profiling()
+        start = timeit.default_timer()
+        topo.sim.run(iterations)
+        t = timeit.default_timer()-start
+        topo.sim.stop_profiling()
+        times[profiled] = min(t,times.get(profiled,t))
+
+    overhead = 100.0*(times[True]-times[False])/times[False]
+    print "%10s %10s" % ("profiled","time (s)")
+    for profiled in [False,True]:
+        print "%10s %10.3f" % (profiled,times[profiled])
+    print "Profiling overhead: %.2f%%" % overhead
+    return overhead
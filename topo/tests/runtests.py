@@ -162,6 +162,14 @@ for script in TRAINSCRIPTS:
     target['unopt'].append(topographica_script + " -c \"import_weave=False\"" +  " -c \"from topo.tests.test_script import test_script; test_script(script=%(script_path)s,decimal=%(dp)s)\""%dict(script_path=repr(script_path),dp=p.testdp_unopt))
 
 
+# Reports only: always passes unless a script fails to run
+target['weightdtypes'] = []
+for script in TRAINSCRIPTS:
+    script_path = os.path.join(scripts_dir,script)
+    for weight_dtype in ["float16","float64"]:
+        target['weightdtypes'].append(topographica_script + ''' -c "from topo.tests.test_script import report_weight_dtype_accuracy; report_weight_dtype_accuracy(script=%(script_path)s,weight_dtype=%(weight_dtype)r)"'''%dict(script_path=repr(script_path),weight_dtype=weight_dtype))
+
+
 speedtarget['speedtests'] = []
 SPEEDSCRIPTS = TRAINSCRIPTS
 SPEEDSCRIPTS.remove("examples/hierarchical.ty") # CEBALERT: remove problematic example (doesn't work for some densities)
@@ -179,6 +187,14 @@ for script in STARTUPSPEEDSCRIPTS:
 
 
 
+# Reports only: timings of the sparse-input response modes on the
+# inputs seen during training
+speedtarget['sparseresponse'] = []
+for script in ["examples/gcal.ty"]:
+    script_path = os.path.join(scripts_dir,script)
+    speedtarget['sparseresponse'].append(topographica_script +  ''' -c "from topo.tests.test_script import report_sparse_response_speed;report_sparse_response_speed(script=%(script_path)s)"'''%dict(script_path=repr(script_path)))
+
+
 ##### snapshot-tests
 target['snapshots'] = []
 
@@ -289,6 +305,7 @@ def run_tests():
 
 target_description = {'training':"Test for consistent results from training models.",
                       'unopt':"Same as training, but without optimized components.",
+                      'weightdtypes':"Report how closely training with float16 and float64 weights matches the training data.",
                       'snapshots':"Test saving and restoring models from snapshots.",
                       'pickle':"Test whether components can be pickled and unpickled.",
                       'scriptrepr':"Test whether a model can be saved as a script_repr.",
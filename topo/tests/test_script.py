@@ -241,6 +241,126 @@ def test_script(script,decimal=None):
     print result+"\n"
 
 
+@nottest
+def report_weight_dtype_accuracy(script,weight_dtype="float16"):
+    """
+    Run script with the weights of all CFProjections stored as
+    weight_dtype (e.g. "float16" or "float64"; see
+    CFProjection.weight_dtype), and report how closely the activity
+    matches the checked-in training data (FIXEDDATADIR/script_name.ty_DATA),
+    which was generated with the default float32 weights.
+
+    For each time in the data, prints the maximum absolute difference
+    and the maximum difference relative to the largest reference
+    activity, and the number of decimal places to which
+    assert_array_almost_equal() would pass.  Does not fail if the
+    results differ; the report is intended for choosing a weight_dtype
+    (see topo/tests/README.rst).  Returns the report as a list of
+    (time,max_abs_diff,max_rel_diff,decimal) tuples.
+    """
+    import numpy
+    from topo.base.cf import CFProjection
+
+    print "Weight type accuracy report for %s with %s weights"%(script,weight_dtype)
+
+    script_name = os.path.basename(script)
+    locn = resolve_path(script_name+"_DATA",search_paths=[FIXEDDATADIR])
+    data = pickle.load(open(locn,'rb'))
+
+    run_for=data['run_for']
+    look_at = data['look_at']
+    args = data['args']
+    _support_old_args(args)
+    _setargs(args)
+
+    # (constant, but a new default can be set on the class)
+    CFProjection.weight_dtype = getattr(numpy,weight_dtype)
+
+    print "Starting '%s'"%script
+    execfile(script,__main__.__dict__)
+
+    time_fmt = topo.sim.timestr
+    if topo.sim.timestr(run_for[0]) not in data:
+        time_fmt = float
+
+    report = []
+    for time in run_for:
+        topo.sim.run(time)
+        reference = data[time_fmt(topo.sim.time())]
+        diff = numpy.abs(topo.sim[look_at].activity-reference).max()
+        rel_diff = diff/max(numpy.abs(reference).max(),1e-300)
+        # (assert_array_almost_equal checks abs(desired-actual) < 1.5*10**-decimal)
+        decimal = 16 if diff==0 else int(numpy.floor(-numpy.log10(diff/1.5)))
+        report.append((time_fmt(topo.sim.time()),diff,rel_diff,decimal))
+
+    print "%12s %14s %14s %8s"%("time","max abs diff","max rel diff","decimal")
+    for time,diff,rel_diff,decimal in report:
+        print "%12s %14.3e %14.3e %8d"%(time,diff,rel_diff,decimal)
+    print
+    return report
+
+
+@nottest
+def report_sparse_response_speed(script="examples/gcal.ty",iterations=20,repeats=5):
+    """
+    Run script for the given number of iterations, recording the
+    input activity of each CFProjection using CFPRF_DotProduct_opt at
+    the end of each iteration, and then time computing the responses
+    to those inputs with CFPRF_DotProduct_SparseInput_opt in each of
+    its modes ('dense', 'scatter' and 'auto').
+
+    Prints, for each projection, the mean fraction of nonzero inputs
+    and the mean time per response in each mode (the best of repeats
+    runs), and checks that all the modes give the same responses.
+    Returns the report as a list of (projection name, density, dense
+    time, scatter time, auto time) tuples.  Timings are machine
+    dependent, so nothing is stored or compared.
+    """
+    import time
+    import numpy
+    from topo.base.cf import CFProjection,CFIter
+    from topo.responsefn.optimized import CFPRF_DotProduct_opt,CFPRF_DotProduct_SparseInput_opt
+
+    print "Sparse input response speed report for %s"%script
+    execfile(script,__main__.__dict__)
+    projs = [c for c in topo.sim.connections() if isinstance(c,CFProjection) and
+             type(c.response_fn) is CFPRF_DotProduct_opt]
+    inputs = dict((p.name,[]) for p in projs)
+    for i in range(iterations):
+        topo.sim.run(1)
+        for p in projs:
+            if p.input_buffer is not None:
+                inputs[p.name].append(p.input_buffer.copy())
+
+    report = []
+    for p in projs:
+        if not inputs[p.name]:
+            continue
+        density = numpy.mean([numpy.count_nonzero(x)/float(x.size) for x in inputs[p.name]])
+        times,responses = [],[]
+        for mode in ['dense','scatter','auto']:
+            response_fn = CFPRF_DotProduct_SparseInput_opt(mode=mode)
+            activity = numpy.zeros(p.activity.shape)
+            response_fn(CFIter(p),inputs[p.name][0],activity,p.strength) # (compilation)
+            best = None
+            for r in range(repeats):
+                start = time.time()
+                for x in inputs[p.name]:
+                    response_fn(CFIter(p),x,activity,p.strength)
+                best = min(best,time.time()-start) if best is not None else time.time()-start
+            times.append(best/len(inputs[p.name]))
+            responses.append(activity.copy())
+        assert_array_almost_equal(responses[1],responses[0],decimal=10)
+        assert_array_almost_equal(responses[2],responses[0],decimal=10)
+        report.append((p.name,density)+tuple(times))
+
+    print "%24s %8s %12s %12s %12s"%("projection","density","dense (ms)","scatter (ms)","auto (ms)")
+    for name,density,dense,scatter,auto in report:
+        print "%24s %8.3f %12.3f %12.3f %12.3f"%(name,density,1e3*dense,1e3*scatter,1e3*auto)
+    print
+    return report
+
+
 # CEBALERT: old name
 #TestScript = test_script
 
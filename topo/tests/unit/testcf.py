@@ -3,7 +3,8 @@ import numpy
 
 from topo.base.simulation import Simulation
 from topo.base.boundingregion import BoundingBox
-from topo.base.cf import CFIter,ResizableCFProjection,CFSheet
+from topo.base.cf import CFIter,ResizableCFProjection,CFSheet,CFProjection
+from topo.tests.utils import Clip,gaussian_input_simulation
 
 class TestCFIter(unittest.TestCase):
 
@@ -67,6 +68,596 @@ class TestCFIter(unittest.TestCase):
             self.failUnless(cf is proj.flatcfs[24])
         self.failUnlessEqual(total,1)
 
+
+    def test_indices(self):
+        """
+        Test that indices() selects the same CFs as iterating
+        """
+        dest = self.sim['Dest']
+        proj = dest.projections()['SrcToDest']
+        proj.flatcfs[3] = None
+        dest.mask.data = numpy.ones(dest.activity.shape)
+        dest.mask.data.flat[10:20] = 0
+        dest.activity.flat[::3] = 1.0
+        for active_units_mask in [False,True]:
+            iterator = self.iter_type(proj,active_units_mask=active_units_mask)
+            indices = iterator.indices()
+            self.failUnlessEqual(list(indices),[i for cf,i in iterator()])
+            self.failIf(3 in indices or 12 in indices)
+
+
+    def test_active_units_shared(self):
+        """
+        Test that learn() finds the active units once, for all projections
+        """
+        from topo.base.cf import CFPLearningFn
+        found = []
+        class _Record(CFPLearningFn):
+            def __call__(self,iterator,input_activity,output_activity,learning_rate,**params):
+                found.append(iterator.active_unit_indices())
+
+        self.sim.connect('Src','Dest',name='Other',connection_type=CFProjection)
+        dest = self.sim['Dest']
+        for proj in dest.in_connections:
+            proj.learning_fn = _Record()
+            proj.input_buffer = numpy.zeros(self.sim['Src'].activity.shape)
+        dest.mask.data = numpy.ones(dest.activity.shape)
+        dest.mask.data.flat[10:20] = 0
+        dest.activity.flat[::3] = 1.0
+        dest.learn()
+
+        self.failUnlessEqual(len(found),2)
+        self.failUnless(found[0] is found[1])
+        self.failUnlessEqual(list(found[0]),[i for i in range(0,100,3) if not 10<=i<20])
+        self.failUnlessEqual(dest._active_units,None)
+        self.failUnlessEqual(list(dest.active_unit_indices()),list(found[0]))
+
+
+class TestConcurrentActivation(unittest.TestCase):
+
+    def _run(self,activation_threads):
+        import imagen
+        from topo.sheet import GeneratorSheet
+        from topo.learningfn.optimized import CFPLF_Hebbian
+
+        s = Simulation(register=False)
+        b = BoundingBox(radius=0.5)
+        s['In'] = GeneratorSheet(nominal_density=10,nominal_bounds=b,period=1.0,
+                                 input_generator=imagen.Gaussian(x=0.1,y=-0.2,size=0.3))
+        s['V1'] = CFSheet(nominal_density=10,nominal_bounds=b,
+                          output_fns=[Clip()],
+                          activation_threads=activation_threads)
+        for name,src,radius in [('Afferent','In',0.3),('LateralExc','V1',0.1),
+                                ('LateralInh','V1',0.25)]:
+            s.connect(src,'V1',name=name,delay=0.05,connection_type=CFProjection,
+                      nominal_bounds_template=BoundingBox(radius=radius),
+                      learning_fn=CFPLF_Hebbian(),learning_rate=0.1)
+        s['V1'].projections('LateralInh').strength = -0.5
+        s.run(3)
+        return s
+
+    def test_matches_serial(self):
+        serial = self._run(0)
+        threaded = self._run(3)
+        assert serial['V1'].activity.any()
+        numpy.testing.assert_array_equal(serial['V1'].activity,threaded['V1'].activity)
+        for name in ['Afferent','LateralExc','LateralInh']:
+            p1,p2 = serial['V1'].projections(name),threaded['V1'].projections(name)
+            numpy.testing.assert_array_equal(p1.activity,p2.activity)
+            for cf1,cf2 in zip(p1.flatcfs,p2.flatcfs):
+                numpy.testing.assert_array_equal(cf1.weights,cf2.weights)
+        self.assertEqual(threaded['V1'].__dict__['_pending_activations'],[])
+
+
+class TestPackedWeights(unittest.TestCase):
+
+    def _run(self,packed_weights,duration=3):
+        from topo.learningfn.optimized import CFPLF_Hebbian_opt
+        return gaussian_input_simulation(duration,connection_type=ResizableCFProjection,
+                                         packed_weights=packed_weights,
+                                         learning_fn=CFPLF_Hebbian_opt())
+
+    def _assert_packed(self,proj):
+        packed = proj._packed
+        self.assertEqual(len(packed),len(proj.flatcfs))
+        assert packed.is_packed(proj.flatcfs)
+        assert packed.slices is proj.input_sheet_slices
+        for i,cf in enumerate(proj.flatcfs):
+            start,end = packed.offsets[i],packed.offsets[i+1]
+            self.assertEqual(tuple(packed.shapes[i]),cf.weights.shape)
+            self.assertEqual(list(packed.slices[i]),list(cf.input_sheet_slice))
+            assert numpy.may_share_memory(packed.slices[i],cf.input_sheet_slice)
+            numpy.testing.assert_array_equal(packed.weights[start:end],cf.weights.ravel())
+            rows,cols = cf.mask.shape
+            for r in range(rows):
+                start = packed.mask_offsets[i]+r*packed.mask_rowstrides[i]
+                numpy.testing.assert_array_equal(packed.masks[start:start+cols],cf.mask[r])
+
+    def test_views(self):
+        s = self._run(True,duration=0)
+        proj = s['V1'].projections('Afferent')
+        self._assert_packed(proj)
+        cf,packed = proj.flatcfs[7],proj._packed
+        cf.weights *= 2.0
+        numpy.testing.assert_array_equal(packed.weights[packed.offsets[7]:packed.offsets[8]],
+                                         cf.weights.ravel())
+        cf.norm_total = 3.0
+        self.assertEqual((packed.norm_total[7],packed.has_norm_total[7]),(3.0,1))
+        # replacing the array leaves the packed storage
+        cf.weights = cf.weights*1.0
+        assert not packed.is_packed(proj.flatcfs)
+
+    def test_same_results(self):
+        # (each Simulation resets the time on creation)
+        unpacked = self._run(False)
+        packed = self._run(True)
+        self.assertEqual(unpacked['V1'].projections('Afferent')._packed,None)
+        assert packed['V1'].activity.any()
+        numpy.testing.assert_array_equal(unpacked['V1'].activity,packed['V1'].activity)
+        for cf1,cf2 in zip(unpacked['V1'].projections('Afferent').flatcfs,
+                           packed['V1'].projections('Afferent').flatcfs):
+            numpy.testing.assert_array_equal(cf1.weights,cf2.weights)
+
+    def test_change_bounds(self):
+        s = self._run(True,duration=0)
+        proj = s['V1'].projections('Afferent')
+        n_weights = len(proj._packed.weights)
+        proj.change_bounds(BoundingBox(radius=0.15))
+        self._assert_packed(proj)
+        assert len(proj._packed.weights) < n_weights
+
+    def test_replaced_weights(self):
+        from topo.base.cf import CFIter
+        s = self._run(True,duration=0)
+        proj = s['V1'].projections('Afferent')
+        packed = proj._packed
+        cf = proj.flatcfs[7]
+        cf.weights = cf.weights*2.0
+        weights = cf.weights.copy()
+        # the optimized functions are given the repacked weights
+        iterator = CFIter(proj)
+        assert iterator.packed is not packed
+        self._assert_packed(proj)
+        numpy.testing.assert_array_equal(proj.flatcfs[7].weights,weights)
+        self.assertEqual(iterator.packed,proj.get_packed_weights())
+
+    def test_pickle(self):
+        import pickle
+        s = self._run(True,duration=1)
+        proj = s['V1'].projections('Afferent')
+        self.assertFalse('_packed' in proj.__getstate__())
+        proj2 = pickle.loads(pickle.dumps(s,2))['V1'].projections('Afferent')
+        self._assert_packed(proj2)
+        numpy.testing.assert_array_equal(proj._packed.weights,proj2._packed.weights)
+        numpy.testing.assert_array_equal(proj._packed.norm_total,proj2._packed.norm_total)
+
+    def test_sizes(self):
+        for packed_weights in (False,True):
+            s = self._run(packed_weights,duration=0)
+            proj = s['V1'].projections('Afferent')
+            self.assertEqual(proj.n_conns(),sum([numpy.count_nonzero(cf.mask)
+                                                 for cf in proj.flatcfs]))
+            n_bytes = proj.n_bytes()
+            assert proj._sizes is not None
+            # the cached sizes are replaced when the CFs change shape
+            proj.change_bounds(BoundingBox(radius=0.15))
+            self.assertEqual(proj.n_conns(),sum([numpy.count_nonzero(cf.mask)
+                                                 for cf in proj.flatcfs]))
+            assert proj.n_bytes() < n_bytes
+
+    def test_shared_masks(self):
+        import pickle
+        s = self._run(True,duration=0)
+        proj = s['V1'].projections('Afferent')
+        # all the CFs (including those cropped at the edges) use the template
+        self.assertEqual(proj._packed.masks.size,proj.mask_template.size)
+        self.assertFalse(proj._packed.masks.flags.writeable)
+        self.assertFalse(proj.flatcfs[0].mask.flags.writeable)
+        proj2 = pickle.loads(pickle.dumps(s,2))['V1'].projections('Afferent')
+        self._assert_packed(proj2)
+        self.assertEqual(proj2._packed.masks.size,proj2.mask_template.size)
+        for cf1,cf2 in zip(proj.flatcfs,proj2.flatcfs):
+            numpy.testing.assert_array_equal(cf1.mask,cf2.mask)
+
+
+class TestBatchCFCreation(unittest.TestCase):
+
+    def _assert_same_cfs(self,proj):
+        # compare against creating each CF separately
+        assert proj._can_batch_create_cfs()
+        from topo.base.cf import simple_vectorize
+        cfs = simple_vectorize(proj._create_cf)(*proj._generate_coords())
+        self.assertEqual(cfs.shape,proj.cfs.shape)
+        for cf1,cf2 in zip(cfs.flat,proj.flatcfs):
+            if cf1 is None:
+                self.assertEqual(cf2,None)
+                continue
+            self.assertEqual(list(cf1.input_sheet_slice),list(cf2.input_sheet_slice))
+            numpy.testing.assert_array_equal(cf1.mask,cf2.mask)
+            numpy.testing.assert_array_equal(cf1.weights,cf2.weights)
+            self.assertEqual(cf1.weights.dtype,cf2.weights.dtype)
+        # the table the CFs' Slices are views of
+        from topo.base.cf import _input_sheet_slice_table
+        numpy.testing.assert_array_equal(proj.input_sheet_slices,
+                                         _input_sheet_slice_table(list(cfs.flat)))
+        for cf,row in zip(proj.flatcfs,proj.input_sheet_slices):
+            if cf is not None:
+                assert numpy.may_share_memory(cf.input_sheet_slice,row)
+
+    def _connect(self,src_bounds,**params):
+        from imagen.random import UniformRandom
+        s = Simulation(register=False)
+        s['Src'] = CFSheet(nominal_density=13,nominal_bounds=src_bounds)
+        s['Dest'] = CFSheet(nominal_density=7,nominal_bounds=BoundingBox(radius=0.5))
+        s.connect('Src','Dest',name='P',connection_type=CFProjection,
+                  apply_output_fns_init=False,
+                  weights_generator=UniformRandom(),**params)
+        return s['Dest'].projections('P')
+
+    def test_random_weights(self):
+        self._assert_same_cfs(self._connect(BoundingBox(radius=0.5),
+                                            nominal_bounds_template=BoundingBox(radius=0.27)))
+
+    def test_cf_shapes(self):
+        from imagen.random import UniformRandom
+        self._assert_same_cfs(self._connect(BoundingBox(radius=0.5),
+                                            nominal_bounds_template=BoundingBox(radius=0.3),
+                                            cf_shape=UniformRandom(),
+                                            same_cf_shape_for_all_cfs=False))
+
+    def test_null_cfs(self):
+        src_bounds = BoundingBox(points=((-0.5,-0.5),(0.0,0.5)))
+        proj = self._connect(src_bounds,allow_null_cfs=True,
+                             nominal_bounds_template=BoundingBox(radius=0.1))
+        assert None in proj.flatcfs
+        self._assert_same_cfs(proj)
+        from topo.base.cf import NullCFError
+        self.assertRaises(NullCFError,self._connect,src_bounds,
+                          nominal_bounds_template=BoundingBox(radius=0.1))
+
+
+class TestWeightDtype(unittest.TestCase):
+
+    def _run(self,weight_dtype,duration=3,**params):
+        from topo.learningfn.optimized import CFPLF_Hebbian_opt
+        from topo.responsefn.optimized import CFPRF_DotProduct_opt
+        fns = dict(response_fn=CFPRF_DotProduct_opt(),learning_fn=CFPLF_Hebbian_opt())
+        fns.update(params)
+        return gaussian_input_simulation(duration,weight_dtype=weight_dtype,**fns)
+
+    def test_storage(self):
+        for weight_dtype in [numpy.float16,numpy.float64]:
+            proj = self._run(weight_dtype,duration=0)['V1'].projections('Afferent')
+            for cf in proj.flatcfs:
+                self.assertEqual(cf.weights.dtype,weight_dtype)
+                self.assertEqual(cf.mask.dtype,numpy.float32)
+            self.assertEqual(proj._packed.weights.dtype,weight_dtype)
+            self.assertEqual(CFIter(proj).weight_dtype,weight_dtype)
+
+    def test_close_to_float32(self):
+        reference = self._run(numpy.float32)['V1'].activity
+        assert reference.any()
+        numpy.testing.assert_array_almost_equal(self._run(numpy.float64)['V1'].activity,
+                                                reference,decimal=5)
+        numpy.testing.assert_array_almost_equal(self._run(numpy.float16)['V1'].activity,
+                                                reference,decimal=2)
+
+    def test_optimized_same_as_unoptimized(self):
+        from topo.learningfn.optimized import CFPLF_Hebbian
+        from topo.responsefn.optimized import CFPRF_DotProduct
+        from topo.transferfn.optimized import CFPOF_DivisiveNormalizeL1,\
+             CFPOF_DivisiveNormalizeL1_opt
+        for weight_dtype,decimal in [(numpy.float16,3),(numpy.float64,10)]:
+            for packed_weights in [True,False]:
+                expected = self._run(weight_dtype,packed_weights=packed_weights,
+                                     response_fn=CFPRF_DotProduct(),learning_fn=CFPLF_Hebbian(),
+                                     weights_output_fns=[CFPOF_DivisiveNormalizeL1()])
+                s = self._run(weight_dtype,packed_weights=packed_weights,
+                              weights_output_fns=[CFPOF_DivisiveNormalizeL1_opt()])
+                numpy.testing.assert_array_almost_equal(s['V1'].activity,
+                                                        expected['V1'].activity,decimal=decimal)
+                for cf1,cf2 in zip(expected['V1'].projections('Afferent').flatcfs,
+                                   s['V1'].projections('Afferent').flatcfs):
+                    self.assertEqual(cf2.weights.dtype,weight_dtype)
+                    numpy.testing.assert_array_almost_equal(cf2.weights,cf1.weights,
+                                                            decimal=decimal)
+
+
+class TestSharedWeightCorrelation(unittest.TestCase):
+
+    def _responses(self,**params):
+        import imagen
+        from topo.projection import SharedWeightCFProjection,CFPRF_SharedWeightCorrelation
+        from topo.responsefn.projfn import CFPRF_DotProduct
+
+        s = Simulation(register=False)
+        s['Src'] = CFSheet(nominal_density=20,nominal_bounds=BoundingBox(radius=0.5))
+        s['Dest'] = CFSheet(nominal_density=10,nominal_bounds=BoundingBox(radius=0.5))
+        s.connect('Src','Dest',name='P',connection_type=SharedWeightCFProjection,
+                  nominal_bounds_template=BoundingBox(radius=0.3),strength=0.7,
+                  weights_generator=imagen.Gaussian(aspect_ratio=0.4,size=0.2,orientation=0.5))
+        proj = s['Dest'].projections('P')
+        s['Dest'].mask.data.flat[5] = 0.0
+
+        input_activity = numpy.random.RandomState(0).uniform(size=s['Src'].activity.shape)
+        responses = []
+        for response_fn in [CFPRF_DotProduct(),CFPRF_SharedWeightCorrelation(**params)]:
+            activity = numpy.zeros(proj.activity.shape)
+            response_fn(CFIter(proj),input_activity,activity,proj.strength)
+            responses.append(activity)
+        return responses
+
+    def test_direct(self):
+        expected,activity = self._responses(fft_min_weights=10**6)
+        numpy.testing.assert_array_almost_equal(activity,expected,decimal=10)
+        self.assertEqual(activity.flat[5],0.0)
+
+    def test_fft(self):
+        expected,activity = self._responses(fft_min_weights=0)
+        numpy.testing.assert_array_almost_equal(activity,expected,decimal=10)
+
+
+class TestBatchedDotProduct(unittest.TestCase):
+
+    def _run(self,response_fn,duration=3):
+        from topo.learningfn.optimized import CFPLF_Hebbian_opt
+        from topo.transferfn.optimized import CFPOF_DivisiveNormalizeL1_opt
+        return gaussian_input_simulation(duration,connection_type=ResizableCFProjection,
+                                         response_fn=response_fn,learning_fn=CFPLF_Hebbian_opt(),
+                                         weights_output_fns=[CFPOF_DivisiveNormalizeL1_opt()])
+
+    def test_same_results(self):
+        from topo.responsefn.optimized import CFPRF_DotProduct_opt
+        from topo.responsefn.projfn import CFPRF_DotProduct_Batched
+        expected = self._run(CFPRF_DotProduct_opt())
+        batched = self._run(CFPRF_DotProduct_Batched())
+        assert batched['V1'].activity.any()
+        numpy.testing.assert_array_almost_equal(batched['V1'].activity,
+                                                expected['V1'].activity,decimal=10)
+
+        # the matrix has been kept up to date with learning
+        proj = batched['V1'].projections('Afferent')
+        cf_matrix = proj._cf_matrix
+        for i,cf in enumerate(proj.flatcfs):
+            numpy.testing.assert_array_equal(cf_matrix.weights[i,:cf.weights.size],
+                                             cf.weights.ravel())
+
+    def test_change_bounds(self):
+        from topo.responsefn.projfn import CFPRF_DotProduct_Batched
+        proj = self._run(CFPRF_DotProduct_Batched(),duration=1)['V1'].projections('Afferent')
+        assert proj._cf_matrix is not None
+        proj.change_bounds(BoundingBox(radius=0.15))
+        self.assertEqual(proj._cf_matrix,None)
+
+
+class TestWeightsFile(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.dirname = tempfile.mkdtemp()
+        self.filename = self.dirname+'/Afferent.weights'
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.dirname)
+
+    def _run(self,duration=3,**params):
+        from topo.learningfn.optimized import CFPLF_Hebbian_opt
+        return gaussian_input_simulation(duration,connection_type=ResizableCFProjection,
+                                         learning_fn=CFPLF_Hebbian_opt(),**params)
+
+    def test_same_results(self):
+        in_memory = self._run()
+        in_file = self._run(weights_file=self.filename)
+        proj = in_file['V1'].projections('Afferent')
+        assert isinstance(proj._packed.weights,numpy.memmap)
+        numpy.testing.assert_array_equal(in_memory['V1'].activity,in_file['V1'].activity)
+        for cf1,cf2 in zip(in_memory['V1'].projections('Afferent').flatcfs,proj.flatcfs):
+            numpy.testing.assert_array_equal(cf1.weights,cf2.weights)
+
+    def test_pickle(self):
+        import pickle
+        s = self._run(weights_file=self.filename)
+        proj = s['V1'].projections('Afferent')
+        pickled = pickle.dumps(s,2)
+        # the weights are left out
+        assert len(pickled) < proj._packed.weights.nbytes
+        proj2 = pickle.loads(pickled)['V1'].projections('Afferent')
+        self.assertEqual(proj2.weights_file,self.filename)
+        numpy.testing.assert_array_equal(proj._packed.weights,proj2._packed.weights)
+        for cf1,cf2 in zip(proj.flatcfs,proj2.flatcfs):
+            numpy.testing.assert_array_equal(cf1.weights,cf2.weights)
+
+    def test_read_only(self):
+        trained = self._run(weights_file=self.filename)['V1'].projections('Afferent')
+        weights = numpy.array(trained._packed.weights)
+        s = self._run(weights_file=self.filename,weights_file_mode='r')
+        proj = s['V1'].projections('Afferent')
+        assert s['V1'].activity.any()
+        assert not proj.flatcfs[0].weights.flags.writeable
+        # the trained weights are used, and are not changed by learning
+        numpy.testing.assert_array_equal(proj._packed.weights,weights)
+        self.assertRaises(OSError,self._run,weights_file=self.dirname+'/missing',
+                          weights_file_mode='r+')
+
+    def test_weights_in_file(self):
+        trained = self._run(weights_file=self.filename)['V1'].projections('Afferent')
+        weights = numpy.array(trained._packed.weights)
+        # no weights are generated when using those in the file
+        proj = self._run(duration=0,weights_file=self.filename,
+                         weights_file_mode='r+')['V1'].projections('Afferent')
+        numpy.testing.assert_array_equal(proj._packed.weights,weights)
+
+    def test_change_bounds(self):
+        s = self._run(duration=1,weights_file=self.filename)
+        proj = s['V1'].projections('Afferent')
+        proj.change_bounds(BoundingBox(radius=0.15))
+        import os
+        self.assertEqual(os.path.getsize(self.filename),proj._packed.weights.nbytes)
+        assert proj._packed.is_packed(proj.flatcfs)
+
+
+class TestSparseInputResponse(unittest.TestCase):
+
+    def setUp(self):
+        from imagen.random import UniformRandom
+        s = Simulation(register=False)
+        b = BoundingBox(radius=0.5)
+        s['In'] = CFSheet(nominal_density=12,nominal_bounds=b)
+        s['V1'] = CFSheet(nominal_density=10,nominal_bounds=b)
+        s.connect('In','V1',name='Afferent',connection_type=CFProjection,
+                  nominal_bounds_template=BoundingBox(radius=0.3),
+                  weights_generator=UniformRandom())
+        self.proj = s['V1'].projections('Afferent')
+        s['V1'].mask.data.flat[7] = 0.0
+
+        # mostly zero, as after half-rectification
+        input_activity = numpy.random.RandomState(1).uniform(-1.0,0.2,size=s['In'].activity.shape)
+        self.input_activity = numpy.where(input_activity>0,input_activity,0.0)
+
+    def _response(self,response_fn):
+        activity = numpy.zeros(self.proj.activity.shape)
+        response_fn(CFIter(self.proj),self.input_activity,activity,0.7)
+        return activity
+
+    def test_outstar_index(self):
+        outstar = self.proj.get_outstar_index()
+        packed = self.proj._packed
+        icols = self.input_activity.shape[1]
+        self.assertEqual(outstar.starts[-1],len(packed.weights))
+        for i,cf in enumerate(self.proj.flatcfs):
+            r1,r2,c1,c2 = cf.input_sheet_slice
+            for j in [r1*icols+c1,(r2-1)*icols+c2-1]:
+                entries = slice(outstar.starts[j],outstar.starts[j+1])
+                assert i in outstar.cf_index[entries]
+        j = 5*icols+6
+        entries = slice(outstar.starts[j],outstar.starts[j+1])
+        self.assertEqual(outstar.fan_out(numpy.array([j])),entries.stop-entries.start)
+        numpy.testing.assert_array_equal(numpy.diff(outstar.cf_index[entries])>0,True)
+
+        self.proj.change_bounds(BoundingBox(radius=0.15))
+        self.assertEqual(self.proj._outstar_index,None)
+        self.assertEqual(self.proj.get_outstar_index().starts[-1],len(self.proj._packed.weights))
+
+    def test_same_results(self):
+        from topo.responsefn.optimized import CFPRF_DotProduct_opt,CFPRF_DotProduct_SparseInput_opt
+        expected = self._response(CFPRF_DotProduct_opt())
+        assert expected.any()
+        self.assertEqual(expected.flat[7],0.0)
+        for mode in ['dense','scatter','auto']:
+            activity = self._response(CFPRF_DotProduct_SparseInput_opt(mode=mode))
+            numpy.testing.assert_array_almost_equal(activity,expected,decimal=10)
+
+
+class TestFusedLearning(unittest.TestCase):
+
+    def _run(self,fused_learning_fn=None,duration=3):
+        import imagen
+        from topo.sheet import JointNormalizingCFSheet
+        from topo.sheet.optimized import compute_joint_norm_totals_opt
+        from topo.learningfn.optimized import CFPLF_Hebbian_opt
+        from topo.responsefn.optimized import CFPRF_DotProduct_opt
+        from topo.transferfn.optimized import CFPOF_DivisiveNormalizeL1_opt
+
+        projections = [(name,dict(dest_port=dest_port,
+                                  weights_generator=imagen.Gaussian(aspect_ratio=0.5,size=size)))
+                       for name,dest_port,size in
+                       [('On',('Activity','JointNormalize','Afferent'),0.2),
+                        ('Off',('Activity','JointNormalize','Afferent'),0.1),
+                        ('Other','Activity',0.15)]]
+        s = gaussian_input_simulation(duration,sheet_type=JointNormalizingCFSheet,
+                                      sheet_params=dict(joint_norm_fn=compute_joint_norm_totals_opt,
+                                                        fused_learning_fn=fused_learning_fn),
+                                      projections=projections,
+                                      response_fn=CFPRF_DotProduct_opt(),
+                                      learning_fn=CFPLF_Hebbian_opt(),
+                                      weights_output_fns=[CFPOF_DivisiveNormalizeL1_opt()])
+        return s['V1']
+
+    def test_same_results(self):
+        from topo.sheet.optimized import learn_and_normalize_opt
+        expected = self._run()
+        fused = self._run(learn_and_normalize_opt)
+        assert fused.activity.any()
+        numpy.testing.assert_array_almost_equal(fused.activity,expected.activity,decimal=10)
+        for name in ['On','Off','Other']:
+            for cf1,cf2 in zip(expected.projections(name).flatcfs,
+                               fused.projections(name).flatcfs):
+                numpy.testing.assert_array_almost_equal(cf2.weights,cf1.weights,decimal=6)
+
+        # the jointly normalized CFs sum to 1.0 together
+        on,off = fused.projections('On').flatcfs,fused.projections('Off').flatcfs
+        i = int(numpy.argmax(fused.activity))
+        self.assertAlmostEqual(on[i].weights.sum()+off[i].weights.sum(),1.0,places=5)
+
+
+class TestAutotuned(unittest.TestCase):
+
+    def _run(self,duration=3,**params):
+        from topo.learningfn.optimized import CFPLF_Hebbian_opt
+        from topo.responsefn.optimized import CFPRF_DotProduct_opt
+        from topo.transferfn.optimized import CFPOF_DivisiveNormalizeL1_opt
+
+        fns = dict(response_fn=CFPRF_DotProduct_opt(),learning_fn=CFPLF_Hebbian_opt(),
+                   weights_output_fns=[CFPOF_DivisiveNormalizeL1_opt()])
+        fns.update(params)
+        return gaussian_input_simulation(duration,**fns)['V1']
+
+    def test_same_results(self):
+        from topo.learningfn.optimized import CFPLF_Autotuned
+        from topo.responsefn.optimized import CFPRF_Autotuned
+        from topo.transferfn.optimized import CFPOF_Autotuned
+        params = dict(cython_candidates=[],cache_file=None)
+        expected = self._run()
+        autotuned = self._run(response_fn=CFPRF_Autotuned(**params),
+                              learning_fn=CFPLF_Autotuned(**params),
+                              weights_output_fns=[CFPOF_Autotuned(**params)])
+        assert autotuned.activity.any()
+        numpy.testing.assert_array_almost_equal(autotuned.activity,expected.activity,decimal=10)
+        for cf1,cf2 in zip(expected.projections('Afferent').flatcfs,
+                           autotuned.projections('Afferent').flatcfs):
+            numpy.testing.assert_array_almost_equal(cf2.weights,cf1.weights,decimal=6)
+
+        # the CFMatrix built while timing CFPRF_DotProduct_Batched is
+        # kept only if that candidate was chosen
+        proj = autotuned.projections('Afferent')
+        fn = proj.response_fn._choices.values()[0]
+        self.assertEqual(proj._cf_matrix is None,type(fn).__name__!='CFPRF_DotProduct_Batched')
+
+    def test_different_results_rejected(self):
+        from topo.responsefn.optimized import CFPRF_Autotuned,CFPRF_DotProduct_opt,\
+             CFPRF_EuclideanDistance_opt
+        fn = CFPRF_Autotuned(candidates=[CFPRF_DotProduct_opt(),CFPRF_EuclideanDistance_opt()],
+                             cython_candidates=[],cache_file=None)
+        self._run(duration=1,response_fn=fn)
+        self.assertEqual([type(c) for c in fn._choices.values()],[CFPRF_DotProduct_opt])
+
+    def test_cache_file(self):
+        import os,tempfile
+        from topo.misc.autotune import load_choices,save_choice
+        from topo.responsefn.optimized import CFPRF_Autotuned,CFPRF_DotProduct_opt,\
+             CFPRF_DotProduct
+        fd,cache_file = tempfile.mkstemp()
+        os.close(fd)
+        os.remove(cache_file)
+        try:
+            params = dict(candidates=[CFPRF_DotProduct_opt(),CFPRF_DotProduct()],
+                          cython_candidates=[],cache_file=cache_file)
+            self._run(duration=1,response_fn=CFPRF_Autotuned(**params))
+            choices = load_choices(cache_file)
+            self.assertEqual(len(choices),1)
+
+            # a stored decision is used without timing
+            key = choices.keys()[0]
+            save_choice(cache_file,key,'CFPRF_DotProduct')
+            fn = CFPRF_Autotuned(**params)
+            self._run(duration=1,response_fn=fn)
+            self.assertEqual([type(c) for c in fn._choices.values()],[CFPRF_DotProduct])
+        finally:
+            if os.path.exists(cache_file):
+                os.remove(cache_file)
+
+
 if __name__ == "__main__":
 	import nose
 	nose.runmodule()
\ No newline at end of file
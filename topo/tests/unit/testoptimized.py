@@ -0,0 +1,133 @@
+"""
+Tests that the Cython components in topo.optimized give the same
+results as the components they replace.
+"""
+
+import unittest
+import numpy
+
+from topo.tests.utils import gaussian_input_simulation
+
+
+class TestCythonKernels(unittest.TestCase):
+
+    def _run(self,duration=3,**params):
+        from topo.learningfn.optimized import CFPLF_Hebbian_opt
+        from topo.responsefn.optimized import CFPRF_DotProduct_opt
+        from topo.transferfn.optimized import CFPOF_DivisiveNormalizeL1_opt
+
+        fns = dict(response_fn=CFPRF_DotProduct_opt(),learning_fn=CFPLF_Hebbian_opt(),
+                   weights_output_fns=[CFPOF_DivisiveNormalizeL1_opt()])
+        fns.update(params)
+        return gaussian_input_simulation(duration,**fns)
+
+    def _assert_same(self,expected,s):
+        assert s['V1'].activity.any()
+        numpy.testing.assert_array_almost_equal(s['V1'].activity,
+                                                expected['V1'].activity,decimal=10)
+        for cf1,cf2 in zip(expected['V1'].projections('Afferent').flatcfs,
+                           s['V1'].projections('Afferent').flatcfs):
+            numpy.testing.assert_array_almost_equal(cf1.weights,cf2.weights,decimal=6)
+
+    def test_dot_product(self):
+        from topo.optimized import CFPRF_DotProduct_cython
+        self._assert_same(self._run(),self._run(response_fn=CFPRF_DotProduct_cython()))
+
+    def test_euclidean_distance(self):
+        from topo.optimized import CFPRF_EuclideanDistance_cython
+        from topo.responsefn.optimized import CFPRF_EuclideanDistance_opt
+        self._assert_same(self._run(response_fn=CFPRF_EuclideanDistance_opt()),
+                          self._run(response_fn=CFPRF_EuclideanDistance_cython()))
+
+    def test_hebbian(self):
+        from topo.optimized import CFPLF_Hebbian_cython
+        self._assert_same(self._run(),self._run(learning_fn=CFPLF_Hebbian_cython()))
+
+    def test_scaled(self):
+        from topo.optimized import CFPLF_Scaled_cython
+        from topo.learningfn.optimized import CFPLF_Scaled_opt
+        expected_fn,fn = CFPLF_Scaled_opt(),CFPLF_Scaled_cython()
+        scaling = numpy.linspace(0.5,1.5,100).reshape(10,10)
+        expected_fn.learning_rate_scaling_factor = scaling
+        fn.learning_rate_scaling_factor = scaling.copy()
+        self._assert_same(self._run(learning_fn=expected_fn),self._run(learning_fn=fn))
+
+    def test_divisive_normalize_l1(self):
+        from topo.optimized import CFPOF_DivisiveNormalizeL1_cython
+        self._assert_same(self._run(),self._run(
+            weights_output_fns=[CFPOF_DivisiveNormalizeL1_cython()]))
+
+    def test_weight_dtypes(self):
+        from topo.optimized import CFPRF_DotProduct_cython,CFPLF_Hebbian_cython,\
+             CFPOF_DivisiveNormalizeL1_cython
+        for weight_dtype in [numpy.float16,numpy.float64]:
+            self._assert_same(self._run(weight_dtype=weight_dtype,packed_weights=False),
+                              self._run(weight_dtype=weight_dtype,packed_weights=False,
+                                        response_fn=CFPRF_DotProduct_cython(),
+                                        learning_fn=CFPLF_Hebbian_cython(),
+                                        weights_output_fns=[CFPOF_DivisiveNormalizeL1_cython()]))
+
+    def test_joint_norm_totals(self):
+        from topo.sheet import compute_joint_norm_totals
+        from topo.optimized import compute_joint_norm_totals_cython
+        proj = self._run(duration=1)['V1'].projections('Afferent')
+        totals = []
+        for fn in [compute_joint_norm_totals,compute_joint_norm_totals_cython]:
+            # (the stored totals are otherwise summed instead of the weights)
+            for cf in proj.flatcfs:
+                del cf.norm_total
+            fn([proj,proj],active_units_mask=False)
+            totals.append([cf.norm_total for cf in proj.flatcfs])
+        numpy.testing.assert_array_almost_equal(totals[1],totals[0],decimal=6)
+
+    def test_neighborhood_mask(self):
+        from topo.base.projection import NeighborhoodMask
+        from topo.optimized import NeighborhoodMask_cython
+        sheet = self._run(duration=1)['V1']
+        masks = []
+        for mask_type in [NeighborhoodMask,NeighborhoodMask_cython]:
+            mask = mask_type(sheet,radius=0.2,threshold=0.0001)
+            mask.calculate()
+            masks.append(mask.data)
+        assert masks[0].any() and not masks[0].all()
+        numpy.testing.assert_array_equal(masks[1],masks[0])
+
+    def test_colorspaces(self):
+        import colorsys
+        from imagen.colorspaces import _rgb_to_hsv_array,_hsv_to_rgb_array
+        from topo.optimized import rgb_to_hsv_array_cython,hsv_to_rgb_array_cython
+        RGB = numpy.random.RandomState(0).uniform(size=(6,7,3)).astype(numpy.float32)
+        RGB[0,0] = 0.5  # grey: hue and saturation of zero
+        HSV = _rgb_to_hsv_array(RGB)
+        numpy.testing.assert_array_almost_equal(rgb_to_hsv_array_cython(RGB),HSV,decimal=5)
+        numpy.testing.assert_array_almost_equal(hsv_to_rgb_array_cython(HSV),
+                                                _hsv_to_rgb_array(HSV),decimal=5)
+
+        # hues outside [0,1) wrap around, as in colorsys
+        HSV[0,1:4,0] = [-0.3,1.0,1.25]
+        HSV[0,1:4,1:] = 0.5
+        numpy.testing.assert_array_almost_equal(
+            hsv_to_rgb_array_cython(HSV)[0,1:4],
+            [colorsys.hsv_to_rgb(*hsv) for hsv in HSV[0,1:4]],decimal=5)
+
+    def test_fallback_without_weave(self):
+        import topo.optimized
+        from topo.misc import inlinec
+        from topo.responsefn.optimized import CFPRF_DotProduct
+        optimized = inlinec.optimized
+        inlinec.optimized = False
+        try:
+            namespace = dict(__name__='test',CFPRF_DotProduct=CFPRF_DotProduct)
+            inlinec.provide_unoptimized_equivalent("CFPRF_DotProduct_opt","CFPRF_DotProduct",
+                                                   namespace,"CFPRF_DotProduct_cython")
+        finally:
+            inlinec.optimized = optimized
+        if topo.optimized.cython_optimized:
+            self.assertTrue(namespace['CFPRF_DotProduct_opt'] is topo.optimized.CFPRF_DotProduct_cython)
+        else:
+            self.assertTrue(namespace['CFPRF_DotProduct_opt'] is CFPRF_DotProduct)
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
@@ -0,0 +1,80 @@
+"""
+Unit tests for partitioned (multi-process) simulation.
+"""
+
+import unittest
+import glob
+
+import numpy as np
+
+from topo.base.simulation import Simulation
+from topo.base.cf import CFSheet, CFProjection
+from topo.base.partition import SharedMemoryTransport
+from topo.learningfn.optimized import CFPLF_Hebbian_opt
+
+
+def _model():
+    import imagen
+    from topo.sheet import GeneratorSheet
+    from topo.base.boundingregion import BoundingBox
+
+    s = Simulation(register=False)
+    b = BoundingBox(radius=0.5)
+    s['Retina'] = GeneratorSheet(nominal_density=10,nominal_bounds=b,period=1.0,
+                                 input_generator=imagen.Gaussian(x=0.1,size=0.3))
+    for name in ['LGNOn','LGNOff','V1']:
+        s[name] = CFSheet(nominal_density=10,nominal_bounds=b)
+    s.connect('Retina','LGNOn',delay=0.05,connection_type=CFProjection)
+    s.connect('Retina','LGNOff',delay=0.05,connection_type=CFProjection,strength=0.5)
+    for name in ['LGNOn','LGNOff']:
+        s.connect(name,'V1',delay=0.05,connection_type=CFProjection,
+                  learning_fn=CFPLF_Hebbian_opt(),learning_rate=0.1)
+    s.connect('V1','V1',delay=0.05,connection_type=CFProjection,strength=0.1)
+    return s
+
+
+class TestPartition(unittest.TestCase):
+
+    def _compare(self,s1,s2):
+        for name in ['LGNOn','LGNOff','V1']:
+            np.testing.assert_array_equal(s1[name].activity,s2[name].activity)
+        for p1,p2 in zip(s1['V1'].in_connections,s2['V1'].in_connections):
+            for cf1,cf2 in zip(p1.flatcfs,p2.flatcfs):
+                np.testing.assert_array_equal(cf1.weights,cf2.weights)
+        self.assertEqual([(e.time,e.conn.name) for e in s1.events if hasattr(e,'conn')],
+                         [(e.time,e.conn.name) for e in s2.events if hasattr(e,'conn')])
+
+    def _run(self,s):
+        s.run(1.5)
+        s.state_push()
+        s.run(0.5)
+        s.state_pop()
+        s.run(1.52)
+
+    def test_partitioned_run(self):
+        # (each Simulation resets the time on creation)
+        s1 = _model()
+        self._run(s1)
+
+        s2 = _model()
+        transport = SharedMemoryTransport()
+        s2.partition({'LGNOn':0,'LGNOff':1,'V1':[0,1,2]},transport)
+        self.assertEqual(s2.process_threads,3)
+        self._run(s2)
+        s2.unpartition()
+        self.assertEqual(s2.process_threads,0)
+        self.assertEqual(glob.glob(transport._prefix+'*'),[])
+
+        assert s1['V1'].activity.any()
+        self._compare(s1,s2)
+
+
+    def test_only_projection_sheets(self):
+        s = _model()
+        self.assertRaises(ValueError,s.partition,{'Retina':0})
+
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
@@ -0,0 +1,96 @@
+"""
+Unit tests for per-component profiling of a Simulation.
+"""
+
+import unittest
+import csv
+import json
+import pickle
+from StringIO import StringIO
+
+import numpy as np
+
+from topo.base.simulation import Simulation
+from topo.base.cf import CFSheet, CFProjection
+from topo.base.ep import PulseGenerator, SumUnit
+
+
+def _model():
+    import imagen
+    from topo.sheet import GeneratorSheet
+    from topo.base.boundingregion import BoundingBox
+
+    s = Simulation(register=False)
+    b = BoundingBox(radius=0.5)
+    s['Retina'] = GeneratorSheet(nominal_density=10,nominal_bounds=b,period=1.0,
+                                 input_generator=imagen.Gaussian(x=0.1,size=0.3))
+    s['V1'] = CFSheet(nominal_density=10,nominal_bounds=b,output_fns=[abs])
+    s.connect('Retina','V1',name='Afferent',delay=0.05,connection_type=CFProjection)
+    return s
+
+
+class TestProfiling(unittest.TestCase):
+
+    def test_statistics(self):
+        s = _model()
+        s.start_profiling()
+        s.run(2.5)
+        stats = s._profile.stats
+        # generated at 0.05, 1.05 and 2.05
+        self.assertEqual(stats[('EventProcessor','V1','process_current_time')][0],3)
+        self.assertEqual(stats[('Projection','V1.Afferent','activate')][0],3)
+        self.assertEqual(stats[('OutputFn','V1.output_fns[0]','builtin_function_or_method')][0],3)
+        self.assertEqual(stats[('Event','EPConnectionEvent','deliver')][0],3)
+        self.assertEqual(stats[('Simulation',s.name,'run')][0],1)
+        assert stats[('EventProcessor','V1','process_current_time')][1] > 0
+
+        rows = s._profile.rows()
+        self.assertEqual(rows[0]['operation'],'run')
+        self.assertEqual(rows[0]['percent_of_run'],100.0)
+        self.assertRaises(ValueError,pickle.dumps,s)
+
+        s.stop_profiling()
+        for name in ['input_event','process_current_time']:
+            assert name not in s['V1'].__dict__
+        assert 'activate' not in s['V1'].Afferent.__dict__
+        self.assertEqual(s['V1'].output_fns,[abs])
+        # not counted after stopping
+        s.run(1)
+        self.assertEqual(stats[('EventProcessor','V1','process_current_time')][0],3)
+
+
+    def test_same_results(self):
+        # (each Simulation resets the time on creation)
+        s1 = _model()
+        s1.run(3)
+        s2 = _model()
+        s2.start_profiling()
+        s2.run(3)
+        np.testing.assert_array_equal(s1['V1'].activity,s2['V1'].activity)
+        assert s1['V1'].activity.any()
+
+
+    def test_report_formats(self):
+        s = Simulation(register=False)
+        s['pulse'] = PulseGenerator(period=1)
+        s['sum'] = SumUnit()
+        s.connect('pulse','sum',delay=0.5)
+        s.start_profiling()
+        s.run(3)
+        s.stop_profiling()
+
+        rows = json.loads(s._profile.report('json'))
+        self.assertEqual(sorted((r['operation'],r['calls']) for r in rows if r['name']=='sum'),
+                         [('input_event',3),('process_current_time',3)])
+        csv_rows = list(csv.DictReader(StringIO(s._profile.report('csv'))))
+        self.assertEqual([(r['name'],r['operation'],int(r['calls'])) for r in csv_rows],
+                         [(r['name'],r['operation'],r['calls']) for r in rows])
+        text = s._profile.report('text')
+        self.assertEqual(len(text.splitlines()),len(rows)+1)
+        self.assertRaises(ValueError,s._profile.report,'xml')
+
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
@@ -734,6 +734,52 @@ class ExtraSheetTests(unittest.TestCase):
         s.release_sheet_view('Activity')
         self.assertEqual(len([v for v in s.views.Maps.values() if v is  not None]),0)
 
+
+@istest
+class ZeroCopyOutputTests(unittest.TestCase):
+
+    def setUp(self):
+        from imagen import Gaussian
+        from topo.base.simulation import Simulation, EventProcessor
+        from topo.base.generatorsheet import GeneratorSheet
+
+        class Receiver(EventProcessor):
+            dest_ports=None
+            def input_event(self,conn,data):
+                self.data = data
+
+        self.sim = Simulation(register=False)
+        self.sim['G'] = GeneratorSheet(nominal_density=4,period=1.0,
+                                       input_generator=Gaussian(),
+                                       zero_copy_output=True)
+        self.sim['R1'] = Receiver()
+        self.sim['R2'] = Receiver()
+        self.sim.connect('G','R1',src_port='Activity',delay=0.05)
+        self.sim.connect('G','R2',src_port='Activity',delay=0.05)
+
+    def test_receivers_share_snapshot(self):
+        G,R1,R2 = self.sim['G'],self.sim['R1'],self.sim['R2']
+        self.sim.run(0.5)
+        assert R1.data is not R2.data
+        assert R1.data.base is R2.data.base
+        self.assertTrue(np.array_equal(R1.data,G.activity))
+        # the snapshot must not follow later changes to the activity
+        G.activity += 1
+        self.assertFalse(np.array_equal(R1.data,G.activity))
+
+    def test_snapshot_is_read_only(self):
+        self.sim.run(0.5)
+        def write():
+            self.sim['R1'].data[0,0] = 5
+        self.assertRaises(ValueError,write)
+
+    def test_buffers_are_recycled(self):
+        G = self.sim['G']
+        self.sim.run(10)
+        # one buffer held by the receivers, one being filled
+        self.assertEqual(len(G._output_buffers),2)
+
+
 if __name__ == "__main__":
 	import nose
 	nose.runmodule()
@@ -145,6 +145,201 @@ class TestSimulation(unittest.TestCase):
         assert s.events[4] == e2a
 
 
+    def test_event_queue_fifo(self):
+        s = Simulation()
+
+        # enqueue out of time order, with many simultaneous events
+        evs = [Event(t) for t in [3,1,2,1,3,0,2,1,3,0]]
+        for e in evs:
+            s.enqueue_event(e)
+
+        expected = sorted(evs,key=lambda e: e.time) # stable sort
+        delivered = s.events
+        self.assertEqual(len(delivered),len(evs))
+        for e,f in zip(delivered,expected):
+            assert e is f
+
+        s.event_push()
+        s.event_clear(event_type=Event)
+        self.assertEqual(len(s.events),0)
+        s.event_pop()
+        self.assertEqual([e.time for e in s.events],[e.time for e in expected])
+
+
+    def test_process_current_time_dispatch(self):
+        class CountingUnit(SumUnit):
+            def __init__(self,**params):
+                super(CountingUnit,self).__init__(**params)
+                self.n_processed = 0
+            def process_current_time(self):
+                self.n_processed += 1
+                super(CountingUnit,self).process_current_time()
+
+        class AlwaysCountingUnit(CountingUnit):
+            always_process_current_time = True
+
+        s = Simulation(register=False)
+        s['pulse'] = PulseGenerator(period=1)
+        s['fast'] = CountingUnit()
+        s['slow'] = CountingUnit()
+        s['always'] = AlwaysCountingUnit()
+        s.connect('pulse','fast',delay=0.5)
+        s.connect('fast','slow',delay=3)
+        s.run(10)
+
+        # pulses at 0..10 reach fast at 0.5..9.5
+        self.assertEqual(s['fast'].n_processed,10)
+        # fast's output at 0.5..9.5 reaches slow at 3.5..9.5
+        self.assertEqual(s['slow'].n_processed,7)
+        # but always is called at every time with an event (0,0.5,...,10)
+        self.assertEqual(s['always'].n_processed,21)
+
+
+    def _on_off_model(self,process_threads):
+        import imagen
+        from topo.sheet import GeneratorSheet
+        from topo.base.boundingregion import BoundingBox
+
+        s = Simulation(register=False,process_threads=process_threads)
+        b = BoundingBox(radius=0.5)
+        s['Retina'] = GeneratorSheet(nominal_density=10,nominal_bounds=b,period=1.0,
+                                     input_generator=imagen.Gaussian(x=0.1,size=0.3))
+        for name in ['LGNOn','LGNOff','V1']:
+            s[name] = CFSheet(nominal_density=10,nominal_bounds=b)
+        s.connect('Retina','LGNOn',delay=0.05,connection_type=CFProjection)
+        s.connect('Retina','LGNOff',delay=0.05,connection_type=CFProjection,strength=0.5)
+        s.connect('LGNOn','V1',delay=0.05,connection_type=CFProjection)
+        s.connect('LGNOff','V1',delay=0.05,connection_type=CFProjection)
+        s.connect('V1','V1',delay=0.05,connection_type=CFProjection,strength=0.1)
+        return s
+
+
+    def test_concurrent_process_current_time(self):
+        # (each Simulation resets the time on creation)
+        serial = self._on_off_model(0)
+        serial.run(2.02)
+        threaded = self._on_off_model(3)
+        threaded.run(2.02)
+
+        for name in ['LGNOn','LGNOff','V1']:
+            np.testing.assert_array_equal(serial[name].activity,threaded[name].activity)
+        assert serial['V1'].activity.any()
+        # events are enqueued in the same order
+        def describe(e):
+            return e.time,e.conn.name if hasattr(e,'conn') else type(e)
+        self.assertEqual(map(describe,serial.events),map(describe,threaded.events))
+        self.assertEqual(serial._event_counter,threaded._event_counter)
+
+
+    def _assert_same_state(self,s1,s2):
+        for name in ['LGNOn','LGNOff','V1']:
+            np.testing.assert_array_equal(s1[name].activity,s2[name].activity)
+        def describe(e):
+            return e.time,e.conn.name if hasattr(e,'conn') else type(e)
+        self.assertEqual(map(describe,s1.events),map(describe,s2.events))
+        self.assertEqual(s1._event_counter,s2._event_counter)
+        self.assertEqual(s1.time(),s2.time())
+
+
+    def test_compiled_schedule(self):
+        engine = self._on_off_model(0)
+        engine.run(5.02)
+        compiled = self._on_off_model(0)
+        compiled.compile_schedule()
+        # (the first periods differ, while activity builds up in V1)
+        compiled.run(3.5)
+        assert compiled._schedule.active
+        compiled.run(1.52)
+        assert compiled._schedule.active
+        self._assert_same_state(engine,compiled)
+        assert engine['V1'].activity.any()
+        # the pending events are saved, but not the schedule
+        assert '_schedule' not in compiled.__getstate__()
+
+
+    def test_compiled_schedule_fallback(self):
+        def run(s):
+            s.run(1.5)
+            s.schedule_command(2.5,'pass')
+            s.run(1.5)
+            s.state_push()
+            s.run(0.5)
+            s.state_pop()
+            [c for c in s.connections() if c.name=='LGNOnToV1'][0].delay = 0.1
+            s.run(5)
+
+        engine = self._on_off_model(0)
+        run(engine)
+        compiled = self._on_off_model(0)
+        compiled.compile_schedule()
+        run(compiled)
+        # a new plan has been recorded for the new delay
+        assert compiled._schedule.active
+        self._assert_same_state(engine,compiled)
+
+
+    def test_compiled_schedule_without_period(self):
+        def pulse_model(compiled):
+            s = Simulation(register=False)
+            s['pulse'] = PulseGenerator(period=1)
+            s['sum'] = SumUnit()
+            s.connect('pulse','sum',delay=0.5)
+            if compiled:
+                # no PeriodicEventSequence to determine the period
+                s.compile_schedule()
+            s.run(3.2)
+            return s
+        engine,compiled = pulse_model(False),pulse_model(True)
+        self.assertEqual(compiled._schedule,None)
+        self.assertEqual([e.time for e in engine.events],[e.time for e in compiled.events])
+        self.assertEqual(engine._event_counter,compiled._event_counter)
+
+
+    def test_copy_on_write_state(self):
+        def run(s):
+            s.run(1.5)
+            s.state_push()
+            s.run(0.3)
+            s.state_push()
+            s.run(1.0)
+            s.state_pop()
+            s.run(0.2)
+            s.state_pop()
+            s.run(1.52)
+
+        eager = self._on_off_model(0)
+        run(eager)
+        cow = self._on_off_model(0)
+        cow.copy_on_write_state = True
+        run(cow)
+        self._assert_same_state(eager,cow)
+        assert eager['V1'].activity.any()
+
+        # the Retina's state is not saved until it next changes (at 4.05)
+        cow.run(0.1)
+        cow.state_push()
+        retina = cow['Retina']
+        cow.run(0.3)
+        self.assertEqual(cow._deferred_pushes.get(retina),1)
+        self.assertEqual(cow._deferred_pushes.get(cow['V1']),None)
+        self.assertEqual(len(retina._Sheet__saved_activity),0)
+        cow.state_pop()
+        self.assertEqual(cow._deferred_pushes,{})
+        self.assertEqual(len(cow['V1']._Sheet__saved_activity),0)
+
+
+    def test_zero_delay_groups(self):
+        s = Simulation(register=False)
+        for name in 'ABCDE':
+            s[name] = SumUnit()
+        s.connect('A','B',delay=0)
+        s.connect('C','B',delay=0)
+        s.connect('D','E',delay=1)
+        eps = [s[name] for name in 'EDCBA']
+        self.assertEqual(s._zero_delay_groups(eps),
+                         [[s['E']],[s['D']],[s['C'],s['B'],s['A']]])
+
+
     def test_get_objects(self):
         s = Simulation()
 
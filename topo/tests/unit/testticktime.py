@@ -0,0 +1,140 @@
+"""
+Unit tests for TickTime and its use as the simulation time type.
+"""
+
+import unittest
+import pickle
+from fractions import Fraction
+
+import param
+import topo
+from topo.base.ticktime import TickTime, lcm_resolution
+from topo.misc.ticktime import use_tick_time
+from topo.base.simulation import Simulation, Event
+from topo.base.ep import PulseGenerator, SumUnit
+
+
+class TestTickTime(unittest.TestCase):
+
+    def setUp(self):
+        self.resolution = TickTime.resolution
+        TickTime.resolution = 1000
+
+    def tearDown(self):
+        TickTime.resolution = self.resolution
+
+    def test_exact_conversion(self):
+        self.assertEqual(TickTime(0.05).ticks,50)
+        self.assertEqual(TickTime('1/20').ticks,50)
+        self.assertEqual(TickTime(Fraction(1,20)).ticks,50)
+        self.assertEqual(TickTime(3).ticks,3000)
+        self.assertEqual(TickTime(TickTime(0.05)).ticks,50)
+        self.assertRaises(ValueError,TickTime,0.0001)
+        self.assertRaises(ValueError,TickTime,'1/3')
+
+    def test_mpq_conversion(self):
+        try:
+            from gmpy import mpq
+        except ImportError:
+            return
+        self.assertEqual(TickTime(mpq(1,20)).ticks,50)
+        t = TickTime(mpq(7,4))
+        self.assertEqual(mpq(t.numer(),t.denom()),mpq(7,4))
+
+    def test_arithmetic(self):
+        t = TickTime(0.3)-TickTime(0.1)
+        self.assertEqual(t,TickTime('0.2'))
+        self.assertEqual(t.ticks,200)
+        self.assertEqual(TickTime(1)+0.05,TickTime('1.05'))
+        self.assertEqual(0.05+TickTime(1),TickTime('1.05'))
+        self.assertEqual(2-TickTime(0.5),TickTime(1.5))
+        self.assertEqual(TickTime(0.5)*3,TickTime(1.5))
+        self.assertEqual(TickTime(1.5)/TickTime(0.5),3)
+        self.assertEqual(TickTime(2.25)%1,TickTime(0.25))
+        self.assertEqual(float(TickTime('0.05')),0.05)
+        self.assertEqual(int(TickTime('2.5')),2)
+
+    def test_comparison(self):
+        self.assertTrue(TickTime(1) < TickTime(1.001))
+        self.assertTrue(TickTime(1) == 1)
+        self.assertTrue(TickTime(1) == 1.0)
+        self.assertTrue(TickTime(0.05) < 0.051)
+        self.assertTrue(TickTime(1) != 2)
+        self.assertTrue(TickTime(10**6) < param.Infinity())
+        self.assertFalse(TickTime(1) == param.Infinity())
+        self.assertEqual(hash(TickTime(2)),hash(2))
+
+    def test_repr_and_pickle(self):
+        t = TickTime('0.125')
+        self.assertEqual(eval(repr(t)),t)
+        self.assertEqual(pickle.loads(pickle.dumps(t,2)),t)
+        # pickles store the value, not the ticks
+        s = pickle.dumps(t,2)
+        TickTime.resolution = 8000
+        self.assertEqual(pickle.loads(s).ticks,1000)
+
+    def test_lcm_resolution(self):
+        self.assertEqual(lcm_resolution([0.05,'1/3',1]),60)
+        self.assertEqual(lcm_resolution([1,2]),1)
+
+
+
+class TestTickTimeSimulation(unittest.TestCase):
+
+    def setUp(self):
+        self.resolution = TickTime.resolution
+        self.time_type = param.Dynamic.time_fn.time_type
+        self.time = param.Dynamic.time_fn()
+        param.Dynamic.time_fn(TickTime(self.time),time_type=TickTime)
+
+    def tearDown(self):
+        TickTime.resolution = self.resolution
+        param.Dynamic.time_fn(self.time_type(self.time),time_type=self.time_type)
+
+    def test_run(self):
+        s = Simulation(register=False)
+        s['pulse'] = PulseGenerator(period=0.25)
+        s['sum'] = SumUnit()
+        s.connect('pulse','sum',delay=0.05)
+        s.run(2)
+        self.assertEqual(s.time(),2)
+        self.assertTrue(isinstance(s.time(),TickTime))
+        for e in s.events:
+            self.assertTrue(isinstance(e.time,TickTime))
+
+    def test_event_order(self):
+        s = Simulation(register=False)
+        e1,e2,e3 = Event(TickTime(0.2)),Event(TickTime(0.1)),Event(TickTime(0.2))
+        for e in (e1,e2,e3):
+            s.enqueue_event(e)
+        self.assertEqual([e for e in s.events],[e2,e1,e3])
+        assert s.events[1] is e1 and s.events[2] is e3
+
+        # times of other types are ordered by their values
+        e4,e5 = Event(0.15),Event(Fraction(3,10))
+        s.enqueue_event(e4)
+        s.enqueue_event(e5)
+        self.assertEqual(s.events,[e2,e4,e1,e3,e5])
+
+    def test_use_tick_time(self):
+        TickTime.resolution = 1000
+        events = topo.sim.events
+        topo.sim.events = []
+        param.Dynamic.time_fn(TickTime(1),time_type=TickTime)
+        now = topo.sim.time()
+        event = Event(now+TickTime('0.25'))
+        topo.sim.enqueue_event(event)
+        try:
+            # existing TickTimes keep their values
+            use_tick_time(resolution=20)
+            self.assertEqual(topo.sim.time(),now)
+            self.assertEqual(event.time,now+Fraction(1,4))
+            self.assertEqual(event.time.ticks,topo.sim.time().ticks+5)
+            self.assertEqual(topo.sim.events[-1],event)
+
+            # nothing changes if a time cannot be represented
+            self.assertRaises(ValueError,use_tick_time,resolution=3)
+            self.assertEqual(TickTime.resolution,20)
+            self.assertEqual(event.time,now+Fraction(1,4))
+        finally:
+            topo.sim.events = events
@@ -14,8 +14,11 @@ Utility functions used by the test files.
 #    representable numbers between two floating point values.
 
 
+import numpy
 from numpy.testing import assert_array_equal,assert_array_almost_equal
 
+from topo.base.functionfamily import TransferFn
+
 def assert_array_not_equal(a1,a2,msg=""):
     try:
         assert_array_equal(a1,a2)
@@ -58,6 +61,51 @@ def new_simulation(name=None,register=True):
     return sim
 
 
+class Clip(TransferFn):
+    """Clip the activity to the range [0,1]."""
+    def __call__(self,x):
+        numpy.clip(x,0.0,1.0,out=x)
+
+
+def gaussian_input_simulation(duration=3,sheet_type=None,sheet_params={},
+                              projections=[('Afferent',{})],**projection_params):
+    """
+    Return a new (unregistered) Simulation, run for the given
+    duration, in which a GeneratorSheet 'In' presenting an
+    off-centre Gaussian is connected to a sheet 'V1' by a
+    CFProjection 'Afferent' with Gaussian weights.
+
+    'V1' is a CFSheet with clipped activity, unless sheet_type and
+    sheet_params say otherwise.  projection_params override the
+    default parameters of the projection; to have more than one
+    projection, give a (name,params) pair for each in projections,
+    the params overriding projection_params.
+    """
+    import imagen
+    from topo.base.simulation import Simulation
+    from topo.base.cf import CFSheet,CFProjection
+    from topo.sheet import GeneratorSheet
+    from topo.base.boundingregion import BoundingBox
+
+    s = Simulation(register=False)
+    b = BoundingBox(radius=0.5)
+    s['In'] = GeneratorSheet(nominal_density=10,nominal_bounds=b,period=1.0,
+                             input_generator=imagen.Gaussian(x=0.1,y=-0.2,size=0.3))
+    params = dict(nominal_density=10,nominal_bounds=b,output_fns=[Clip()])
+    params.update(sheet_params)
+    s['V1'] = (sheet_type or CFSheet)(**params)
+    for name,params in projections:
+        p = dict(delay=0.05,connection_type=CFProjection,
+                 nominal_bounds_template=BoundingBox(radius=0.3),
+                 weights_generator=imagen.Gaussian(aspect_ratio=0.5,size=0.2),
+                 learning_rate=0.1)
+        p.update(projection_params)
+        p.update(params)
+        s.connect('In','V1',name=name,**p)
+    s.run(duration)
+    return s
+
+
 
 class Series(object):
     """
@@ -10,9 +10,10 @@ import param
 from topo.base.cf import CFPOutputFn
 from topo.base.functionfamily import TransferFn, IdentityTF
 from topo.misc.inlinec import inline,provide_unoptimized_equivalent,\
-     c_header,c_decorators
+     c_header,c_decorators,weight_c_header,weight_support_code,c_weights
 
 from topo.transferfn import DivisiveNormalizeL1
+from topo.misc.autotune import AutotunedFn,weights_reset,all_weights
 
 
 # For backwards compatibility when loading pickled files; can be deleted
@@ -37,53 +38,115 @@ class CFPOF_DivisiveNormalizeL1_opt(CFPOutputFn):
     def __call__(self, iterator, **params):
         cf_type=iterator.cf_type  # pyflakes:ignore (passed to weave C code)
         cfs = iterator.flatcfs  # pyflakes:ignore (passed to weave C code)
-        num_cfs = len(iterator.flatcfs)  # pyflakes:ignore (passed to weave C code)
+        slices = iterator.slices  # pyflakes:ignore (passed to weave C code)
 
-        # CB: for performance, it is better to process the masks in
-        # the C code (rather than combining them before).
-        active_units_mask = iterator.get_active_units_mask()  # pyflakes:ignore (passed to weave C code)
-        sheet_mask = iterator.get_sheet_mask()  # pyflakes:ignore (passed to weave C code)
+        # Only the units to be normalized (when skipping inactive
+        # units, the index array shared by all the sheet's
+        # projections while learning)
+        indices = iterator.indices()
+        num_indices = len(indices)  # pyflakes:ignore (passed to weave C code)
 
-        code = c_header + """
+        if iterator.packed is not None:
+            self._packed_normalize(iterator.packed,indices)
+            return
+
+        code = c_header + weight_c_header(iterator.weight_dtype) + """
 
             DECLARE_SLOT_OFFSET(weights,cf_type);
-            DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
             DECLARE_SLOT_OFFSET(_norm_total,cf_type);
             DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
             DECLARE_SLOT_OFFSET(mask,cf_type);
 
             %(cfs_loop_pragma)s
-            for (int r=0; r<num_cfs; ++r) {
-                if (active_units_mask[r] != 0 && sheet_mask[r] != 0) {
-                    PyObject *cf = PyList_GetItem(cfs,r);
+            for (int k=0; k<num_indices; ++k) {
+                int r = indices[k];
+                PyObject *cf = PyList_GetItem(cfs,r);
+
+                LOOKUP_FROM_SLOT_OFFSET(weight_t,weights,cf);
+                int *input_sheet_slice = slices+4*r;
+                LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
+                LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
+
+                UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
+
+                // if normalized total is not available, sum the weights
+                if (_has_norm_total[0] == 0) {
+                    SUM_NORM_TOTAL(cf,weights,_norm_total,rr1,rr2,cc1,cc2);
+                }
+
+                // normalize the weights
+                double factor = 1.0/_norm_total[0];
+                int rc = (rr2-rr1)*(cc2-cc1);
+                for (int i=0; i<rc; ++i) {
+                    *weights = DOUBLE_TO_WEIGHT(WEIGHT_TO_DOUBLE(*weights)*factor);
+                    ++weights;
+                }
+
+                // Indicate that norm_total is stale
+                _has_norm_total[0]=0;
+            }
+        """%c_decorators
+        inline(code, ['indices','num_indices','cfs','cf_type','slices'],
+               local_dict=locals(),
+               headers=['<structmember.h>'],
+               support_code=weight_support_code)
 
-                    LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
-                    LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
-                    LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
-                    LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
 
-                    UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
+    def _packed_normalize(self,packed,indices):
+        """
+        Same as __call__, but working directly on the PackedWeights
+        storage of all the CFs.
+        """
+        weights = c_weights(packed.weights)  # pyflakes:ignore (passed to weave C code)
+        masks = packed.masks  # pyflakes:ignore (passed to weave C code)
+        mask_offsets = packed.mask_offsets  # pyflakes:ignore (passed to weave C code)
+        mask_rowstrides = packed.mask_rowstrides  # pyflakes:ignore (passed to weave C code)
+        offsets = packed.offsets  # pyflakes:ignore (passed to weave C code)
+        shapes = packed.shapes  # pyflakes:ignore (passed to weave C code)
+        norm_total = packed.norm_total  # pyflakes:ignore (passed to weave C code)
+        has_norm_total = packed.has_norm_total  # pyflakes:ignore (passed to weave C code)
+        num_indices = len(indices)  # pyflakes:ignore (passed to weave C code)
+
+        code = c_header + weight_c_header(packed.weights.dtype) + """
+            %(cfs_loop_pragma)s
+            for (int k=0; k<num_indices; ++k) {
+                int r = indices[k];
+                // (a null CF has no weights, so is left alone)
+                int rc = offsets[r+1]-offsets[r];
+                if (rc > 0) {
+                    weight_t *wi = weights+offsets[r];
 
                     // if normalized total is not available, sum the weights
-                    if (_has_norm_total[0] == 0) {
-                        SUM_NORM_TOTAL(cf,weights,_norm_total,rr1,rr2,cc1,cc2);
+                    if (has_norm_total[r] == 0) {
+                        int rows = shapes[2*r], cols = shapes[2*r+1];
+                        double total = 0.0;
+                        for (int i=0; i<rows; ++i) {
+                            float *mi = masks+mask_offsets[r]+i*mask_rowstrides[r];
+                            weight_t *wij = wi+i*cols;
+                            for (int j=0; j<cols; ++j) {
+                                if (mi[j] >= MASK_THRESHOLD) {
+                                    total += fabs(WEIGHT_TO_DOUBLE(wij[j]));
+                                }
+                            }
+                        }
+                        norm_total[r] = total;
                     }
 
                     // normalize the weights
-                    double factor = 1.0/_norm_total[0];
-                    int rc = (rr2-rr1)*(cc2-cc1);
+                    double factor = 1.0/norm_total[r];
                     for (int i=0; i<rc; ++i) {
-                        *(weights++) *= factor;
+                        wi[i] = DOUBLE_TO_WEIGHT(WEIGHT_TO_DOUBLE(wi[i])*factor);
                     }
 
                     // Indicate that norm_total is stale
-                    _has_norm_total[0]=0;
+                    has_norm_total[r]=0;
                 }
             }
         """%c_decorators
-        inline(code, ['sheet_mask','active_units_mask','cfs','cf_type','num_cfs'],
-               local_dict=locals(),
-               headers=['<structmember.h>'])
+        inline(code, ['indices','num_indices','weights','masks','mask_offsets',
+                      'mask_rowstrides','offsets','shapes','norm_total',
+                      'has_norm_total'],
+               local_dict=locals(), support_code=weight_support_code)
 
 
 class CFPOF_DivisiveNormalizeL1(CFPOutputFn):
@@ -116,7 +179,39 @@ class CFPOF_DivisiveNormalizeL1(CFPOutputFn):
                 del cf.norm_total
 
 
-provide_unoptimized_equivalent("CFPOF_DivisiveNormalizeL1_opt","CFPOF_DivisiveNormalizeL1",locals())
+provide_unoptimized_equivalent("CFPOF_DivisiveNormalizeL1_opt","CFPOF_DivisiveNormalizeL1",locals(),
+                               "CFPOF_DivisiveNormalizeL1_cython")
+
+
+class CFPOF_Autotuned(CFPOutputFn,AutotunedFn):
+    """
+    Divisive L1 normalization of the weights that uses whichever of
+    its candidates is fastest for each projection.
+
+    The first time it is called for a projection, each candidate
+    normalizes the same weights, and the fastest one giving the same
+    weights as the first candidate is used from then on for
+    projections of that geometry (see topo.misc.autotune).
+    """
+
+    single_cf_fn = param.ClassSelector(
+        TransferFn,default=DivisiveNormalizeL1(norm_value=1.0),readonly=True)
+
+    candidates = param.List(default=[CFPOF_DivisiveNormalizeL1_opt(),CFPOF_DivisiveNormalizeL1()],
+                            class_=CFPOutputFn,doc="""
+        Equivalent output functions to choose from; the first one is
+        the reference for the normalized weights.""")
+
+    cython_candidates = param.List(default=['CFPOF_DivisiveNormalizeL1_cython'],class_=str,doc="""
+        Names of topo.optimized output functions to add to the
+        candidates (if they exist).""")
+
+    def __call__(self, iterator, **params):
+        proj = iterator.proj
+        fn = self._chosen('weights_output_fn',proj,lambda fn: fn(iterator),
+                          lambda: all_weights(proj),weights_reset(proj))
+        fn(iterator)
+
 
 
 __all__ = list(set([k for k,v in locals().items() if isinstance(v,type) and